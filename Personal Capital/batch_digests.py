@@ -0,0 +1,314 @@
+#!/usr/bin/env python3
+"""
+Batch Digest Runner
+Runs the Net Worth and IBKR digest pipelines over many export directories
+in one process, so pandas/numpy are imported once for the whole batch.
+
+Each export directory holds the same files as docs/ ("Net Worth.csv",
+"IKBR Portfolio - Inception to Date.csv", "IKBR Portfolio - Transaction
+History.csv"). Digests are written to <output-root>/<directory name>/ and
+a manifest.json with per-job status and timings is written to the output
+root. Each job's progress output is kept apart from the other jobs' and
+printed as one block when the job completes.
+"""
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+import argparse
+import contextlib
+import contextvars
+import glob
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+import process_ibkr_digests
+import process_net_worth
+from digest_history import DEFAULT_HISTORY_DB
+from digest_output import COLUMNAR_FORMATS, columnar_support_error
+from parse_cache import DEFAULT_CACHE_DIR
+from pipeline_metrics import StageMetrics, sidecar_path
+
+class JobOutput:
+    """Stand-in for sys.stdout that gives every capturing job its own buffer.
+    
+    contextlib.redirect_stdout alone swaps the stream for the whole process,
+    so concurrent jobs would still share it. The buffer lives in a context
+    variable, so it follows a job into the pipelines' own worker threads
+    (they submit work in a copy of the caller's context). Code outside a
+    capture writes through to the original stream.
+    """
+    
+    def __init__(self, stream):
+        self.stream = stream
+        self._buffer = contextvars.ContextVar('job_output', default=None)
+        self._lock = threading.Lock()
+    
+    def target(self):
+        return self._buffer.get() or self.stream
+    
+    def write(self, text):
+        return self.target().write(text)
+    
+    def flush(self):
+        self.target().flush()
+    
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+    
+    @contextlib.contextmanager
+    def capture(self):
+        """Collect the output of the block (and the work it submits) in a buffer."""
+        
+        buffer = io.StringIO()
+        token = self._buffer.set(buffer)
+        try:
+            yield buffer
+        finally:
+            self._buffer.reset(token)
+    
+    def emit(self, title, text):
+        """Print a job's collected output as one block under ``title``."""
+        
+        with self._lock:
+            self.stream.write(f"--- {title} ---\n{text}")
+            if text and not text.endswith('\n'):
+                self.stream.write('\n')
+            self.stream.flush()
+
+def expand_export_dirs(patterns):
+    """Expand directory paths and glob patterns into a sorted, de-duplicated list."""
+    
+    export_dirs = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern) or [pattern]
+        export_dirs.update(os.path.normpath(path) for path in matches if os.path.isdir(path))
+    return sorted(export_dirs)
+
+def portfolio_name(export_dir):
+    """Name a portfolio after its export directory (or its parent for a docs/ folder)."""
+    
+    path = os.path.abspath(export_dir)
+    name = os.path.basename(path)
+    if name == 'docs':
+        name = os.path.basename(os.path.dirname(path))
+    return name
+
+def plan_jobs(export_dirs, output_root):
+    """Build a net worth job and an IBKR job for each export directory.
+    
+    Directories with the same portfolio name get the first free numeric
+    suffix, so every portfolio has its own output directory.
+    """
+    
+    jobs = []
+    used_names = set()
+    
+    for export_dir in export_dirs:
+        name = portfolio_name(export_dir)
+        suffix = 0
+        while name in used_names:
+            suffix += 1
+            name = f"{portfolio_name(export_dir)}-{suffix}"
+        used_names.add(name)
+        output_dir = os.path.join(output_root, name)
+        
+        net_worth_file = os.path.join(export_dir, os.path.basename(process_net_worth.INPUT_FILE))
+        jobs.append({
+            'portfolio': name,
+            'pipeline': 'net_worth',
+            'inputs': [net_worth_file],
+            'output_dir': output_dir,
+        })
+        
+        jobs.append({
+            'portfolio': name,
+            'pipeline': 'ibkr',
+            'inputs': [
+                os.path.join(export_dir, os.path.basename(process_ibkr_digests.PORTFOLIO_FILE)),
+                os.path.join(export_dir, os.path.basename(process_ibkr_digests.TRANSACTION_FILE)),
+            ],
+            'output_dir': output_dir,
+        })
+    
+    return jobs
+
+def run_job(job, incremental=False, jobs_per_portfolio=1, cache_dir=None, formats=(), history_db=None,
+            compact=False, chunk_rows=None, fx_rate_file=None, project_paths=None,
+            milestones=process_net_worth.DEFAULT_MILESTONE):
+    """Run one pipeline job and return its manifest entry.
+    
+    Per-stage metrics are written as a sidecar next to the job's digests.
+    With ``project_paths`` net worth jobs also write the Monte Carlo
+    projection digest. ``milestones`` is the net worth milestone step or
+    ladder (see process_net_worth.milestone_tiers).
+    """
+    
+    entry = dict(job)
+    missing = [path for path in job['inputs'] if not os.path.exists(path)]
+    if missing:
+        entry.update(status='skipped', seconds=0.0, error=f"missing input: {', '.join(missing)}")
+        return entry
+    
+    os.makedirs(job['output_dir'], exist_ok=True)
+    metrics = StageMetrics(job['pipeline'])
+    start = time.perf_counter()
+    
+    try:
+        if job['pipeline'] == 'net_worth':
+            output_file = os.path.join(job['output_dir'], os.path.basename(process_net_worth.OUTPUT_FILE))
+            metrics_file = sidecar_path(output_file, '.metrics.json')
+            written = None
+            if incremental and os.path.exists(output_file):
+                with metrics.stage('incremental_update') as record:
+                    written = process_net_worth.update_digest_incremental(
+                        job['inputs'][0], output_file, milestones, formats=formats, history_db=history_db,
+                        portfolio=job['portfolio'], compact=compact,
+                    )
+                    record['rows_out'] = written
+            if written is None:
+                written = len(process_net_worth.build_digest(
+                    job['inputs'][0], output_file, milestones, metrics=metrics, formats=formats, history_db=history_db,
+                    portfolio=job['portfolio'], compact=compact,
+                ))
+            entry['rows'] = {os.path.basename(output_file): written}
+            if project_paths:
+                projection = process_net_worth.build_projection(
+                    process_net_worth.read_digest(output_file), output_file, paths=project_paths,
+                    milestones=milestones, metrics=metrics, formats=formats,
+                )
+                entry['rows'][process_net_worth.PROJECTION_FILE] = len(projection)
+        else:
+            metrics_file = os.path.join(job['output_dir'], process_ibkr_digests.METRICS_BASENAME + '.metrics.json')
+            digests = process_ibkr_digests.generate_digests(
+                *job['inputs'], output_dir=job['output_dir'], jobs=jobs_per_portfolio, cache_dir=cache_dir,
+                metrics=metrics, formats=formats, history_db=history_db, portfolio=job['portfolio'], compact=compact,
+                chunk_rows=chunk_rows, fx_rate_file=fx_rate_file,
+            )
+            file_names = {key: file_name for key, file_name, *_ in process_ibkr_digests.DIGEST_FILES}
+            entry['rows'] = {file_names[key]: len(df) for key, df in digests.items()}
+        entry['status'] = 'ok'
+    except Exception as e:
+        entry.update(status='error', error=f"{type(e).__name__}: {e}")
+    
+    entry['seconds'] = round(time.perf_counter() - start, 4)
+    metrics.write(metrics_file, status=entry['status'], input_files=job['inputs'], compact=compact)
+    entry['metrics'] = metrics_file
+    return entry
+
+def run_batch(export_dirs, output_root, workers=1, incremental=False, jobs_per_portfolio=1, cache_dir=None,
+              formats=(), history_db=None, compact=False, chunk_rows=None, fx_rate_file=None, project_paths=None,
+              milestones=process_net_worth.DEFAULT_MILESTONE):
+    """Run every job on a worker pool and write the combined manifest.
+    
+    Each job's progress output is printed as one block when it completes
+    and kept in its manifest entry's ``output``.
+    
+    With ``compact`` every job holds its frames in compact dtypes, sharing
+    one symbol dictionary across the batch. ``chunk_rows`` streams every
+    transaction history in chunks of that many rows. ``fx_rate_file``
+    supplements every IBKR job's FX rates, and ``project_paths`` adds a
+    net worth projection over that many paths to every net worth job.
+    ``milestones`` applies to every net worth job.
+    """
+    
+    jobs = plan_jobs(export_dirs, output_root)
+    start = time.perf_counter()
+    output = JobOutput(sys.stdout)
+    
+    def run(job):
+        with output.capture() as buffer:
+            entry = run_job(job, incremental, jobs_per_portfolio, cache_dir, formats, history_db, compact,
+                            chunk_rows, fx_rate_file, project_paths, milestones)
+        entry['output'] = buffer.getvalue()
+        output.emit(f"{job['portfolio']} {job['pipeline']}", entry['output'])
+        return entry
+    
+    with contextlib.redirect_stdout(output), ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        entries = list(pool.map(run, jobs))
+    
+    manifest = {
+        'generated': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'workers': workers,
+        'total_seconds': round(time.perf_counter() - start, 4),
+        'jobs': entries,
+    }
+    
+    os.makedirs(output_root, exist_ok=True)
+    with open(os.path.join(output_root, 'manifest.json'), 'w') as f:
+        json.dump(manifest, f, indent=2)
+    
+    return manifest
+
+def main(argv=None):
+    """Main processing function."""
+    
+    parser = argparse.ArgumentParser(description="Run the digest pipelines over many export directories.")
+    parser.add_argument('export_dirs', nargs='+', help="export directories or glob patterns")
+    parser.add_argument('--output-root', default='batch_output',
+                        help="root directory for per-portfolio outputs and manifest.json (default: %(default)s)")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1,
+                        help="number of jobs run concurrently (default: CPU count)")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="threads per IBKR job for parsing and digest building (default: %(default)s)")
+    parser.add_argument('--incremental', action='store_true',
+                        help="update existing net worth digests incrementally")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="parse cache directory shared by all jobs (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="always re-parse the IBKR exports")
+    parser.add_argument('--formats', nargs='+', choices=list(COLUMNAR_FORMATS), default=[],
+                        help="also write each digest as Parquet and/or Feather (requires pyarrow)")
+    parser.add_argument('--history-db', nargs='?', const=DEFAULT_HISTORY_DB,
+                        help="also store every run in a SQLite history database, keyed by portfolio "
+                             f"(default path: {DEFAULT_HISTORY_DB})")
+    parser.add_argument('--compact', action='store_true',
+                        help="hold intermediate frames in compact dtypes with one symbol dictionary for the batch")
+    parser.add_argument('--chunk-rows', type=int, nargs='?', const=process_ibkr_digests.TRANSACTION_CHUNK_ROWS,
+                        help="stream transaction histories in chunks of this many rows to bound memory "
+                             f"(default chunk: {process_ibkr_digests.TRANSACTION_CHUNK_ROWS})")
+    parser.add_argument('--fx-rates', metavar='FILE',
+                        help="CSV of Date, Currency, Rate (CAD per unit) adding FX rate history for every job")
+    parser.add_argument('--project', type=int, nargs='?', const=process_net_worth.PROJECTION_PATHS, metavar='PATHS',
+                        help="also project every net worth digest over this many Monte Carlo paths "
+                             f"(default: {process_net_worth.PROJECTION_PATHS:,})")
+    parser.add_argument('--milestones', type=float, nargs='+', default=[process_net_worth.DEFAULT_MILESTONE],
+                        metavar='CAD', help="net worth milestone step or ladder of levels (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    format_error = columnar_support_error(args.formats)
+    if format_error:
+        print(f"Error: {format_error}")
+        return 1
+    
+    if args.fx_rates and not os.path.exists(args.fx_rates):
+        print(f"Error: FX rate file '{args.fx_rates}' not found")
+        return 1
+    
+    export_dirs = expand_export_dirs(args.export_dirs)
+    if not export_dirs:
+        print("Error: No export directories matched")
+        return 1
+    
+    print(f"Processing {len(export_dirs)} export directories with {args.workers} workers...")
+    manifest = run_batch(
+        export_dirs, args.output_root, workers=args.workers, incremental=args.incremental,
+        jobs_per_portfolio=args.jobs, cache_dir=None if args.no_cache else args.cache_dir, formats=args.formats,
+        history_db=args.history_db, compact=args.compact, chunk_rows=args.chunk_rows,
+        fx_rate_file=args.fx_rates, project_paths=args.project,
+        milestones=process_net_worth.milestone_option(args.milestones),
+    )
+    
+    print("\n=== BATCH SUMMARY ===")
+    for entry in manifest['jobs']:
+        detail = entry.get('error', '')
+        print(f"{entry['portfolio']:<24} {entry['pipeline']:<10} {entry['status']:<8} {entry['seconds']:>8.2f}s {detail}")
+    print(f"Total: {manifest['total_seconds']:.2f}s")
+    print(f"Manifest written to '{os.path.join(args.output_root, 'manifest.json')}'")
+    
+    return 1 if any(entry['status'] == 'error' for entry in manifest['jobs']) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,541 @@
+#!/usr/bin/env python3
+"""
+Digest Pipeline Benchmarks
+Generates synthetic Net Worth sheets, IBKR PortfolioAnalyst reports and
+transaction histories at multiples of the real export size, times every
+pipeline stage, and compares result files so regressions show up before
+deploy.
+
+Usage:
+    python bench_digests.py run --scales 1 10 100 --output bench_results.json
+    python bench_digests.py compare baseline.json bench_results.json
+"""
+
+from datetime import datetime
+import argparse
+import contextlib
+import csv
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from fast_startup import lazy_import
+
+import process_ibkr_digests
+import process_net_worth
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+# Shape of the real export set at scale 1; accounts, positions,
+# transactions and filler rows are multiplied by the scale
+BASE_SHAPE = {
+    'years': 10,
+    'accounts': 15,
+    'positions': 25,
+    'transactions': 1900,
+    'filler_rows': 10000,
+}
+
+# Asset labels cycled through so every net worth category is represented
+ASSET_LABELS = [
+    ('', 'line of credit'), ('', 'Savings account'), ('', 'Margin (U{n})'),
+    ('', 'TFSA (U{n})'), ('', 'RRSP (U{n})'), ('IKBR {n}', ''), ('', 'Phantom Wallet {n}'),
+    ('', 'Blue Wallet {n}'), ('Cryptocurrency {n}', ''), ('Manulife RPP {n}', ''),
+    ('Wealthsimple FHSA {n}', ''), ('', 'Private holding {n}'),
+]
+
+SECTORS = ['Technology', 'Financials', 'Energy', 'Consumer Cyclicals', 'Telecomm', 'Broad', 'Healthcare']
+
+TRANSACTION_TYPES = [
+    ('Buy', 'Bought {symbol}'), ('Sell', 'Sold {symbol}'), ('Dividend', '{symbol} Cash Dividend'),
+    ('Deposit', 'Electronic Fund Transfer (Regular Contribution)'), ('Withdrawal', 'Withdrawal to bank'),
+    ('Interest', 'Credit Interest'), ('Other Fee', 'Market data fee'),
+    ('Foreign Tax Withholding', '{symbol} withholding tax'), ('Adjustment', 'FX Translations P&L'),
+]
+
+MONTH_ABBRS = ['Jan', 'Feb', 'Mar', 'Apr', 'May', 'Jun', 'Jul', 'Aug', 'Sep', 'Oct', 'Nov', 'Dec']
+
+def scaled_shape(scale, years=None):
+    """Return the synthetic data shape for a size multiple of the real exports."""
+    
+    shape = {key: int(round(value * scale)) for key, value in BASE_SHAPE.items() if key != 'years'}
+    shape['years'] = years or BASE_SHAPE['years']
+    return shape
+
+def month_starts(years, end=None):
+    """Monthly period starts covering ``years`` up to ``end`` (default: this month)."""
+    
+    end = end or pd.Timestamp.today().normalize().replace(day=1)
+    return pd.date_range(end=end, periods=years * 12, freq='MS')
+
+def format_amount(value):
+    """Format a value the way the Net Worth sheet does: '1,234' and '(76)' for negatives."""
+    
+    if value < 0:
+        return f"({-value:,.0f})"
+    return f"{value:,.0f}"
+
+def generate_net_worth_csv(path, years, accounts, seed=0):
+    """Write a Net Worth sheet with ``accounts`` asset rows over ``years`` of months."""
+    
+    rng = np.random.default_rng(seed)
+    months = month_starts(years)
+    n_months = len(months)
+    
+    # Random-walk balances per account; some accounts open late ('-' before)
+    growth = rng.normal(0.01, 0.05, size=(accounts, n_months))
+    balances = rng.uniform(1000, 100000, size=(accounts, 1)) * np.exp(np.cumsum(growth, axis=1))
+    opened = rng.integers(0, n_months // 2 + 1, size=accounts)
+    
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['', ' ', ''] + [str(i + 1) for i in range(n_months)])
+        writer.writerow(['', '$', ''] + [f"{MONTH_ABBRS[m.month - 1]}//{m.year % 100:02d}" for m in months])
+        writer.writerow([''] * (n_months + 3))
+        writer.writerow(['', 'Accounts', ''] + [''] * n_months)
+        
+        for i in range(accounts):
+            asset, description = ASSET_LABELS[i % len(ASSET_LABELS)]
+            values = [
+                '-' if month < opened[i] else format_amount(balances[i, month])
+                for month in range(n_months)
+            ]
+            writer.writerow([str(i + 1), asset.format(n=i), description.format(n=i)] + values)
+        
+        writer.writerow([''] * (n_months + 3))
+        writer.writerow(['', 'Net Worth', ''] + [format_amount(v) for v in balances.sum(axis=0)])
+
+def generate_ibkr_report(path, years, positions, filler_rows, seed=0):
+    """Write a PortfolioAnalyst report with the sections the digests read, where
+    about ``filler_rows`` rows are the large Concentration and ESG sections."""
+    
+    rng = np.random.default_rng(seed)
+    months = month_starts(years)
+    symbols = [f"SYM{i}" for i in range(positions)]
+    
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        
+        first, last = months[0], months[-1] + pd.offsets.MonthEnd(0)
+        analysis_period = f"{first:%B} {first.day}, {first.year} to {last:%B} {last.day}, {last.year} (Monthly)"
+        writer.writerow(['Introduction', 'Header', 'Name', 'Account', 'BaseCurrency', 'AnalysisPeriod'])
+        writer.writerow(['Introduction', 'Data', 'Synthetic', 'Benchmark', 'CAD', analysis_period])
+        
+        ending_nav = positions * 15000.0
+        writer.writerow(['Key Statistics', 'MetaInfo', 'Analysis Period', 'Synthetic'])
+        writer.writerow(['Key Statistics', 'Header', 'BeginningNAV', 'EndingNAV', 'CumulativeReturn'])
+        writer.writerow(['Key Statistics', 'Data', 0, ending_nav, 120.5])
+        
+        # Accounts and their dated deposits and withdrawals (about one per account every 3 months)
+        accounts = [f"U{1000000 + i}" for i in range(max(3, positions // 8))]
+        writer.writerow(['Breakdown of Accounts', 'Header', 'Account', 'Name', 'Beginning NAV', 'Ending NAV',
+                         'Return'])
+        for account in accounts:
+            writer.writerow(['Breakdown of Accounts', 'Data', account, 'Synthetic', 0,
+                             round(ending_nav / len(accounts), 6), round(float(rng.normal(80, 40)), 6)])
+        n_flows = len(months) * len(accounts) // 3
+        flow_dates = first + pd.to_timedelta(np.sort(rng.integers(0, (last - first).days + 1, size=n_flows)), 'D')
+        flow_amounts = np.where(rng.random(n_flows) < 0.85, 1, -1) * rng.uniform(500, 10000, size=n_flows)
+        writer.writerow(['Deposits And Withdrawals', 'Header', 'Date', 'Account', 'Type', 'Description', 'Amount'])
+        for date, account, amount in zip(flow_dates, rng.integers(0, len(accounts), size=n_flows), flow_amounts):
+            writer.writerow(['Deposits And Withdrawals', 'Data', date.strftime('%m/%d/%y'), accounts[account],
+                             'DEPOSIT' if amount > 0 else 'WITHDRAWAL', 'Electronic Fund Transfer',
+                             round(amount, 2)])
+        
+        section = 'Historical Performance Benchmark Comparison'
+        writer.writerow([section, 'MetaInfo', 'Analysis Period', 'Synthetic'])
+        periods = ['MTD', 'QTD', 'YTD', '1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception']
+        writer.writerow([section, 'Header', 'Account'] + periods)
+        for account in ['SPXTR', 'EFA', 'VT', 'Consolidated']:
+            writer.writerow([section, 'Data', account] + list(rng.normal(10, 20, size=len(periods)).round(6)))
+        
+        writer.writerow([section, 'Header', 'Month', 'BM1', 'BM1Return', 'BM2', 'BM2Return',
+                         'BM3', 'BM3Return', 'Account', 'AccountReturn'])
+        bench = rng.normal(0.8, 4, size=len(months))
+        portfolio = 1.3 * bench + rng.normal(0.1, 3, size=len(months))
+        for month, b, p in zip(months, bench, portfolio):
+            writer.writerow([section, 'Data', month.strftime('%Y%m'), 'SPXTR', round(b, 6), 'EFA', '-',
+                             'VT', '-', 'Consolidated', round(p, 6)])
+        
+        writer.writerow(['Open Position Summary', 'MetaInfo', 'As Of', 'Synthetic'])
+        writer.writerow(['Open Position Summary', 'Header', 'Date', 'FinancialInstrument', 'Currency', 'Symbol',
+                         'Description', 'Sector', 'Quantity', 'ClosePrice', 'Value', 'Cost Basis',
+                         'UnrealizedP&L', 'FXRateToBase'])
+        as_of = months[-1].strftime('%m/%d/%Y')
+        for i, symbol in enumerate(symbols):
+            currency = 'CAD' if i % 4 == 0 else 'USD'
+            fx_rate = 1 if currency == 'CAD' else 1.37
+            quantity = int(rng.integers(1, 500))
+            price = round(float(rng.uniform(5, 900)), 2)
+            value = quantity * price
+            cost = value * float(rng.uniform(0.5, 1.5))
+            writer.writerow(['Open Position Summary', 'Data', as_of, 'Stocks', currency, symbol,
+                             f"{symbol} HOLDINGS, INC", SECTORS[i % len(SECTORS)], quantity, price,
+                             round(value, 4), round(cost, 6), round(value - cost, 6), fx_rate])
+        writer.writerow(['Open Position Summary', 'Data', 'Total', 'Stocks', 'CAD', '', '', '', '', '',
+                         ending_nav, ending_nav, 0])
+        writer.writerow(['Open Position Summary', 'Data', as_of, 'Cash', 'CAD', 'CAD', 'Canadian Dollar',
+                         'Cash', 1250.5, 1, 1250.5, ' ', ' ', 1])
+        
+        # Monthly allocation and contribution by instrument class
+        instruments = ['ETFs', 'Stocks', 'Cash']
+        values = rng.uniform(0.1, 1, size=(len(months), len(instruments))) * ending_nav / 2
+        writer.writerow(['Allocation by Financial Instrument', 'Header', 'Date'] + instruments + ['NAV'])
+        for month, row in zip(months, values):
+            writer.writerow(['Allocation by Financial Instrument', 'Data', month.strftime('%Y%m')]
+                            + list(row.round(6)) + [round(row.sum(), 6)])
+        growth = np.cumsum(rng.normal(0.01, 0.04, size=len(months)))
+        nav = ending_nav * np.exp(growth - growth[-1])
+        writer.writerow(['Allocation by Asset Class', 'Header', 'Date', 'Equities', 'Cash', 'NAV'])
+        for month, value in zip(months, nav):
+            writer.writerow(['Allocation by Asset Class', 'Data', month.strftime('%Y%m'), round(value * 0.95, 6),
+                             round(value * 0.05, 6), round(value, 6)])
+        writer.writerow(['Performance by Financial Instrument', 'Header', 'Date'] + instruments)
+        for month, row in zip(months, rng.normal(0.3, 2, size=(len(months), len(instruments)))):
+            writer.writerow(['Performance by Financial Instrument', 'Data', month.strftime('%Y%m')]
+                            + list(row.round(6)))
+        
+        # Period performance for every symbol plus per-instrument and overall totals
+        writer.writerow(['Performance by Symbol', 'Header', 'Symbol', 'Description', 'FinancialInstrument',
+                         'Sector', 'AvgWeight', 'Return', 'Contribution', 'Unrealized_P&L', 'Realized_P&L', 'Open'])
+        for i, symbol in enumerate(symbols):
+            writer.writerow(['Performance by Symbol', 'Data', symbol, f"{symbol} HOLDINGS, INC",
+                             instruments[i % 2], SECTORS[i % len(SECTORS)], round(float(rng.uniform(0, 20)), 6),
+                             round(float(rng.normal(10, 40)), 6), round(float(rng.normal(0.5, 2)), 6),
+                             round(float(rng.normal(0, 5000)), 2), round(float(rng.normal(0, 5000)), 2), 'Yes'])
+        for instrument in instruments:
+            writer.writerow(['Performance by Symbol', 'Data', f"Total {instrument}", '', '', '',
+                             round(float(rng.uniform(0, 60)), 6), round(float(rng.normal(10, 40)), 6),
+                             round(float(rng.normal(5, 10)), 6), 0, 0, ''])
+        writer.writerow(['Performance by Symbol', 'Data', 'Total', '', '', '', 100, 120.5, 120.5, 0, 0, ''])
+        
+        # Quarterly dividends from two in three symbols, monthly interest per account and the forward projection
+        payers = [(symbol, quantity) for symbol, quantity in zip(symbols, rng.integers(1, 500, size=len(symbols)))
+                  if int(symbol[3:]) % 3 != 2]
+        writer.writerow(['Dividends', 'MetaInfo', 'Analysis Period', 'Synthetic'])
+        writer.writerow(['Dividends', 'Header', 'PayDate', 'Ex-Date', 'Account', 'Symbol', 'Note', 'Quantity',
+                         'DividendPerShare', 'Amount'])
+        for month in months[2::3]:
+            for symbol, quantity in payers:
+                per_share = round(float(rng.uniform(0.05, 2)), 2)
+                writer.writerow(['Dividends', 'Data', (month + pd.Timedelta(days=14)).strftime('%Y%m%d'),
+                                 month.strftime('%Y%m%d'), accounts[int(rng.integers(0, len(accounts)))], symbol,
+                                 'Dividend Payment', quantity, per_share, round(quantity * per_share, 6)])
+        writer.writerow(['Interest Details', 'MetaInfo', 'Analysis Period', 'Synthetic'])
+        writer.writerow(['Interest Details', 'Header', 'Date', 'Account', 'Description', 'Amount'])
+        for month in months:
+            for account in accounts:
+                writer.writerow(['Interest Details', 'Data', (month + pd.Timedelta(days=4)).strftime('%Y%m%d'),
+                                 account, f"CAD Credit Interest Received for {month:%B %Y}",
+                                 round(float(rng.uniform(0, 50)), 6)])
+        writer.writerow(['Projected Income', 'MetaInfo', 'As Of', 'Synthetic'])
+        writer.writerow(['Projected Income', 'Header', 'Financial Instrument', 'Symbol', 'Description', 'Frequency',
+                         'Quantity', 'Price', 'Value', 'Current Yield %', 'Principal', 'Estimated Annual Income',
+                         f"Estimated {last.year} Remaining Income"])
+        total_value = total_annual = 0.0
+        for symbol, quantity in payers:
+            price = round(float(rng.uniform(5, 900)), 2)
+            annual = quantity * float(rng.uniform(0.2, 8))
+            total_value += quantity * price
+            total_annual += annual
+            writer.writerow(['Projected Income', 'Data', 'Stocks', symbol, 'Ordinary Dividend', 4, quantity, price,
+                             round(quantity * price, 6), round(annual / (quantity * price) * 100, 6), '-',
+                             round(annual, 6), round(annual / 2, 6)])
+        writer.writerow(['Projected Income', 'Data', '', 'Total', '', '', '', '', round(total_value, 6),
+                         round(total_annual / max(total_value, 1) * 100, 6), '', round(total_annual, 6),
+                         round(total_annual / 2, 6)])
+        
+        # Look-through exposure: every issuer row is followed by the holdings it comes through
+        writer.writerow(['Concentration', 'MetaInfo', 'As Of', 'Synthetic'])
+        writer.writerow(['Concentration', 'Header', 'SubSection', 'Symbol', 'Description', 'Sector', 'LongValue',
+                         'ShortValue', 'NetValue', 'LongParsedWeight', 'ShortParsedWeight', 'NetParsedWeight'])
+        issuers = filler_rows * 7 // 30
+        for i in range(issuers):
+            direct = round(float(rng.uniform(0, 5000)), 6) if i % 3 == 0 else 0.0
+            via_fund = round(float(rng.uniform(0, 5000)), 6)
+            value = direct + via_fund
+            weight = round(value / ending_nav * 100, 6)
+            writer.writerow(['Concentration', 'Data', 'Holdings', f"ISSUER{i}", f"ISSUER {i} CORP",
+                             SECTORS[i % len(SECTORS)], value, 0, value, weight, 0, weight])
+            writer.writerow(['Concentration', 'Data', 'Holdings', "    Self", f"ISSUER {i} CORP",
+                             SECTORS[i % len(SECTORS)], direct, 0, direct, '', '',
+                             round(direct / ending_nav * 100, 6)])
+            writer.writerow(['Concentration', 'Data', 'Holdings', f"    ETF{i % 3}", f"SYNTHETIC ETF {i % 3}",
+                             'Broad', via_fund, 0, via_fund, '', '', round(via_fund / ending_nav * 100, 6)])
+        writer.writerow(['Concentration', 'Header', 'SubSection', 'Region', 'LongWeight', 'LongParsedWeight',
+                         '+/-', 'ShortWeight', 'ShortParsedWeight', '+/-'])
+        for region, weight in [('North America', 70), ('Europe', 20), ('Asia', 10)]:
+            writer.writerow(['Concentration', 'Data', 'Region Allocation', region, weight, weight, 0, 0, 0, 0])
+        
+        writer.writerow(['ESG', 'MetaInfo', 'As Of', 'Synthetic'])
+        writer.writerow(['ESG', 'Header', 'SubSection', 'Symbol', 'Description', 'Weight (%)', 'ESG',
+                         'Controversies', 'Combined', 'Environmental', 'Social', 'Governance'])
+        for i in range(filler_rows - issuers * 3 - 3):
+            scores = rng.integers(1, 10, size=6)
+            writer.writerow(['ESG', 'Data', 'HoldingsAnalysis', f"ISSUER{i}", f"ISSUER {i} CORP",
+                             round(float(rng.uniform(0, 2)), 6)] + list(scores))
+
+def generate_transactions_csv(path, years, accounts, transactions, seed=0):
+    """Write a transaction history with ``transactions`` rows across ``accounts`` accounts."""
+    
+    rng = np.random.default_rng(seed)
+    months = month_starts(years)
+    start, end = months[0], months[-1] + pd.offsets.MonthEnd(1)
+    days = rng.integers(0, (end - start).days + 1, size=transactions)
+    dates = (start + pd.to_timedelta(np.sort(days)[::-1], unit='D')).strftime('%Y-%m-%d')
+    
+    account_names = ['TFSA', 'RRSP', 'Margin'] + [f"Account {i}" for i in range(max(0, accounts - 3))]
+    account_idx = rng.integers(0, len(account_names), size=transactions)
+    type_idx = rng.integers(0, len(TRANSACTION_TYPES), size=transactions)
+    amounts = rng.normal(0, 2500, size=transactions)
+    
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['Date', 'Account', 'Description', 'Transaction Type', 'Symbol', 'Quantity',
+                         'Price', 'Gross Amount', 'Commission', 'Net Amount'])
+        for date, a, t, amount in zip(dates, account_idx, type_idx, amounts):
+            transaction_type, description = TRANSACTION_TYPES[t]
+            symbol = f"SYM{t * 7 % 40}"
+            writer.writerow([date, account_names[a], description.format(symbol=symbol),
+                             transaction_type, symbol, '-', '-', f"{amount:,.2f}", '-', f"{amount:,.2f}"])
+
+def generate_export_set(directory, shape, seed=0):
+    """Write all three synthetic inputs into ``directory`` using the docs/ file names."""
+    
+    paths = {
+        'net_worth': os.path.join(directory, os.path.basename(process_net_worth.INPUT_FILE)),
+        'portfolio': os.path.join(directory, os.path.basename(process_ibkr_digests.PORTFOLIO_FILE)),
+        'transactions': os.path.join(directory, os.path.basename(process_ibkr_digests.TRANSACTION_FILE)),
+    }
+    generate_net_worth_csv(paths['net_worth'], shape['years'], shape['accounts'], seed)
+    generate_ibkr_report(paths['portfolio'], shape['years'], shape['positions'], shape['filler_rows'], seed)
+    generate_transactions_csv(paths['transactions'], shape['years'], shape['accounts'], shape['transactions'], seed)
+    return paths
+
+def pipeline_stages(paths):
+    """Yield (name, callable, input rows) for each pipeline function, in pipeline order.
+    
+    Each callable's inputs are produced by the previous stages, outside the
+    timed call.
+    """
+    
+    state = {}
+    
+    def stage(name, func, rows_of, store=None):
+        # rows_of receives the stage's result and returns its input size
+        def run():
+            result = func()
+            if store:
+                state[store] = result
+            return result
+        return name, run, rows_of
+    
+    def line_count(path):
+        with open(path, 'rb') as f:
+            return sum(1 for _ in f)
+    
+    yield stage('load_and_process_csv', lambda: process_net_worth.load_and_process_csv(paths['net_worth']),
+                lambda raw: len(raw), 'raw')
+    yield stage('aggregate_by_month_category', lambda: process_net_worth.aggregate_by_month_category(state['raw']),
+                lambda _: len(state['raw']), 'monthly')
+    yield stage('calculate_derived_metrics', lambda: process_net_worth.calculate_derived_metrics(state['monthly']),
+                lambda _: len(state['monthly']), 'derived')
+    yield stage('project_net_worth',
+                lambda: process_net_worth.project_net_worth(
+                    state['derived']['date'], state['derived']['totalNW'],
+                    milestones=process_net_worth.projection_milestones(state['derived']['totalNW'].iloc[-1])),
+                lambda _: len(state['derived']))
+    yield stage('parse_ibkr_csv (all sections)', lambda: process_ibkr_digests.parse_ibkr_csv(paths['portfolio']),
+                lambda _: line_count(paths['portfolio']))
+    yield stage('parse_ibkr_csv (digest sections)',
+                lambda: process_ibkr_digests.parse_ibkr_csv(paths['portfolio'], process_ibkr_digests.DIGEST_SECTIONS),
+                lambda _: line_count(paths['portfolio']), 'sections')
+    yield stage('create_performance_digest', lambda: process_ibkr_digests.create_performance_digest(state['sections']),
+                lambda _: sum(len(t) for t in state['sections'].get('Historical Performance Benchmark Comparison', [])))
+    yield stage('period_returns', lambda: process_ibkr_digests.period_returns(state['sections']),
+                lambda _: len(process_ibkr_digests.section_table(state['sections'], 'Deposits And Withdrawals')))
+    yield stage('monthly_return_series', lambda: process_ibkr_digests.monthly_return_series(state['sections']),
+                lambda _: sum(len(t) for t in state['sections'].get('Historical Performance Benchmark Comparison', [])),
+                'monthly')
+    yield stage('create_rolling_risk_digest',
+                lambda: process_ibkr_digests.create_rolling_risk_digest(state['monthly']),
+                lambda _: len(state['monthly']))
+    yield stage('create_symbol_digest',
+                lambda: process_ibkr_digests.create_symbol_digest(state['sections'], state['monthly']),
+                lambda _: len(process_ibkr_digests.section_table(state['sections'], 'Performance by Symbol')))
+    yield stage('create_exposure_digest', lambda: process_ibkr_digests.create_exposure_digest(state['sections']),
+                lambda _: sum(len(t) for name in ('Concentration', 'ESG') for t in state['sections'].get(name, [])))
+    yield stage('fx_rate_table', lambda: process_ibkr_digests.fx_rate_table(state['sections']),
+                lambda _: len(process_ibkr_digests.section_table(state['sections'], 'Open Position Summary')), 'fx')
+    yield stage('build_positions_frame',
+                lambda: process_ibkr_digests.build_positions_frame(state['sections'], state['fx']),
+                lambda _: len(process_ibkr_digests.section_table(state['sections'], 'Open Position Summary')),
+                'positions')
+    yield stage('create_allocation_digest', lambda: process_ibkr_digests.create_allocation_digest(state['positions']),
+                lambda _: len(state['positions']))
+    yield stage('create_position_digest', lambda: process_ibkr_digests.create_position_digest(state['positions']),
+                lambda _: len(state['positions']))
+    yield stage('income_history', lambda: process_ibkr_digests.income_history(state['sections']),
+                lambda _: sum(len(process_ibkr_digests.section_table(state['sections'], name))
+                              for name in ('Dividends', 'Interest Details')), 'income')
+    yield stage('dividend_yields',
+                lambda: process_ibkr_digests.dividend_yields(
+                    state['income'], state['positions'], process_ibkr_digests.analysis_period(state['sections'])[1]),
+                lambda _: len(state['income']), 'yields')
+    yield stage('create_income_digest',
+                lambda: process_ibkr_digests.create_income_digest(state['sections'], state['positions'],
+                                                                  state['income'], state['yields']),
+                lambda _: len(state['income']))
+    yield stage('load_transactions', lambda: process_ibkr_digests.load_transactions(paths['transactions']),
+                lambda transactions: len(transactions), 'transactions')
+    yield stage('stream_transaction_sums',
+                lambda: process_ibkr_digests.stream_transaction_sums(paths['transactions']),
+                lambda _: line_count(paths['transactions']) - 1)
+    yield stage('create_cashflow_digest', lambda: process_ibkr_digests.create_cashflow_digest(state['transactions']),
+                lambda _: len(state['transactions']))
+
+def measure(func, repeat=3):
+    """Return (best wall seconds over ``repeat`` runs, peak traced MB of one run, result).
+    
+    Memory is traced on a separate run so tracemalloc overhead does not skew
+    the timings. Progress output from the pipeline functions is suppressed.
+    """
+    
+    with contextlib.redirect_stdout(io.StringIO()):
+        tracemalloc.start()
+        result = func()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+    
+    return best, peak / (1024 * 1024), result
+
+def run_benchmarks(scales, repeat=3, years=None, seed=0):
+    """Generate inputs for each scale, time every stage and return the results document."""
+    
+    results = []
+    
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            shape = scaled_shape(scale, years)
+            paths = generate_export_set(directory, shape, seed)
+            print(f"\nScale {scale}x: {shape}")
+            
+            for name, func, rows_of in pipeline_stages(paths):
+                seconds, peak_mb, result = measure(func, repeat)
+                rows = rows_of(result)
+                results.append({
+                    'scale': scale,
+                    'function': name,
+                    'seconds': round(seconds, 6),
+                    'peak_mb': round(peak_mb, 3),
+                    'rows': rows,
+                    'rows_per_sec': round(rows / seconds, 1) if seconds > 0 else None,
+                })
+                print(f"  {name:<34} {seconds * 1000:10.2f} ms {peak_mb:10.2f} MB {rows:>10} rows")
+    
+    return {
+        'generated': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'python': platform.python_version(),
+        'pandas': pd.__version__,
+        'numpy': np.__version__,
+        'repeat': repeat,
+        'seed': seed,
+        'results': results,
+    }
+
+# Compared metrics: (results key, unit, True when a higher value is worse)
+COMPARED_METRICS = [
+    ('seconds', 's', True),
+    ('peak_mb', 'MB', True),
+    ('rows_per_sec', 'rows/s', False),
+]
+
+def compare_results(baseline, current, threshold=0.2):
+    """Compare two results documents, metric by metric (see COMPARED_METRICS).
+    
+    Returns rows of (scale, function, metric, base, new, ratio, regressed).
+    The ratio is oriented so that above 1 is worse (new over base for time
+    and memory, base over new for throughput); a metric regresses when its
+    ratio exceeds 1 + ``threshold``.
+    """
+    
+    base_results = {(r['scale'], r['function']): r for r in baseline['results']}
+    rows = []
+    
+    for r in current['results']:
+        key = (r['scale'], r['function'])
+        if key not in base_results:
+            continue
+        for metric, _, higher_is_worse in COMPARED_METRICS:
+            base, new = base_results[key].get(metric), r.get(metric)
+            if base is None or new is None:
+                continue
+            worse, better = (new, base) if higher_is_worse else (base, new)
+            ratio = worse / better if better > 0 else (1.0 if worse == better else float('inf'))
+            rows.append((r['scale'], r['function'], metric, base, new, ratio, ratio > 1 + threshold))
+    
+    return rows
+
+def main(argv=None):
+    """Main processing function."""
+    
+    parser = argparse.ArgumentParser(description="Benchmark the digest pipelines on synthetic exports.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    run_parser = commands.add_parser('run', help="generate synthetic inputs and time every stage")
+    run_parser.add_argument('--scales', type=float, nargs='+', default=[1, 10, 100],
+                            help="size multiples of the real exports (default: 1 10 100)")
+    run_parser.add_argument('--years', type=int, help=f"years of history (default: {BASE_SHAPE['years']})")
+    run_parser.add_argument('--repeat', type=int, default=3, help="timed runs per stage; best is kept")
+    run_parser.add_argument('--seed', type=int, default=0, help="random seed for the generators")
+    run_parser.add_argument('--output', default='bench_results.json', help="results file (default: %(default)s)")
+    
+    compare_parser = commands.add_parser('compare', help="compare two results files")
+    compare_parser.add_argument('baseline')
+    compare_parser.add_argument('current')
+    compare_parser.add_argument('--threshold', type=float, default=0.2,
+                                help="fractional worsening of time, peak memory or throughput reported as a "
+                                     "regression (default: %(default)s)")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'run':
+        document = run_benchmarks(args.scales, args.repeat, args.years, args.seed)
+        with open(args.output, 'w') as f:
+            json.dump(document, f, indent=2)
+        print(f"\nResults written to '{args.output}'")
+        return 0
+    
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+    
+    rows = compare_results(baseline, current, args.threshold)
+    units = {metric: unit for metric, unit, _ in COMPARED_METRICS}
+    for scale, function, metric, base, new, ratio, regressed in rows:
+        flag = f'REGRESSION ({metric})' if regressed else ''
+        unit = units[metric]
+        print(f"{scale:>6}x {function:<34} {metric:<12} {base:12.4f} {unit:<6} -> {new:12.4f} {unit:<6} "
+              f"{ratio:6.2f}x {flag}")
+    
+    regressions = sum(1 for row in rows if row[-1])
+    regressed_metrics = sorted({row[2] for row in rows if row[-1]})
+    print(f"\n{regressions} regression(s) beyond {args.threshold:.0%}"
+          + (f" in {', '.join(regressed_metrics)}" if regressed_metrics else ''))
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
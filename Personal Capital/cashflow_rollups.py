@@ -0,0 +1,124 @@
+#!/usr/bin/env python3
+"""
+Cashflow Rollups
+Cashflow totals per category at every reporting granularity (month,
+quarter, year and all time), per account and across all accounts.
+
+Transactions are binned once into a dense (account x month x category)
+cube with np.bincount. Every coarser level is then a sum over blocks of
+the level below it (3 months to a quarter, 4 quarters to a year, all years
+to the total), and the cross-account rows are one more sum over the
+account axis, so no level rescans the transactions. The per-account
+frames hold one row per account only, so summing one never double
+counts; the cross-account rows of every level form a frame of their own.
+"""
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+# Rollup levels from finest to coarsest: (level, period column, periods of
+# the previous level per period, periods per year). The total level sums
+# every year into a single period.
+ROLLUP_LEVELS = [
+    ('month', 'month', 1, 12),
+    ('quarter', 'quarter', 3, 4),
+    ('year', None, 4, 1),
+    ('total', None, None, None),
+]
+
+# Account label of rows summed across accounts, and the rollups key of the cross-account frame
+ALL_ACCOUNTS = 'All'
+
+# Period columns of the cross-account frame, which holds every level
+PERIOD_COLUMNS = ['year', 'quarter', 'month']
+
+def cashflow_cube(transactions, categories, date='Date', account='accountType', category='category',
+                  amount='Net Amount', count=None):
+    """Bin transactions into per-(account, month, category) sums.
+    
+    The month axis runs from January of the first year to December of the
+    last, so quarters and years are whole blocks of it. Transactions whose
+    category is not in ``categories`` only count towards the transaction
+    counts. Returns the sums (accounts x months x categories), the
+    transaction counts (accounts x months), the sorted account labels and
+    the first year. Transactions without a date or account are skipped.
+    Pre-aggregated rows name the column holding their transaction count in
+    ``count``.
+    """
+    
+    dates = pd.to_datetime(transactions[date])
+    valid = (dates.notna() & transactions[account].notna()).to_numpy()
+    dates = dates[valid]
+    
+    account_codes, accounts = pd.factorize(transactions[account][valid], sort=True)
+    category_codes = pd.Categorical(transactions[category][valid], categories=categories).codes.astype(int)
+    category_codes[category_codes < 0] = len(categories)  # Uncategorized slot, dropped below
+    
+    years = dates.dt.year.to_numpy()
+    first_year = int(years.min()) if len(years) else 0
+    months = (years - first_year) * 12 + dates.dt.month.to_numpy() - 1
+    month_count = (int(months.max()) // 12 + 1) * 12 if len(months) else 12
+    
+    shape = (len(accounts), month_count, len(categories) + 1)
+    cells = np.ravel_multi_index((account_codes, months, category_codes), shape)
+    amounts = transactions[amount][valid].to_numpy(dtype=float)
+    sums = np.bincount(cells, weights=amounts, minlength=np.prod(shape)).reshape(shape)
+    rows = transactions[count][valid].to_numpy(dtype=float) if count else None
+    counts = np.bincount(cells, weights=rows, minlength=np.prod(shape)).reshape(shape).sum(axis=2)
+    
+    return sums[:, :, :len(categories)], counts, [str(label) for label in accounts], first_year
+
+def rollup_frame(sums, counts, accounts, first_year, period, periods_per_year, categories, account):
+    """Rows of one rollup level: every (period, account) with transactions, in period then account order."""
+    
+    labels = np.array(accounts, dtype=object)
+    periods, account_codes = np.nonzero(counts.T)
+    columns = {}
+    if periods_per_year:
+        columns['year'] = first_year + periods // periods_per_year
+        if period:
+            columns[period] = periods % periods_per_year + 1
+    columns[account] = labels[account_codes]
+    
+    values = sums[account_codes, periods]
+    for i, name in enumerate(categories):
+        columns[name] = values[:, i]
+    columns['netCashflow'] = values.sum(axis=1)
+    return pd.DataFrame(columns)
+
+def cashflow_rollups(transactions, categories, account='accountType', **columns):
+    """Cashflow digests for every level in ROLLUP_LEVELS, keyed by level, plus the cross-account rows.
+    
+    Each level's frame has the level's period columns (year, then month or
+    quarter; none for the total), ``account``, one column per category and
+    netCashflow, the sum of the categories, with one row per period and
+    account with transactions in it. The ALL_ACCOUNTS frame sums the
+    accounts: a level column, then PERIOD_COLUMNS (blank where the level
+    has no such period), the categories and netCashflow. ``columns``
+    overrides the other input column names of cashflow_cube.
+    """
+    
+    sums, counts, accounts, first_year = cashflow_cube(transactions, categories, account=account, **columns)
+    
+    rollups = {}
+    totals = []
+    for level, period, factor, periods_per_year in ROLLUP_LEVELS:
+        # Each level sums blocks of the previous one
+        if factor is None:
+            sums, counts = sums.sum(axis=1, keepdims=True), counts.sum(axis=1, keepdims=True)
+        elif factor > 1:
+            blocks = sums.shape[1] // factor
+            sums = sums.reshape(len(accounts), blocks, factor, len(categories)).sum(axis=2)
+            counts = counts.reshape(len(accounts), blocks, factor).sum(axis=2)
+        rollups[level] = rollup_frame(sums, counts, accounts, first_year, period, periods_per_year,
+                                      categories, account)
+        totals.append(rollup_frame(sums.sum(axis=0, keepdims=True), counts.sum(axis=0, keepdims=True),
+                                   [ALL_ACCOUNTS], first_year, period, periods_per_year, categories, account)
+                      .drop(columns=account).assign(level=level))
+    
+    totals = pd.concat(totals, ignore_index=True).reindex(
+        columns=['level'] + PERIOD_COLUMNS + list(categories) + ['netCashflow'])
+    rollups[ALL_ACCOUNTS] = totals.astype({col: 'Int64' for col in PERIOD_COLUMNS})
+    return rollups
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Compact Frames
+Memory-lean dtypes for the pipelines' intermediate frames (--compact).
+The loaders build their frames compact from the start rather than
+converting finished frames, so no stage ever holds an object copy and a
+compact copy of the same frame: repetitive text columns are read or
+assembled as categoricals, derived labels are built from category codes,
+and integer columns get the narrowest type that holds them. Symbol columns
+share one category dictionary across every frame in the process, so a
+batch over many transaction histories keeps a single copy of each ticker.
+
+Float columns stay float64: money amounts rarely fit float32 exactly and
+float32 sums drift, and the digests must be identical with and without
+--compact.
+"""
+
+import threading
+
+from fast_startup import lazy_import
+from pipeline_metrics import frame_memory_mb
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+# Columns encoded with the shared symbol dictionary
+SYMBOL_COLUMNS = ['ticker', 'Symbol', 'issuer']
+
+# Repetitive text columns of the exports, read as categoricals
+CATEGORY_COLUMNS = [
+    'Account', 'Description', 'Type', 'Transaction Type', 'Currency', 'Sector', 'SubSection', 'Note',
+    'FinancialInstrument', 'BM1', 'BM2', 'BM3',
+]
+
+# read_csv dtype hints of compact mode (columns a table lacks are ignored)
+CATEGORY_DTYPES = dict.fromkeys(CATEGORY_COLUMNS + SYMBOL_COLUMNS, 'category')
+
+# Smaller tables are read as is: category overhead outweighs the savings
+MIN_COMPACT_ROWS = 100
+
+class SymbolDictionary:
+    """Category dictionary shared by the symbol columns of every compact frame.
+    
+    New symbols are appended, so the codes of symbols seen earlier never
+    change and frames built at different times stay comparable.
+    """
+    
+    def __init__(self):
+        self.symbols = None  # Created on first use, so importing this module does not load pandas
+        self._lock = threading.Lock()
+    
+    def memory_mb(self):
+        """Deep memory of the dictionary in MB."""
+        
+        if self.symbols is None:
+            return 0.0
+        return round(self.symbols.memory_usage(deep=True) / (1024 * 1024), 3)
+    
+    def encode(self, values):
+        """Return ``values`` as a categorical Series over the dictionary, adding unseen symbols.
+        
+        Categorical input is recoded through its categories, without
+        expanding it to one string per row.
+        """
+        
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            values = values.astype(object).where(values.notna(), None).astype('category')
+        
+        with self._lock:
+            if self.symbols is None:
+                self.symbols = pd.Index([], dtype=object)
+            new = pd.Index(values.cat.categories, dtype=object).difference(self.symbols, sort=False)
+            if len(new):
+                self.symbols = self.symbols.append(new)
+            categories = self.symbols
+        return values.cat.set_categories(categories)
+
+# Dictionary shared by every pipeline in the process
+SHARED_SYMBOLS = SymbolDictionary()
+
+def as_category(values, name=None, symbols=SHARED_SYMBOLS):
+    """Build a label column as a categorical Series; symbol columns use the shared dictionary."""
+    
+    values = pd.Series(values).astype('category')
+    return symbols.encode(values) if name in SYMBOL_COLUMNS else values
+
+def recode(values, mapping, default):
+    """Map a categorical through ``mapping`` (``default`` for unmapped and missing values), staying categorical.
+    
+    Only the categories are looked up, so the cost is one lookup per
+    distinct value rather than per row. Categories come out sorted, so
+    groupings list them in the same order as plain text columns.
+    """
+    
+    labels = pd.Index([mapping.get(category, default) for category in values.cat.categories] + [default])
+    label_codes, uniques = pd.factorize(labels, sort=True)
+    # Missing values have code -1, which takes the trailing default
+    return pd.Series(pd.Categorical.from_codes(label_codes[values.cat.codes.to_numpy()], uniques),
+                     index=values.index, name=values.name)
+
+def fill_labels(values, fill):
+    """``values.fillna(fill)`` that also works for categoricals, adding the fill values as categories."""
+    
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        fill = pd.Series(fill, index=values.index)[values.isna()]
+        values = values.cat.add_categories(pd.Index(fill.dropna().unique()).difference(values.cat.categories))
+    return values.fillna(fill)
+
+def narrow_integers(values, dtype):
+    """Integer column in ``dtype`` (e.g. 'int16' for years), or as is when the values do not fit."""
+    
+    info = np.iinfo(dtype)
+    if len(values) and (values.min() < info.min or values.max() > info.max):
+        return values
+    return values.astype(dtype)
+
+def iter_frames(frames):
+    """Yield the frames in a frame, or in a dict or list of them."""
+    
+    if isinstance(frames, dict):
+        frames = frames.values()
+    elif not isinstance(frames, (list, tuple)):
+        frames = [frames]
+    
+    for item in frames:
+        if isinstance(item, (dict, list, tuple)):
+            yield from iter_frames(item)
+        else:
+            yield item
+
+def share_symbols(frames, symbols=SHARED_SYMBOLS):
+    """Recode the categorical symbol columns of ``frames`` onto the shared dictionary, in place.
+    
+    Frames from the parse cache carry their own categories; recoding goes
+    through the categories, so it costs one pass over the codes.
+    """
+    
+    for df in iter_frames(frames):
+        for col in df.columns.intersection(SYMBOL_COLUMNS):
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                df[col] = symbols.encode(df[col])
+    return frames
+
+def shared_categories_mb(frames, symbols=SHARED_SYMBOLS):
+    """Memory that frame_memory_mb attributes to ``frames`` but belongs to the shared symbol dictionary."""
+    
+    shared = 0
+    for df in iter_frames(frames):
+        for col in df.columns.intersection(SYMBOL_COLUMNS):
+            if isinstance(df[col].dtype, pd.CategoricalDtype):
+                shared += df[col].cat.categories.memory_usage(deep=True)
+    return round(shared / (1024 * 1024), 3)
+
+def record_frame_memory(metrics, name, frames, symbols=SHARED_SYMBOLS):
+    """Add the deep memory of stage ``name``'s output ``frames`` to its metrics record.
+    
+    Called after the stage has finished, so walking every text column
+    does not count toward its timings. The shared symbol dictionary is
+    reported once, in ``symbol_dictionary_mb``, rather than inside every
+    frame using it. Does nothing unless ``metrics`` traces memory.
+    """
+    
+    if not metrics.trace_memory:
+        return
+    
+    for record in reversed(metrics.stages):
+        if record['stage'] == name:
+            record['frame_mb'] = round(frame_memory_mb(frames) - shared_categories_mb(frames, symbols), 3)
+            record['symbol_dictionary_mb'] = symbols.memory_mb()
+            break
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Digest History Store
+Optional SQLite backend that keeps every digest run, so earlier digests can
+be queried instead of being lost when the PF_*.csv files are overwritten.
+
+Each digest gets its own table of rows tagged with a run_id; the runs table
+records when and from which export each run was generated. Storing a digest
+whose content matches the latest stored run for the same digest and
+portfolio records nothing new, and re-storing a run with the same
+generation timestamp replaces it. Rows are indexed on date, ticker,
+accountType and period, whichever the digest has.
+
+Usage:
+    python digest_history.py runs --db digest_history.db
+    python digest_history.py as-of allocation --as-of "2025-06-30" --where ticker=NVDA
+    python digest_history.py range position --start 2025-01-01 --end 2025-12-31
+"""
+
+from datetime import datetime
+import argparse
+import hashlib
+import sqlite3
+import sys
+
+from fast_startup import lazy_import
+
+lazy_import('pandas', 'pd', globals())
+
+DEFAULT_HISTORY_DB = "digest_history.db"
+
+# Columns indexed in every digest table that has them
+INDEX_COLUMNS = ['date', 'ticker', 'accountType', 'period']
+
+# Seconds to wait for another writer (e.g. a parallel batch job) to finish
+LOCK_TIMEOUT_SECONDS = 30
+
+RUNS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id INTEGER PRIMARY KEY AUTOINCREMENT,
+    digest TEXT NOT NULL,
+    portfolio TEXT NOT NULL DEFAULT '',
+    generated TEXT NOT NULL,
+    source_file TEXT,
+    content_hash TEXT NOT NULL,
+    row_count INTEGER NOT NULL,
+    UNIQUE (digest, portfolio, generated)
+);
+CREATE INDEX IF NOT EXISTS idx_runs_lookup ON runs (digest, portfolio, generated);
+"""
+
+def connect(db_path):
+    """Open the history database, creating the runs table if needed."""
+    
+    conn = sqlite3.connect(db_path, timeout=LOCK_TIMEOUT_SECONDS)
+    conn.executescript(RUNS_SCHEMA)
+    return conn
+
+def table_name(digest):
+    """SQLite table holding a digest's rows."""
+    
+    return f"digest_{digest}"
+
+def quote(name):
+    """Quote an identifier (digest columns such as 12m_return_pct need it)."""
+    
+    return '"' + name.replace('"', '""') + '"'
+
+def to_storage(df):
+    """Convert a digest to SQLite-friendly values: ISO date strings, 0/1 booleans."""
+    
+    df = df.copy()
+    for col in df.columns:
+        if pd.api.types.is_datetime64_any_dtype(df[col]):
+            df[col] = df[col].dt.strftime('%Y-%m-%d')
+        elif pd.api.types.is_bool_dtype(df[col]):
+            df[col] = df[col].astype(int)
+    return df
+
+def content_hash(df):
+    """Hash a digest's contents, so unchanged re-runs are not stored twice."""
+    
+    return hashlib.sha256(df.to_csv(index=False).encode()).hexdigest()
+
+def ensure_table(conn, digest, df):
+    """Create the digest table and its indexes, adding any columns new to this run."""
+    
+    table = table_name(digest)
+    existing = [row[1] for row in conn.execute(f"PRAGMA table_info({quote(table)})")]
+    
+    if not existing:
+        columns = ', '.join(quote(col) for col in df.columns)
+        conn.execute(f"CREATE TABLE {quote(table)} (run_id INTEGER NOT NULL REFERENCES runs(run_id), {columns})")
+        existing = ['run_id'] + list(df.columns)
+    else:
+        for col in df.columns:
+            if col not in existing:
+                conn.execute(f"ALTER TABLE {quote(table)} ADD COLUMN {quote(col)}")
+    
+    conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(f'idx_{table}_run_id')} ON {quote(table)} (run_id)")
+    for col in INDEX_COLUMNS:
+        if col in existing:
+            conn.execute(f"CREATE INDEX IF NOT EXISTS {quote(f'idx_{table}_{col}')} ON {quote(table)} ({quote(col)})")
+
+def store_digest(db_path, digest, df, generated=None, source_file=None, portfolio=''):
+    """Store one digest run and return its run_id.
+    
+    When the contents match the latest stored run of the same digest and
+    portfolio, that run's id is returned and nothing is written.
+    """
+    
+    generated = generated or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    stored = to_storage(df)
+    digest_hash = content_hash(stored)
+    table = table_name(digest)
+    
+    conn = connect(db_path)
+    try:
+        with conn:
+            latest = conn.execute(
+                "SELECT run_id, content_hash FROM runs WHERE digest = ? AND portfolio = ? "
+                "ORDER BY generated DESC LIMIT 1",
+                (digest, portfolio),
+            ).fetchone()
+            if latest and latest[1] == digest_hash:
+                return latest[0]
+            
+            ensure_table(conn, digest, stored)
+            
+            # Upsert: a run with the same timestamp is replaced
+            replaced = conn.execute(
+                "SELECT run_id FROM runs WHERE digest = ? AND portfolio = ? AND generated = ?",
+                (digest, portfolio, generated),
+            ).fetchone()
+            if replaced:
+                conn.execute(f"DELETE FROM {quote(table)} WHERE run_id = ?", replaced)
+                conn.execute("DELETE FROM runs WHERE run_id = ?", replaced)
+            
+            run_id = conn.execute(
+                "INSERT INTO runs (digest, portfolio, generated, source_file, content_hash, row_count) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (digest, portfolio, generated, source_file, digest_hash, len(stored)),
+            ).lastrowid
+            
+            columns = ['run_id'] + list(stored.columns)
+            placeholders = ', '.join('?' for _ in columns)
+            rows = stored.astype(object).where(stored.notna(), None).itertuples(index=False, name=None)
+            conn.executemany(
+                f"INSERT INTO {quote(table)} ({', '.join(quote(col) for col in columns)}) VALUES ({placeholders})",
+                ((run_id,) + row for row in rows),
+            )
+        return run_id
+    finally:
+        conn.close()
+
+def store_digests(db_path, digests, generated=None, source_file=None, portfolio=''):
+    """Store several digests from one run; returns {digest: run_id}.
+    
+    ``source_file`` is the input of every digest, or a dict of inputs keyed
+    by digest when they come from different files.
+    """
+    
+    generated = generated or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    sources = source_file if isinstance(source_file, dict) else dict.fromkeys(digests, source_file)
+    return {
+        digest: store_digest(db_path, digest, df, generated, sources.get(digest), portfolio)
+        for digest, df in digests.items()
+    }
+
+def inclusive_end(value):
+    """Make a bare date cover its whole day when compared with run timestamps."""
+    
+    return f"{value} 23:59:59" if len(value) == 10 else value
+
+def where_clause(filters):
+    """SQL conditions and parameters for equality filters; a (low, high) tuple means BETWEEN."""
+    
+    conditions = []
+    params = []
+    for col, value in filters.items():
+        if isinstance(value, tuple):
+            conditions.append(f"d.{quote(col)} BETWEEN ? AND ?")
+            params.extend(value)
+        else:
+            conditions.append(f"d.{quote(col)} = ?")
+            params.append(value)
+    return conditions, params
+
+def read_rows(db_path, digest, conditions, params):
+    """Run a row query against a digest table joined to its run metadata."""
+    
+    sql = (
+        f"SELECT r.generated, d.* FROM {quote(table_name(digest))} d "
+        "JOIN runs r ON r.run_id = d.run_id"
+    )
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY r.generated, d.rowid"
+    
+    conn = connect(db_path)
+    try:
+        df = pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+    
+    if 'date' in df.columns:
+        df['date'] = pd.to_datetime(df['date'])
+    if 'milestone_flag' in df.columns:
+        df['milestone_flag'] = df['milestone_flag'].astype(bool)
+    return df
+
+def list_runs(db_path, digest=None, portfolio=None):
+    """Return stored runs, oldest first."""
+    
+    sql = "SELECT * FROM runs"
+    conditions = []
+    params = []
+    if digest:
+        conditions.append("digest = ?")
+        params.append(digest)
+    if portfolio is not None:
+        conditions.append("portfolio = ?")
+        params.append(portfolio)
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    
+    conn = connect(db_path)
+    try:
+        return pd.read_sql_query(sql + " ORDER BY generated", conn, params=params)
+    finally:
+        conn.close()
+
+def query_as_of(db_path, digest, as_of=None, portfolio='', **filters):
+    """Return the digest as it was last generated on or before ``as_of`` (default: latest).
+    
+    ``filters`` restrict rows by column, e.g. ``ticker='NVDA'`` or
+    ``date=('2024-01-01', '2024-12-31')``.
+    """
+    
+    conn = connect(db_path)
+    try:
+        sql = "SELECT run_id FROM runs WHERE digest = ? AND portfolio = ?"
+        params = [digest, portfolio]
+        if as_of:
+            sql += " AND generated <= ?"
+            params.append(inclusive_end(as_of))
+        run = conn.execute(sql + " ORDER BY generated DESC LIMIT 1", params).fetchone()
+    finally:
+        conn.close()
+    
+    if run is None:
+        return pd.DataFrame()
+    
+    conditions, params = where_clause(filters)
+    return read_rows(db_path, digest, ["d.run_id = ?"] + conditions, [run[0]] + params)
+
+def query_range(db_path, digest, start=None, end=None, portfolio='', **filters):
+    """Return rows from every run generated between ``start`` and ``end``, tagged with ``generated``."""
+    
+    conditions = ["r.digest = ?", "r.portfolio = ?"]
+    params = [digest, portfolio]
+    if start:
+        conditions.append("r.generated >= ?")
+        params.append(start)
+    if end:
+        conditions.append("r.generated <= ?")
+        params.append(inclusive_end(end))
+    
+    filter_conditions, filter_params = where_clause(filters)
+    return read_rows(db_path, digest, conditions + filter_conditions, params + filter_params)
+
+def literal(value):
+    """Convert a command-line filter value to a number when it looks like one."""
+    
+    for convert in (int, float):
+        try:
+            return convert(value)
+        except ValueError:
+            pass
+    return value
+
+def parse_filters(items):
+    """Parse repeated ``column=value`` (or ``column=low..high``) arguments."""
+    
+    filters = {}
+    for item in items or []:
+        col, _, value = item.partition('=')
+        low, sep, high = value.partition('..')
+        filters[col] = (literal(low), literal(high)) if sep else literal(value)
+    return filters
+
+def main(argv=None):
+    """Main processing function."""
+    
+    parser = argparse.ArgumentParser(description="Query the digest history database.")
+    parser.add_argument('--db', default=DEFAULT_HISTORY_DB, help="history database (default: %(default)s)")
+    parser.add_argument('--portfolio', default='',
+                        help="portfolio name used by batch runs ('runs' lists every portfolio when omitted)")
+    commands = parser.add_subparsers(dest='command', required=True)
+    
+    runs_parser = commands.add_parser('runs', help="list stored runs")
+    runs_parser.add_argument('digest', nargs='?')
+    
+    as_of_parser = commands.add_parser('as-of', help="show a digest as of a point in time")
+    as_of_parser.add_argument('digest')
+    as_of_parser.add_argument('--as-of', help="timestamp or date (default: latest run)")
+    as_of_parser.add_argument('--where', action='append', help="column=value or column=low..high")
+    
+    range_parser = commands.add_parser('range', help="show a digest across runs in a time range")
+    range_parser.add_argument('digest')
+    range_parser.add_argument('--start')
+    range_parser.add_argument('--end')
+    range_parser.add_argument('--where', action='append', help="column=value or column=low..high")
+    
+    args = parser.parse_args(argv)
+    
+    if args.command == 'runs':
+        result = list_runs(args.db, args.digest, args.portfolio or None)
+    elif args.command == 'as-of':
+        result = query_as_of(args.db, args.digest, args.as_of, args.portfolio, **parse_filters(args.where))
+    else:
+        result = query_range(args.db, args.digest, args.start, args.end, args.portfolio,
+                             **parse_filters(args.where))
+    
+    if result.empty:
+        print("No matching rows")
+        return 1
+    
+    print(result.to_string(index=False))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
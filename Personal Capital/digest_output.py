@@ -0,0 +1,144 @@
+#!/usr/bin/env python3
+"""
+Digest Output
+Writers for the PF_* digests. Every digest is written as the commented CSV
+the Sheets import expects, and optionally as Parquet and/or Feather files
+next to it for dashboards that reload digests often.
+
+Columnar files carry a consistent schema (datetimes for ``date``, booleans
+for flags, categoricals for low-cardinality labels, floats for numeric
+columns the CSV leaves blank on summary rows) and store the digest
+title and generation timestamp as file metadata instead of a comment line.
+They need pyarrow, which is only imported when a columnar format is used.
+"""
+
+from datetime import datetime
+import json
+import os
+
+from fast_startup import lazy_import
+
+lazy_import('pandas', 'pd', globals())
+
+# Columnar formats and the file extension each one is written with
+COLUMNAR_FORMATS = {
+    'parquet': '.parquet',
+    'feather': '.feather',
+}
+
+# Schema applied to columnar outputs, for whichever columns a digest has
+DATE_COLUMNS = ['date']
+BOOLEAN_COLUMNS = ['milestone_flag']
+CATEGORICAL_COLUMNS = [
+    'accountType', 'category', 'sector', 'country', 'assetClass', 'currency', 'period', 'level', 'financialInstrument',
+]
+
+# Schema metadata key holding the digest title and generation timestamp
+METADATA_KEY = b'pf_digest'
+
+def columnar_support_error(formats):
+    """Return an error message if a requested columnar format cannot be written, else None."""
+    
+    if not any(fmt in COLUMNAR_FORMATS for fmt in formats):
+        return None
+    
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        return "Parquet/Feather output requires pyarrow (pip install pyarrow)"
+    return None
+
+def apply_digest_schema(df):
+    """Return a copy of a digest with columnar dtypes applied."""
+    
+    df = df.copy()
+    
+    for col in DATE_COLUMNS:
+        if col in df.columns:
+            df[col] = pd.to_datetime(df[col])
+    
+    for col in BOOLEAN_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('boolean' if df[col].isna().any() else bool)
+    
+    for col in CATEGORICAL_COLUMNS:
+        if col in df.columns:
+            df[col] = df[col].astype('category')
+    
+    # Numeric columns left blank ('') on summary rows become proper nulls
+    for col in df.columns.difference(CATEGORICAL_COLUMNS, sort=False):
+        if not (pd.api.types.is_object_dtype(df[col]) or pd.api.types.is_string_dtype(df[col])):
+            continue
+        values = df[col].mask(df[col].eq(''))
+        numeric = pd.to_numeric(values, errors='coerce')
+        if numeric.notna().equals(values.notna()):
+            df[col] = numeric
+    
+    return df
+
+def write_csv(df, output_file, title, timestamp):
+    """Write a digest CSV preceded by its generated timestamp comment."""
+    
+    with open(output_file, 'w') as f:
+        f.write(f"# {title} - Generated: {timestamp}\n")
+        df.to_csv(f, index=False)
+
+def write_columnar(df, output_file, fmt, title, timestamp):
+    """Write a digest as Parquet or Feather with its title and timestamp in the schema metadata."""
+    
+    import pyarrow as pa
+    
+    table = pa.Table.from_pandas(apply_digest_schema(df), preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[METADATA_KEY] = json.dumps({'title': title, 'generated': timestamp}).encode()
+    table = table.replace_schema_metadata(metadata)
+    
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        pq.write_table(table, output_file)
+    else:
+        from pyarrow import feather
+        feather.write_feather(table, output_file)
+
+def columnar_path(output_file, fmt):
+    """Path of the ``fmt`` file written alongside a digest CSV."""
+    
+    return os.path.splitext(output_file)[0] + COLUMNAR_FORMATS[fmt]
+
+def write_digest_outputs(df, output_file, title, timestamp=None, formats=()):
+    """Write a digest CSV plus each requested columnar format and return the paths written.
+    
+    Columnar files share the CSV's stem.
+    """
+    
+    timestamp = timestamp or datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    write_csv(df, output_file, title, timestamp)
+    return [output_file] + write_columnar_outputs(df, output_file, title, timestamp, formats)
+
+def write_columnar_outputs(df, output_file, title, timestamp, formats):
+    """Write only the requested columnar formats alongside ``output_file``."""
+    
+    written = []
+    for fmt in COLUMNAR_FORMATS:
+        if fmt in formats:
+            path = columnar_path(output_file, fmt)
+            write_columnar(df, path, fmt, title, timestamp)
+            written.append(path)
+    
+    return written
+
+def read_columnar_digest(path):
+    """Read a Parquet or Feather digest; its title and timestamp are returned in ``df.attrs``."""
+    
+    if path.endswith(COLUMNAR_FORMATS['parquet']):
+        import pyarrow.parquet as pq
+        table = pq.read_table(path)
+    else:
+        from pyarrow import feather
+        table = feather.read_table(path)
+    
+    df = table.to_pandas()
+    raw = (table.schema.metadata or {}).get(METADATA_KEY)
+    if raw:
+        df.attrs.update(json.loads(raw))
+    return df
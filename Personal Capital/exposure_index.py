@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Exposure Index
+Concentration measures (top-N share, Herfindahl-Hirschman index, overlap)
+over a look-through exposure table with one row per (issuer, holding) pair.
+
+Each grouping column (holding, sector, issuer, ...) is factorized once into
+integer codes. Group totals are then single np.bincount calls, and the
+top-N share within every group comes from one sort of the (group, member)
+weights, so measures over thousands of issuers need no per-group loops.
+"""
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+# Top-N shares reported for every group
+TOP_N = (5, 10)
+
+def hhi(weights):
+    """Herfindahl-Hirschman index (0-1) of a set of weights; negative weights count as zero."""
+    
+    weights = np.clip(np.asarray(weights, dtype=float), 0, None)
+    total = weights.sum()
+    return float(((weights / total) ** 2).sum()) if total > 0 else np.nan
+
+def weight_concentration(weights, top_n=TOP_N):
+    """Concentration across one set of group weights, with the columns of ExposureIndex.concentration."""
+    
+    weights = np.asarray(weights, dtype=float)
+    long_weights = np.sort(np.clip(weights, 0, None))[::-1]
+    total = long_weights.sum()
+    index = hhi(weights)
+    
+    result = {'weight': weights.sum(), 'members': int((weights != 0).sum())}
+    for n in top_n:
+        result[f'top{n}_pct'] = long_weights[:n].sum() / total * 100 if total > 0 else np.nan
+    result['hhi'] = index
+    result['effective_count'] = 1 / index
+    return result
+
+class ExposureIndex:
+    """Group codes for the columns of an exposure table, shared by every measure.
+    
+    Concentration and overlap measures use long exposure only: a member whose
+    net weight within a group is negative counts as zero.
+    """
+    
+    def __init__(self, exposures, keys, weight='weight'):
+        self.weights = exposures[weight].to_numpy(dtype=float)
+        self.codes = {}
+        self.labels = {}
+        for key in keys:
+            codes, labels = pd.factorize(exposures[key])
+            self.codes[key] = codes
+            self.labels[key] = pd.Index(labels, name=key)
+    
+    def totals(self, key, values=None):
+        """Sum of ``values`` (default: the weights) for every group of ``key``, indexed by label."""
+        
+        values = self.weights if values is None else np.asarray(values, dtype=float)
+        codes = self.codes[key]
+        valid = codes >= 0
+        sums = np.bincount(codes[valid], weights=values[valid], minlength=len(self.labels[key]))
+        return pd.Series(sums, index=self.labels[key])
+    
+    def member_weights(self, key, member):
+        """Net weight of every (group, member) pair present, as parallel code and weight arrays."""
+        
+        groups = self.codes[key] if key else np.zeros(len(self.weights), dtype=int)
+        members = self.codes[member]
+        valid = (groups >= 0) & (members >= 0)
+        pairs, inverse = np.unique(groups[valid] * len(self.labels[member]) + members[valid], return_inverse=True)
+        weights = np.bincount(inverse, weights=self.weights[valid])
+        return pairs // len(self.labels[member]), pairs % len(self.labels[member]), weights
+    
+    def concentration(self, key, member, top_n=TOP_N):
+        """Concentration of ``member`` exposure within every group of ``key`` (None: the whole table).
+        
+        Returns a frame indexed by group label with the group's weight, its
+        member count, the percentage share of its ``top_n`` largest members,
+        the HHI and the effective member count (1 / HHI).
+        """
+        
+        groups, _, weights = self.member_weights(key, member)
+        labels = self.labels[key] if key else pd.Index(['Total'])
+        size = len(labels)
+        long_weights = np.clip(weights, 0, None)
+        long_total = np.bincount(groups, weights=long_weights, minlength=size)
+        
+        # Rank members within each group, largest first
+        order = np.lexsort((-long_weights, groups))
+        first = np.searchsorted(groups[order], np.arange(size))
+        rank = np.empty(len(order), dtype=int)
+        rank[order] = np.arange(len(order)) - first[groups[order]]
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            result = pd.DataFrame({
+                'weight': np.bincount(groups, weights=weights, minlength=size),
+                'members': np.bincount(groups, weights=weights != 0, minlength=size).astype(int),
+            }, index=labels)
+            for n in top_n:
+                top = np.bincount(groups, weights=np.where(rank < n, long_weights, 0), minlength=size)
+                result[f'top{n}_pct'] = top / long_total * 100
+            result['hhi'] = np.bincount(groups, weights=long_weights ** 2, minlength=size) / long_total ** 2
+            result['effective_count'] = 1 / result['hhi']
+        
+        return result
+    
+    def overlap(self, key, member):
+        """Pairwise overlap of ``member`` exposure between the groups of ``key``.
+        
+        The overlap of two groups is the sum over members of the smaller of
+        their shares in each group (0-100%). Returns a frame with one row per
+        unordered pair: both labels, the overlap and the shared member count.
+        The dense (groups x members) share matrix suits low-cardinality keys
+        such as holdings.
+        """
+        
+        groups, members, weights = self.member_weights(key, member)
+        shares = np.zeros((len(self.labels[key]), len(self.labels[member])))
+        shares[groups, members] = np.clip(weights, 0, None)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            shares = np.nan_to_num(shares / shares.sum(axis=1, keepdims=True))
+        
+        left, right = np.triu_indices(len(shares), k=1)
+        overlap = np.minimum(shares[left], shares[right])
+        return pd.DataFrame({
+            'left': self.labels[key][left],
+            'right': self.labels[key][right],
+            'overlap_pct': overlap.sum(axis=1) * 100,
+            'shared_members': (overlap > 0).sum(axis=1),
+        })
@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+"""
+Fast Startup Helpers
+Deferred imports for the digest scripts, so runs that never touch pandas or
+numpy (--help, missing input files) skip their import cost, plus an
+import-time budget check for the scripts themselves.
+
+Run directly to measure each digest script's import time in a fresh
+interpreter and fail when it exceeds IMPORT_BUDGET_SECONDS.
+"""
+
+import importlib
+import subprocess
+import sys
+
+# Import-time budget for each digest script, measured in a fresh interpreter
+IMPORT_BUDGET_SECONDS = 0.15
+
+# Scripts checked against the budget
+STARTUP_MODULES = ['process_net_worth', 'process_ibkr_digests', 'batch_digests']
+
+class LazyModule:
+    """Stand-in for a module that is imported on first attribute access.
+    
+    On first use the real module replaces this placeholder in the owning
+    module's globals, so later lookups cost nothing extra.
+    """
+    
+    def __init__(self, module_name, alias, namespace):
+        self._module_name = module_name
+        self._alias = alias
+        self._namespace = namespace
+    
+    def __getattr__(self, attr):
+        module = importlib.import_module(self._module_name)
+        self._namespace[self._alias] = module
+        return getattr(module, attr)
+
+def lazy_import(module_name, alias, namespace):
+    """Bind ``alias`` in ``namespace`` to a LazyModule for ``module_name``."""
+    
+    namespace[alias] = LazyModule(module_name, alias, namespace)
+    return namespace[alias]
+
+def measure_import_seconds(module_name):
+    """Import a module in a fresh interpreter and return the elapsed seconds."""
+    
+    code = (
+        "import time; start = time.perf_counter(); "
+        f"import {module_name}; print(time.perf_counter() - start)"
+    )
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return float(result.stdout.strip())
+
+def main():
+    """Check each digest script's import time against the budget."""
+    
+    over_budget = False
+    for module_name in STARTUP_MODULES:
+        seconds = measure_import_seconds(module_name)
+        status = 'ok' if seconds <= IMPORT_BUDGET_SECONDS else 'OVER BUDGET'
+        over_budget |= seconds > IMPORT_BUDGET_SECONDS
+        print(f"{module_name:<24} {seconds * 1000:8.1f} ms  {status}")
+    
+    print(f"Budget: {IMPORT_BUDGET_SECONDS * 1000:.0f} ms per script")
+    return 1 if over_budget else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+FX Rates
+Date-indexed exchange rates to the base currency (CAD) and vectorized
+conversion of whole frames.
+
+RateTable keeps every known (Date, currency) rate sorted by date and
+resolves a frame's rates with one pd.merge_asof: each date takes the
+latest rate on or before it. Resolved (date, currency) pairs are memoized
+in the table, so converting more frames that share dates and currencies
+(the cost basis after the market value, or one streamed chunk after
+another) costs one dictionary lookup per distinct pair, never per row.
+
+Dates before a currency's first known rate take that first rate. An
+export alone only has rates for its report date, so historical amounts
+would silently be converted at today's rate: a warning names every
+currency with amounts more than MAX_BACKFILL_DAYS before its first rate.
+"""
+
+import threading
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+BASE_CURRENCY = 'CAD'
+
+# Dates this many days or fewer before a currency's first rate take it without a warning
+MAX_BACKFILL_DAYS = 31
+
+def rate_frame(dates=(), currencies=(), rates=()):
+    """Build a rate frame: units of the base currency per unit of ``currency`` on each ``Date``.
+    
+    Rows without a date, currency or positive rate are dropped.
+    """
+    
+    frame = pd.DataFrame({
+        'Date': pd.to_datetime(pd.Series(dates, dtype=object), errors='coerce'),
+        'currency': pd.Series(currencies, dtype=object),
+        'rate': pd.to_numeric(pd.Series(rates, dtype=object), errors='coerce'),
+    })
+    return frame[frame['Date'].notna() & frame['currency'].notna() & (frame['rate'] > 0)]
+
+def read_rate_file(path):
+    """Read a local rate file: a CSV with Date, Currency and Rate (base currency per unit) columns."""
+    
+    table = pd.read_csv(path, usecols=['Date', 'Currency', 'Rate'], thousands=',')
+    return rate_frame(table['Date'], table['Currency'].str.strip().str.upper(), table['Rate'])
+
+class RateTable:
+    """Sorted, date-indexed rates to the base currency with memoized as-of lookups.
+    
+    ``sources`` are rate frames (see rate_frame) in priority order: when
+    two sources give a rate for the same date and currency, the earlier
+    source wins. Dates before a currency's first rate take that first rate,
+    with a warning (once per currency) when they are more than
+    MAX_BACKFILL_DAYS earlier.
+    """
+    
+    def __init__(self, *sources, base=BASE_CURRENCY):
+        self.base = base
+        rates = pd.concat([rate_frame()] + list(sources), ignore_index=True)
+        rates['Date'] = rates['Date'].dt.normalize().astype('datetime64[ns]')
+        rates['currency'] = rates['currency'].astype(str)
+        self.rates = (rates[rates['currency'] != base]
+                      .drop_duplicates(['Date', 'currency'])
+                      .sort_values(['Date', 'currency'], ignore_index=True))
+        self._memo = {}
+        self._warned = set()
+        self._lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.rates)
+    
+    def resolve(self, pairs):
+        """As-of rates of (date, currency) pairs missing from the memo; NaN when a currency has no rate."""
+        
+        query = pd.DataFrame(pairs, columns=['Date', 'currency'])
+        # Join keys need the same dtypes on both sides
+        query['Date'] = pd.to_datetime(query['Date']).astype('datetime64[ns]')
+        query['currency'] = query['currency'].astype(str)
+        query['order'] = np.arange(len(query))
+        
+        # Undated amounts take the latest rate
+        dated = query['Date'].notna()
+        latest = self.rates.groupby('currency')['rate'].last()
+        rate = query['currency'].map(latest).to_numpy(dtype=float, copy=True)
+        
+        found = pd.merge_asof(query[dated].sort_values('Date'), self.rates, on='Date', by='currency',
+                              direction='backward')
+        self.warn_backfill(found[found['rate'].isna()])
+        found['rate'] = found['rate'].fillna(found['currency'].map(self.rates.groupby('currency')['rate'].first()))
+        rate[found['order'].to_numpy()] = found['rate'].to_numpy(dtype=float)
+        
+        rate[(query['currency'] == self.base).to_numpy()] = 1.0
+        return rate
+    
+    def warn_backfill(self, early):
+        """Warn about currencies whose ``early`` dates fall well before their first known rate."""
+        
+        first = self.rates.groupby('currency')['Date'].first()
+        early = early[early['Date'] < early['currency'].map(first) - pd.Timedelta(days=MAX_BACKFILL_DAYS)]
+        for currency, dates in early.groupby('currency')['Date']:
+            if currency in self._warned:
+                continue
+            self._warned.add(currency)
+            print(f"Warning: {currency} amounts from {dates.min():%Y-%m-%d} on are converted at the first known "
+                  f"{currency} rate ({first[currency]:%Y-%m-%d}); add a rate history with --fx-rates")
+    
+    def lookup(self, dates, currencies):
+        """Rates to the base currency for aligned dates and currency codes (missing currency = base)."""
+        
+        keys = pd.DataFrame({
+            'Date': pd.to_datetime(pd.Series(dates)).dt.normalize().to_numpy(),
+            'currency': pd.Series(currencies, dtype=object).fillna(self.base).to_numpy(),
+        })
+        codes, pairs = pd.MultiIndex.from_frame(keys).factorize()
+        pairs = list(pairs)
+        
+        with self._lock:
+            missing = [pair for pair in pairs if pair not in self._memo]
+            if missing:
+                self._memo.update(zip(missing, self.resolve(missing)))
+            rates = np.array([self._memo[pair] for pair in pairs], dtype=float)
+        
+        return rates[codes] if len(pairs) else np.ones(0)
+    
+    def to_base(self, df, columns, date='Date', currency='currency'):
+        """Return a copy of ``df`` with ``columns`` converted to the base currency.
+        
+        ``date`` may name a column or hold one date for every row. Raises
+        ValueError naming any currency without a rate.
+        """
+        
+        dates = df[date] if isinstance(date, str) else [date] * len(df)
+        rates = self.lookup(dates, df[currency])
+        
+        unknown = np.isnan(rates)
+        if unknown.any():
+            missing = sorted(set(df[currency][unknown].astype(str)))
+            raise ValueError(f"No {self.base} rate for {', '.join(missing)}; add one to the FX rate file")
+        
+        df = df.copy()
+        for col in columns:
+            df[col] = df[col] * rates
+        return df
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Net Worth Projection
+Monte Carlo projection of net worth from its monthly history.
+
+Monthly changes of a net worth history include savings as well as
+returns, so the history is first split into the two: a least-squares fit
+of each month's change on the previous month's net worth gives a constant
+monthly savings amount (the intercept), and the monthly returns are the
+changes net of it. Compounding the raw changes would count every past
+deposit as growth.
+
+Every path draws one return per future month from those net returns,
+either by resampling past months (bootstrap) or from a normal distribution
+of log returns with their mean and standard deviation (normal), and adds
+the contribution schedule at each month end: the estimated savings unless
+a monthly contribution is given. Paths are simulated as
+(months x paths) arrays in chunks of at most CHUNK_CELLS cells, so memory
+does not grow with the number of paths: a chunk keeps only its values at
+the report dates and, per milestone, the month each path first reaches it.
+"""
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+lazy_import('pandas', 'pd', globals())
+
+PROJECTION_PATHS = 100_000
+PROJECTION_YEARS = 30
+
+# Months between report dates of the projection
+REPORT_MONTHS = 12
+
+# Net worth percentiles reported at every report date
+PERCENTILES = [5, 25, 50, 75, 95]
+
+SAMPLING_METHODS = ['bootstrap', 'normal']
+
+# Columns of the projection frame: 'band' rows fill the net worth columns, 'milestone' rows the last two
+PROJECTION_COLUMNS = (['level', 'date', 'months_ahead', 'contributed', 'totalNW_mean']
+                      + [f'totalNW_p{percentile}' for percentile in PERCENTILES] + ['milestone', 'probability_pct'])
+
+# Annualized net return outside this range is reported as implausible
+PLAUSIBLE_ANNUAL_RETURN = (-0.15, 0.20)
+
+# Largest (months x paths) block simulated at once: 2M float64 cells is 16 MB per array
+CHUNK_CELLS = 2_000_000
+
+def history_returns(values):
+    """Estimated monthly savings and the monthly returns (fractions) net of them of a net worth series.
+    
+    Months after a non-positive value are skipped. The savings are the
+    intercept of a least-squares fit of each month's change on the previous
+    month's net worth.
+    """
+    
+    values = np.asarray(values, dtype=float)
+    previous, current = values[:-1], values[1:]
+    valid = (previous > 0) & np.isfinite(previous) & np.isfinite(current)
+    previous, change = previous[valid], current[valid] - previous[valid]
+    if len(change) < 2:
+        return 0.0, change / previous
+    
+    design = np.column_stack([np.ones_like(previous), previous])
+    savings = float(np.linalg.lstsq(design, change, rcond=None)[0][0])
+    return savings, (change - savings) / previous
+
+def annualized_return(returns):
+    """Compound annual return of a series of monthly returns (NaN when a month loses everything)."""
+    
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) == 0 or (returns <= -1).any():
+        return np.nan
+    return float(np.expm1(12 * np.log1p(returns).mean()))
+
+def contribution_schedule(months, monthly=0.0, annual_growth=0.0):
+    """Contribution at the end of each future month: ``monthly``, growing by ``annual_growth`` every 12 months."""
+    
+    return monthly * (1 + annual_growth) ** (np.arange(months) // 12)
+
+def sample_growth(rng, returns, shape, method='bootstrap'):
+    """Growth factors (1 + return) of shape ``shape`` drawn from the history ``returns``."""
+    
+    if method == 'bootstrap':
+        return 1 + returns[rng.integers(0, len(returns), size=shape)]
+    if method == 'normal':
+        logs = np.log1p(returns)
+        return np.exp(rng.normal(logs.mean(), logs.std(ddof=1), size=shape))
+    raise ValueError(f"Unknown sampling method '{method}' (expected one of {', '.join(SAMPLING_METHODS)})")
+
+def simulate_paths(start_value, growth, contributions):
+    """Net worth at every month end of every path: (months x paths) values from (months x paths) growth."""
+    
+    values = np.empty_like(growth)
+    value = np.full(growth.shape[1], float(start_value))
+    for month, (factors, contribution) in enumerate(zip(growth, contributions)):
+        value = value * factors + contribution
+        values[month] = value
+    return values
+
+def project_net_worth(dates, values, paths=PROJECTION_PATHS, years=PROJECTION_YEARS, contribution=None,
+                      contribution_growth=0.0, method='bootstrap', milestones=(), seed=0):
+    """Simulate ``paths`` net worth paths ``years`` ahead of the monthly history ``values``.
+    
+    Returns one 'band' row per report date (every REPORT_MONTHS after the
+    last history month) with the cumulative contributions, the mean and the
+    PERCENTILES of net worth across paths, and one 'milestone' row per
+    milestone and report date with the share of paths that have reached
+    the milestone by then. The same ``seed`` gives the same projection.
+    
+    ``contribution`` defaults to the savings estimated from the history.
+    Prints a warning when the history's annualized return net of savings
+    is outside PLAUSIBLE_ANNUAL_RETURN.
+    """
+    
+    savings, returns = history_returns(values)
+    if len(returns) < 2:
+        raise ValueError("Net worth projection needs at least three months of positive net worth")
+    
+    annual = annualized_return(returns)
+    low, high = PLAUSIBLE_ANNUAL_RETURN
+    if not low <= annual <= high:
+        print(f"Warning: the net worth history implies a {annual:.1%} annualized return net of "
+              f"{savings:,.0f} CAD monthly savings; the projection compounds it, so treat it with care")
+    
+    if contribution is None:
+        contribution = savings
+    
+    months = int(years * 12)
+    report_index = np.arange(REPORT_MONTHS, months + 1, REPORT_MONTHS) - 1
+    levels = np.sort(np.asarray(milestones, dtype=float))
+    contributions = contribution_schedule(months, contribution, contribution_growth)
+    start_value = float(np.asarray(values, dtype=float)[-1])
+    
+    rng = np.random.default_rng(seed)
+    chunk_paths = max(1, CHUNK_CELLS // max(months, 1))
+    reported = []
+    first_hits = np.zeros((len(levels), months + 1), dtype=np.int64)
+    
+    for start in range(0, paths, chunk_paths):
+        size = min(chunk_paths, paths - start)
+        chunk = simulate_paths(start_value, sample_growth(rng, returns, (months, size), method), contributions)
+        reported.append(chunk[report_index])
+        
+        # Months before each path first reaches a level (months when it never does)
+        peak = np.maximum.accumulate(chunk, axis=0)
+        for i, level in enumerate(levels):
+            first_hits[i] += np.bincount((peak < level).sum(axis=0), minlength=months + 1)
+    
+    reported = np.concatenate(reported, axis=1) if reported else np.empty((len(report_index), 0))
+    months_ahead = report_index + 1
+    last = pd.Period(pd.Timestamp(dates.iloc[-1] if hasattr(dates, 'iloc') else dates[-1]), 'M')
+    report_dates = pd.DatetimeIndex([(last + int(m)).to_timestamp() for m in months_ahead])
+    
+    bands = pd.DataFrame({
+        'level': 'band',
+        'date': report_dates,
+        'months_ahead': months_ahead,
+        'contributed': np.cumsum(contributions)[report_index],
+        'totalNW_mean': reported.mean(axis=1),
+    })
+    for percentile, band in zip(PERCENTILES, np.percentile(reported, PERCENTILES, axis=1)):
+        bands[f'totalNW_p{percentile}'] = band
+    
+    # A path has reached a level by month m when it first did so within the first m months
+    reached = np.cumsum(first_hits[:, :months], axis=1)[:, report_index] / max(paths, 1) * 100
+    milestone_rows = pd.DataFrame({
+        'level': 'milestone',
+        'date': np.tile(report_dates, len(levels)),
+        'months_ahead': np.tile(months_ahead, len(levels)),
+        'milestone': np.repeat(levels, len(report_index)),
+        'probability_pct': reached.ravel(),
+    })
+    
+    return pd.concat([bands, milestone_rows], ignore_index=True).reindex(columns=PROJECTION_COLUMNS)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Parse Cache
+On-disk cache of parsed export files, keyed by file content hash and parser
+version, so unchanged exports are never re-parsed.
+
+Entries are pickles named after their key. The cache directory is kept under
+a size budget by evicting the least recently used entries.
+"""
+
+import hashlib
+import os
+import pickle
+import tempfile
+
+DEFAULT_CACHE_DIR = ".digest_cache"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+def file_digest(file_path):
+    """Return the SHA-256 hex digest of a file's contents."""
+    
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def cache_key(file_path, kind, version, params=()):
+    """Build a cache key from file content, entry kind, parser version and parameters."""
+    
+    key = hashlib.sha256()
+    key.update(file_digest(file_path).encode())
+    key.update(f"|{kind}|{version}|{sorted(map(str, params))}".encode())
+    return f"{kind}-{key.hexdigest()[:32]}"
+
+def cached_load(cache_dir, file_path, kind, version, loader, params=(), max_bytes=DEFAULT_MAX_BYTES):
+    """Return ``loader()`` for a file, reusing a cached result when the file is unchanged.
+    
+    ``kind`` names what is cached (e.g. 'sections') and ``version`` must be
+    bumped whenever the loader's output changes; both are part of the key,
+    along with ``params``. Pass ``cache_dir=None`` to bypass the cache.
+    """
+    
+    if cache_dir is None:
+        return loader()
+    
+    os.makedirs(cache_dir, exist_ok=True)
+    entry = os.path.join(cache_dir, cache_key(file_path, kind, version, params) + '.pkl')
+    
+    if os.path.exists(entry):
+        try:
+            with open(entry, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(entry)  # Mark as recently used
+            return result
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            # Unreadable entry (or one evicted by a concurrent run): drop it and re-parse
+            try:
+                os.remove(entry)
+            except FileNotFoundError:
+                pass
+    
+    result = loader()
+    
+    # Write atomically so a concurrent reader never sees a partial entry
+    fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix='.tmp')
+    with os.fdopen(fd, 'wb') as f:
+        pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, entry)
+    
+    evict(cache_dir, max_bytes)
+    return result
+
+def evict(cache_dir, max_bytes=DEFAULT_MAX_BYTES):
+    """Delete least recently used entries until the cache fits in ``max_bytes``."""
+    
+    entries = []
+    for name in os.listdir(cache_dir):
+        if name.endswith('.pkl'):
+            path = os.path.join(cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:  # Evicted by a concurrent run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+    
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+def clear_cache(cache_dir):
+    """Remove every cache entry."""
+    
+    if not os.path.isdir(cache_dir):
+        return
+    
+    for name in os.listdir(cache_dir):
+        if name.endswith(('.pkl', '.tmp')):
+            os.remove(os.path.join(cache_dir, name))
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Pipeline Metrics
+Per-stage instrumentation for the digest scripts: wall time, CPU time,
+peak RSS, traced peak memory (when enabled) and input/output row counts;
+with memory tracing, loading stages also record their frames' deep memory.
+Metrics are written as a JSON sidecar next to the digests so schedulers
+can alert on slow or memory-heavy runs; --profile additionally dumps a
+cProfile/pstats file per run.
+"""
+
+from contextlib import contextmanager
+from datetime import datetime
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+def peak_rss_mb():
+    """Return the process's peak resident set size in MB, or None if unknown."""
+    
+    if resource is None:
+        return None
+    
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes on Linux
+    divisor = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return round(peak / divisor, 2)
+
+def sidecar_path(output_file, suffix):
+    """Path next to ``output_file`` with its extension replaced by ``suffix``."""
+    
+    return os.path.splitext(output_file)[0] + suffix
+
+def count_rows(result):
+    """Count rows in a stage result: frames by length, dicts and lists of frames summed."""
+    
+    if isinstance(result, dict):
+        counts = [count_rows(value) for value in result.values()]
+        return None if None in counts else sum(counts)
+    if isinstance(result, (list, tuple)) and result and hasattr(result[0], 'shape'):
+        return sum(len(item) for item in result)
+    if hasattr(result, '__len__'):
+        return len(result)
+    return None
+
+def frame_memory_mb(result):
+    """Deep memory of a frame, or of the frames in a dict or list, in MB (None for other results)."""
+    
+    if isinstance(result, dict):
+        sizes = [frame_memory_mb(value) for value in result.values()]
+        return None if None in sizes else round(sum(sizes), 3)
+    if isinstance(result, (list, tuple)):
+        sizes = [frame_memory_mb(item) for item in result]
+        return None if None in sizes else round(sum(sizes), 3)
+    if hasattr(result, 'memory_usage'):
+        usage = result.memory_usage(deep=True)
+        return round(int(getattr(usage, 'sum', lambda: usage)()) / (1024 * 1024), 3)
+    return None
+
+class StageMetrics:
+    """Collects one record per pipeline stage.
+    
+    Stages may run on worker threads: CPU time is per thread, and traced
+    memory peaks are only exact when stages run one at a time.
+    """
+    
+    def __init__(self, pipeline, trace_memory=False):
+        self.pipeline = pipeline
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.started = datetime.now()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+    
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time the enclosed block; set ``record['rows_out']`` inside to report output rows."""
+        
+        record = {'stage': name, 'rows_in': rows_in, 'rows_out': None}
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        
+        try:
+            yield record
+        finally:
+            record['wall_seconds'] = round(time.perf_counter() - wall_start, 6)
+            record['cpu_seconds'] = round(time.thread_time() - cpu_start, 6)
+            record['peak_rss_mb'] = peak_rss_mb()
+            if self.trace_memory:
+                record['traced_peak_mb'] = round(tracemalloc.get_traced_memory()[1] / (1024 * 1024), 3)
+            with self._lock:
+                self.stages.append(record)
+    
+    def measure(self, name, func, *args, rows_in=None, **kwargs):
+        """Run ``func(*args, **kwargs)`` as a stage and record its output row count."""
+        
+        with self.stage(name, rows_in) as record:
+            result = func(*args, **kwargs)
+            record['rows_out'] = count_rows(result)
+        return result
+    
+    def summary(self, **extra):
+        """Return the metrics document for this run."""
+        
+        document = {
+            'pipeline': self.pipeline,
+            'started': self.started.strftime("%Y-%m-%d %H:%M:%S"),
+            'total_seconds': round(time.perf_counter() - self._start, 6),
+            'peak_rss_mb': peak_rss_mb(),
+            'stages': self.stages,
+        }
+        document.update(extra)
+        return document
+    
+    def write(self, path, **extra):
+        """Write the metrics document as JSON."""
+        
+        with open(path, 'w') as f:
+            json.dump(self.summary(**extra), f, indent=2, default=str)
+
+@contextmanager
+def profiled(path):
+    """Profile the enclosed block with cProfile and dump pstats to ``path`` (no-op if None).
+    
+    Only the calling thread is profiled.
+    """
+    
+    if path is None:
+        yield
+        return
+    
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
@@ -1,527 +1,1589 @@
 #!/usr/bin/env python3
 """
 IBKR Portfolio Analysis Script
-Generates 4 digest files from IBKR data:
+Generates 13 digest files from IBKR data:
 1. PF_IBKR_Performance_Digest.csv
-2. PF_IBKR_Allocation_Digest.csv  
-3. PF_IBKR_Position_Digest.csv
-4. PF_Cashflow_Digest.csv
+2. PF_IBKR_Returns_Digest.csv
+3. PF_IBKR_Allocation_Digest.csv  
+4. PF_IBKR_Position_Digest.csv
+5. PF_Cashflow_Monthly_Digest.csv
+6. PF_Cashflow_Digest.csv (quarterly)
+7. PF_Cashflow_Yearly_Digest.csv
+8. PF_Cashflow_Total_Digest.csv
+9. PF_Cashflow_All_Accounts_Digest.csv
+10. PF_IBKR_Rolling_Risk_Digest.csv
+11. PF_IBKR_Symbol_Digest.csv
+12. PF_IBKR_Exposure_Digest.csv
+13. PF_IBKR_Income_Digest.csv
 
 Generated: {timestamp}
 """
 
-import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
+import contextvars
+import io
 import re
+import argparse
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import sys
 import os
-from scipy import stats
 
-def parse_ibkr_csv(file_path):
-    """Parse the IBKR CSV file into structured sections."""
+from cashflow_rollups import ALL_ACCOUNTS, cashflow_rollups
+from compact_frames import (
+    CATEGORY_DTYPES, MIN_COMPACT_ROWS, as_category, fill_labels, narrow_integers, record_frame_memory, recode,
+    share_symbols,
+)
+from digest_history import DEFAULT_HISTORY_DB, store_digests
+from digest_output import COLUMNAR_FORMATS, columnar_support_error, write_digest_outputs
+from exposure_index import ExposureIndex, weight_concentration
+from fast_startup import lazy_import
+from fx_rates import BASE_CURRENCY, RateTable, rate_frame, read_rate_file
+from parse_cache import DEFAULT_CACHE_DIR, cached_load, clear_cache
+from pipeline_metrics import StageMetrics, count_rows, profiled
+from return_engine import DAYS_PER_YEAR, chained_returns, flow_matrix, modified_dietz, xirr
+from risk_windows import (
+    ROLLING_WINDOWS, matrix_metrics, rolling_max_drawdown, rolling_windows, trailing_windows, window_max_drawdown,
+    window_metrics,
+)
+
+# pandas and numpy load on first use, so --help and error paths start fast
+lazy_import('pandas', 'pd', globals())
+lazy_import('numpy', 'np', globals())
+
+# Default input exports
+PORTFOLIO_FILE = "docs/IKBR Portfolio - Inception to Date.csv"
+TRANSACTION_FILE = "docs/IKBR Portfolio - Transaction History.csv"
+
+# Bump whenever parse_ibkr_csv or load_transactions output changes so
+# cached parses from older versions are not reused
+PARSER_VERSION = 2
+
+# Sections read by the Performance, Returns, Allocation, Position, Symbol, Exposure and Income digests
+DIGEST_SECTIONS = frozenset({
+    'Introduction',
+    'Key Statistics',
+    'Breakdown of Accounts',
+    'Deposits And Withdrawals',
+    'Allocation by Asset Class',
+    'Historical Performance Benchmark Comparison',
+    'Open Position Summary',
+    'Performance by Symbol',
+    'Performance by Financial Instrument',
+    'Allocation by Financial Instrument',
+    'Concentration',
+    'ESG',
+    'Dividends',
+    'Interest Details',
+    'Projected Income',
+})
+
+# Placeholder values IBKR writes for missing numbers
+MISSING_VALUES = ['-', '--']
+
+# Columns of the shared positions frame built by build_positions_frame
+POSITION_COLUMNS = [
+    'ticker', 'securityName', 'sector', 'accountType', 'currency', 'quantity', 'marketValue_CAD',
+    'costBasis_CAD', 'unrealized_gain_pct', 'country', 'assetClass', 'weight_pct',
+    'contribution_to_total_return_pct',
+]
+
+def parse_ibkr_csv(file_path, wanted_sections=None, compact=False):
+    """Parse the IBKR CSV file into structured sections.
+
+    The file is streamed line by line. When ``wanted_sections`` is given,
+    rows belonging to any other section are skipped before they are split,
+    so unused sections (Fee Summary, Trade Summary, ...) cost only a prefix check.
+
+    Each section maps to a list of DataFrames, one per Header row, with that
+    Header's fields as columns. With ``compact`` repetitive text columns of
+    larger blocks are read as categoricals.
+    """
+    
+    blocks = {}
     
     with open(file_path, 'r', encoding='utf-8') as f:
-        lines = f.readlines()
+        for line in f:
+            comma = line.find(',')
+            if comma < 0:
+                continue
+            
+            section_name = line[:comma]
+            if wanted_sections is not None and section_name not in wanted_sections:
+                continue
+            
+            row_type = line[comma + 1:comma + 8]
+            if row_type == 'Header,':
+                blocks.setdefault(section_name, []).append([line])
+            elif row_type.startswith('Data,') and section_name in blocks:
+                blocks[section_name][-1].append(line)
+    
+    return {
+        section_name: [read_section_block(lines, compact) for lines in section_blocks]
+        for section_name, section_blocks in blocks.items()
+    }
+
+def read_section_block(lines, compact=False):
+    """Tokenize one Header + Data block with pandas' C CSV engine.
+
+    With ``compact`` blocks of at least MIN_COMPACT_ROWS rows read their
+    repetitive text columns straight into categoricals.
+    """
+    
+    table = pd.read_csv(
+        io.StringIO(''.join(lines)),
+        na_values=MISSING_VALUES,
+        skipinitialspace=True,
+        thousands=',',
+        dtype=CATEGORY_DTYPES if compact and len(lines) > MIN_COMPACT_ROWS else None,
+    )
     
-    sections = {}
-    current_section = None
-    current_data = []
+    # Drop the leading section name and row type columns
+    return table.iloc[:, 2:]
+
+def section_table(sections, section_name, first_column=None):
+    """Return a section's table, optionally the block whose first column matches."""
+    
+    for table in sections.get(section_name, []):
+        if first_column is None or table.columns[0] == first_column:
+            return table
+    
+    return pd.DataFrame()
+
+def regress_vs_benchmark(benchmark_returns, portfolio_returns, scipy_check=False):
+    """Closed-form least-squares slope (beta) and intercept of portfolio on benchmark returns.
+
+    With ``scipy_check`` the result is compared against scipy.stats.linregress
+    when scipy is installed.
+    """
     
-    for line in lines:
-        parts = [p.strip() for p in line.split(',')]
+    x = np.asarray(benchmark_returns, dtype=float)
+    y = np.asarray(portfolio_returns, dtype=float)
+    
+    x_dev = x - x.mean()
+    variance = np.dot(x_dev, x_dev)
+    if variance == 0:
+        return np.nan, np.nan
+    
+    slope = np.dot(x_dev, y - y.mean()) / variance
+    intercept = y.mean() - slope * x.mean()
+    
+    if scipy_check:
+        try:
+            from scipy import stats
+        except ImportError:
+            print("scipy not installed; skipping regression cross-check")
+        else:
+            reference = stats.linregress(x, y)
+            if not np.allclose([slope, intercept], [reference.slope, reference.intercept]):
+                print(f"Warning: regression mismatch vs scipy (beta {slope} vs {reference.slope}, "
+                      f"intercept {intercept} vs {reference.intercept})")
+    
+    return slope, intercept
+
+def monthly_return_series(sections, benchmark='SPXTR'):
+    """Monthly portfolio and benchmark returns (fractions) from Historical Performance Benchmark Comparison.
+
+    Returns a frame with ``date`` (month start), ``portfolio`` and
+    ``benchmark`` columns in chronological order; months missing either
+    return are dropped. The monthly table stops at the last complete month,
+    so the report's current month is appended from the MTD period returns
+    when Key Statistics names it.
+    """
+    
+    monthly_table = section_table(sections, 'Historical Performance Benchmark Comparison', 'Month')
+    if len(monthly_table) == 0:
+        return pd.DataFrame(columns=['date', 'portfolio', 'benchmark'])
+    
+    # The benchmark may sit in any of the BM1..BMn slots
+    benchmark_column = 'BM1Return'
+    for col in monthly_table.columns:
+        if col.startswith('BM') and not col.endswith('Return') and (monthly_table[col] == benchmark).any():
+            benchmark_column = f'{col}Return'
+            break
+    
+    monthly = pd.DataFrame({
+        'date': pd.to_datetime(monthly_table['Month'].astype(str), format='%Y%m', errors='coerce'),
+        'portfolio': pd.to_numeric(monthly_table['AccountReturn'], errors='coerce') / 100,
+        'benchmark': pd.to_numeric(monthly_table[benchmark_column], errors='coerce') / 100,
+    }).dropna()
+    
+    # Current (partial) month from the MTD column of the period table
+    key_stats = section_table(sections, 'Key Statistics')
+    period_table = section_table(sections, 'Historical Performance Benchmark Comparison', 'Account')
+    if 'Account' in period_table.columns and 'MTD' in period_table.columns and '1MonthReturnDateRange' in key_stats:
+        report_month = pd.to_datetime(str(key_stats['1MonthReturnDateRange'].iloc[0]), format='%Y%m', errors='coerce')
+        mtd = pd.to_numeric(period_table.set_index('Account')['MTD'], errors='coerce') / 100
+        if (pd.notna(report_month) and 'Consolidated' in mtd.index and benchmark in mtd.index
+                and (len(monthly) == 0 or report_month > monthly['date'].max())):
+            current = pd.DataFrame({'date': [report_month], 'portfolio': [mtd['Consolidated']],
+                                    'benchmark': [mtd[benchmark]]}).dropna()
+            monthly = pd.concat([monthly, current], ignore_index=True)
+    
+    return monthly.sort_values('date').reset_index(drop=True)
+
+# Period columns of the IBKR period table and their digest names, in report order
+PERIOD_MAPPING = {
+    'MTD': 'MTD',
+    'QTD': 'QTD',
+    'YTD': 'YTD',
+    '1 Year': '1Y',
+    '3 Year': '3Y',
+    '5 Year': '5Y',
+    '10 Year': '10Y',
+    'Since Inception': 'ITD',
+}
+
+def period_window_months(period, latest_month):
+    """Trailing window length in months for a digest period (None for inception to date)."""
+    
+    month = latest_month.month
+    return {
+        'MTD': 1,
+        'QTD': (month - 1) % 3 + 1,
+        'YTD': month,
+        '1Y': 12,
+        '3Y': 36,
+        '5Y': 60,
+        '10Y': 120,
+        'ITD': None,
+    }[period]
+
+# Account label of the whole-portfolio rows of the Returns digest
+CONSOLIDATED = 'Consolidated'
+
+# Columns of the Returns digest
+RETURN_COLUMNS = ['account', 'period', 'startDate', 'endDate', 'navStart', 'navEnd', 'netFlows', 'twr_pct',
+                  'xirr_pct']
+
+def analysis_period(sections):
+    """Start and end dates of the report's analysis period from Introduction (NaT when missing)."""
+    
+    intro = section_table(sections, 'Introduction')
+    if 'AnalysisPeriod' not in intro.columns or len(intro) == 0:
+        return pd.NaT, pd.NaT
+    
+    # e.g. "July 7, 2015 to July 25, 2025 (Monthly)"
+    text = re.sub(r'\s*\(.*\)\s*$', '', str(intro['AnalysisPeriod'].iloc[0]))
+    start, _, end = text.partition(' to ')
+    return pd.to_datetime(start, errors='coerce'), pd.to_datetime(end, errors='coerce')
+
+def external_flows(sections):
+    """Dated deposits (positive) and withdrawals (negative) per account from Deposits And Withdrawals.
+
+    Transfers between accounts appear once per account and cancel out in
+    the consolidated flows.
+    """
+    
+    table = section_table(sections, 'Deposits And Withdrawals')
+    if not {'Date', 'Account', 'Amount'} <= set(table.columns):
+        return pd.DataFrame({'date': pd.to_datetime([]), 'account': pd.Series(dtype=object), 'amount': []})
+    
+    flows = pd.DataFrame({
+        'date': pd.to_datetime(table['Date'], format='%m/%d/%y', errors='coerce'),
+        'account': table['Account'].astype(str),
+        'amount': pd.to_numeric(table['Amount'], errors='coerce'),
+    })
+    return flows.dropna().sort_values('date', kind='stable', ignore_index=True)
+
+def nav_history(sections, end_date=None):
+    """Consolidated NAV at every month end from Allocation by Asset Class.
+
+    The last month of the export is usually partial, so it is valued at
+    ``end_date`` when that falls before its month end.
+    """
+    
+    table = section_table(sections, 'Allocation by Asset Class')
+    if not {'Date', 'NAV'} <= set(table.columns):
+        return pd.DataFrame({'date': pd.to_datetime([]), 'nav': []})
+    
+    history = pd.DataFrame({
+        'date': pd.to_datetime(table['Date'].astype(str), format='%Y%m', errors='coerce') + pd.offsets.MonthEnd(0),
+        'nav': pd.to_numeric(table['NAV'], errors='coerce'),
+    }).dropna().sort_values('date', ignore_index=True)
+    
+    if len(history) and pd.notna(end_date) and end_date < history['date'].iloc[-1]:
+        history.loc[len(history) - 1, 'date'] = end_date
+    return history
+
+def period_returns(sections):
+    """Time- and money-weighted returns per digest period, consolidated and per account.
+
+    Consolidated rows cover every complete trailing period (and ITD): the
+    navStart is the month-end NAV before the period, and the TWR chains
+    monthly Modified Dietz returns over the Deposits And Withdrawals flows.
+    The export has no valuation history per account, so account rows cover
+    the analysis period only, with NAVs and IBKR's own TWR from Breakdown of
+    Accounts. The XIRR of every row is solved in one batched call.
+    """
+    
+    start_date, end_date = analysis_period(sections)
+    flows = external_flows(sections)
+    history = nav_history(sections, end_date)
+    key_stats = section_table(sections, 'Key Statistics')
+    beginning_nav = 0.0
+    if 'BeginningNAV' in key_stats.columns and len(key_stats) > 0:
+        beginning_nav = float(np.nan_to_num(pd.to_numeric(key_stats['BeginningNAV'], errors='coerce').iloc[0]))
+    
+    if pd.isna(start_date):
+        candidates = [flows['date'].min(), history['date'].min() - pd.offsets.MonthBegin(1)]
+        start_date = min(date for date in candidates if pd.notna(date)) if any(pd.notna(candidates)) else pd.NaT
+    if pd.isna(end_date) and len(history):
+        end_date = history['date'].iloc[-1]
+    
+    frames = []
+    day = pd.Timedelta(days=1)
+    
+    if len(history) and pd.notna(start_date):
+        # Month i runs from the day after boundaries[i] to boundaries[i + 1]
+        boundaries = np.concatenate([[start_date - day], history['date']]).astype('datetime64[ns]')
+        dates = flows['date'].to_numpy()
+        month = np.searchsorted(boundaries, dates, side='left') - 1
+        inside = (month >= 0) & (month < len(history))
+        month, amounts = month[inside], flows['amount'].to_numpy()[inside]
         
-        if len(parts) < 2:
-            continue
-            
-        section_name = parts[0]
-        row_type = parts[1]
+        # Flows count from the start of their day, NAVs at the end of theirs
+        remaining = (boundaries[month + 1] - dates[inside]) / day + 1
+        length = (boundaries[month + 1] - boundaries[month]) / day
+        monthly_flows = np.bincount(month, weights=amounts, minlength=len(history))
+        weighted_flows = np.bincount(month, weights=amounts * remaining / length, minlength=len(history))
         
-        if row_type == 'MetaInfo':
-            if current_section and current_data:
-                sections[current_section] = current_data
-            current_section = section_name
-            current_data = []
-            
-        elif row_type in ['Header', 'Data']:
-            if current_section:
-                current_data.append(parts)
+        nav = history['nav'].to_numpy()
+        nav_start = np.concatenate([[beginning_nav], nav[:-1]])
+        monthly = modified_dietz(nav_start, nav, monthly_flows, weighted_flows)
+        
+        periods = list(PERIOD_MAPPING.values())
+        starts, ends, complete = trailing_windows(
+            len(history), [period_window_months(period, history['date'].iloc[-1]) for period in periods]
+        )
+        keep = complete | (np.array(periods) == 'ITD')
+        starts, ends = starts[keep], ends[keep]
+        frames.append(pd.DataFrame({
+            'account': CONSOLIDATED,
+            'period': np.array(periods)[keep],
+            'startDate': pd.to_datetime(boundaries[starts]) + day,
+            'endDate': pd.to_datetime(boundaries[ends]),
+            'navStart': np.where(starts > 0, nav[starts - 1], beginning_nav),
+            'navEnd': nav[ends - 1],
+            'twr_pct': chained_returns(monthly, starts, ends) * 100,
+        }))
+    
+    breakdown = section_table(sections, 'Breakdown of Accounts')
+    if {'Account', 'Beginning NAV', 'Ending NAV'} <= set(breakdown.columns) and pd.notna(start_date):
+        frames.append(pd.DataFrame({
+            'account': breakdown['Account'].astype(str),
+            'period': 'ITD',
+            'startDate': start_date,
+            'endDate': end_date,
+            'navStart': pd.to_numeric(breakdown['Beginning NAV'], errors='coerce'),
+            'navEnd': pd.to_numeric(breakdown['Ending NAV'], errors='coerce'),
+            'twr_pct': pd.to_numeric(breakdown.get('Return'), errors='coerce'),
+        }))
+    
+    if not frames:
+        return pd.DataFrame(columns=RETURN_COLUMNS)
     
-    # Add final section
-    if current_section and current_data:
-        sections[current_section] = current_data
+    returns = pd.concat(frames, ignore_index=True)
     
-    return sections
+    # Every row's flows: the starting NAV in, its period's deposits and withdrawals, the ending NAV out
+    series_start = returns['startDate'].to_numpy(dtype='datetime64[ns]')
+    flow_dates = flows['date'].to_numpy()
+    in_series = (
+        (flow_dates >= series_start[:, None])
+        & (flow_dates <= returns['endDate'].to_numpy(dtype='datetime64[ns]')[:, None])
+        & ((returns['account'].to_numpy()[:, None] == CONSOLIDATED)
+           | (returns['account'].to_numpy()[:, None] == flows['account'].to_numpy()))
+    )
+    returns['netFlows'] = in_series @ flows['amount'].to_numpy()
+    
+    rows, columns = np.nonzero(in_series)
+    series_days = (returns['endDate'] - returns['startDate']).dt.days.to_numpy() + 1
+    amounts, years = flow_matrix(
+        np.concatenate([np.arange(len(returns)), rows, np.arange(len(returns))]),
+        np.concatenate([-returns['navStart'], -flows['amount'].to_numpy()[columns], returns['navEnd']]),
+        np.concatenate([np.zeros(len(returns)), (flow_dates[columns] - series_start[rows]) / day, series_days])
+        / DAYS_PER_YEAR,
+        len(returns),
+    )
+    returns['xirr_pct'] = xirr(amounts, years) * 100
+    
+    return returns[RETURN_COLUMNS]
 
-def create_performance_digest(sections):
-    """Generate PF_IBKR_Performance_Digest.csv"""
+def create_returns_digest(sections, returns=None):
+    """Generate PF_IBKR_Returns_Digest.csv: TWR and XIRR per period, consolidated and per account."""
     
-    print("Creating Performance Digest...")
+    print("Creating Returns Digest...")
     
-    # Extract Key Statistics
-    key_stats = sections.get('Key Statistics', [])
-    perf_data = sections.get('Historical Performance Benchmark Comparison', [])
+    if returns is None:
+        returns = period_returns(sections)
     
-    # Parse key statistics data
-    stats_header = None
-    stats_row = None
+    result = returns.copy()
+    for col in ['startDate', 'endDate']:
+        result[col] = pd.to_datetime(result[col]).dt.strftime('%Y-%m-%d')
+    return result
+
+def create_performance_digest(sections, scipy_check=False, monthly=None, returns=None):
+    """Generate PF_IBKR_Performance_Digest.csv
+
+    Period returns come from the IBKR period table; risk metrics are
+    computed over each period's own trailing window of monthly returns.
+    Periods longer than the available history get no risk metrics.
+    navStart, netFlows and xirr_pct come from the consolidated rows of
+    ``returns`` (see period_returns) when the export has a NAV history.
+    """
     
-    for row in key_stats:
-        if row[1] == 'Header':
-            stats_header = row[2:]
-        elif row[1] == 'Data':
-            stats_row = row[2:]
+    print("Creating Performance Digest...")
+    
+    # Extract Key Statistics
+    key_stats = section_table(sections, 'Key Statistics')
+    period_table = section_table(sections, 'Historical Performance Benchmark Comparison', 'Account')
+    if monthly is None:
+        monthly = monthly_return_series(sections)
+    if returns is None:
+        returns = period_returns(sections)
+    consolidated = returns[returns['account'] == CONSOLIDATED].set_index('period')
     
     # Create mapping of key stats
-    stats_dict = {}
-    if stats_header and stats_row:
-        for i, header in enumerate(stats_header):
-            if i < len(stats_row):
-                try:
-                    stats_dict[header] = float(stats_row[i]) if stats_row[i] not in ['', '-'] else None
-                except:
-                    stats_dict[header] = stats_row[i]
+    stats_dict = key_stats.iloc[0].to_dict() if len(key_stats) > 0 else {}
     
     # Extract period performance data
     period_perf = {}
     benchmark_perf = {}
     
-    for row in perf_data:
-        if row[1] == 'Header' and 'MTD' in row:
-            # Performance by period header
-            perf_header = row[2:]
-        elif row[1] == 'Data' and len(row) > 8:
-            account = row[2]
-            if account == 'SPXTR':  # S&P 500 benchmark
-                benchmark_perf = {perf_header[i]: row[i+3] for i in range(len(perf_header)) if i+3 < len(row)}
-            elif account == 'Consolidated':  # Portfolio performance
-                period_perf = {perf_header[i]: row[i+3] for i in range(len(perf_header)) if i+3 < len(row)}
-    
-    # Extract monthly returns for regression analysis
-    monthly_returns = []
-    benchmark_monthly = []
-    
-    for row in perf_data:
-        if row[1] == 'Data' and len(row) >= 10 and row[2].startswith('2025'):
-            # Monthly data
-            if len(row) >= 10:
-                try:
-                    spy_return = float(row[4]) if row[4] not in ['', '-'] else None
-                    portfolio_return = float(row[9]) if row[9] not in ['', '-'] else None
-                    
-                    if spy_return is not None and portfolio_return is not None:
-                        benchmark_monthly.append(spy_return / 100)
-                        monthly_returns.append(portfolio_return / 100)
-                except:
-                    continue
-    
-    # Calculate alpha and beta via regression
-    alpha_vs_spy = np.nan
-    beta_vs_spy = np.nan
-    
-    if len(monthly_returns) >= 3 and len(benchmark_monthly) >= 3:
-        try:
-            slope, intercept, r_value, p_value, std_err = stats.linregress(benchmark_monthly, monthly_returns)
-            beta_vs_spy = slope
-            alpha_vs_spy = intercept * 12  # Annualize alpha
-        except:
-            pass
-    
-    # Calculate risk metrics
-    if monthly_returns:
-        monthly_std = np.std(monthly_returns)
-        stdev = monthly_std * np.sqrt(12)  # Annualize
+    if len(period_table) > 0:
+        period_rows = period_table.set_index('Account')
+        if 'SPXTR' in period_rows.index:  # S&P 500 benchmark
+            benchmark_perf = period_rows.loc['SPXTR'].to_dict()
+        if 'Consolidated' in period_rows.index:  # Portfolio performance
+            period_perf = period_rows.loc['Consolidated'].to_dict()
+    
+    periods = [short_name for period, short_name in PERIOD_MAPPING.items()
+               if period in period_perf and period in benchmark_perf]
+    
+    # Risk metrics for every period's trailing window in one pass
+    risk = pd.DataFrame(index=periods, columns=['alpha', 'beta', 'sharpe', 'sortino', 'stdev', 'max_drawdown'],
+                        dtype=float)
+    if len(monthly) > 0 and periods:
+        latest_month = monthly['date'].iloc[-1]
+        starts, ends, complete = trailing_windows(
+            len(monthly), [period_window_months(period, latest_month) for period in periods]
+        )
+        metrics = window_metrics(monthly['portfolio'], monthly['benchmark'], starts, ends)
+        drawdowns = window_max_drawdown(monthly['portfolio'], starts, ends)
+        for key in ['alpha', 'beta', 'sharpe', 'sortino', 'stdev']:
+            risk[key] = metrics[key]
+        risk['max_drawdown'] = drawdowns
+        risk.loc[~complete & (risk.index != 'ITD')] = np.nan
         
-        # Assume 3% risk-free rate
-        risk_free_rate = 0.03
-        avg_return = np.mean(monthly_returns) * 12
+        if scipy_check and 'ITD' in risk.index:
+            slope, intercept = regress_vs_benchmark(monthly['benchmark'], monthly['portfolio'], scipy_check)
+            if not np.allclose([slope, intercept * 12], risk.loc['ITD', ['beta', 'alpha']].astype(float)):
+                print("Warning: windowed regression disagrees with the closed-form ITD regression")
+    
+    # Build performance digest records
+    records = []
+    nav_end = stats_dict.get('EndingNAV', np.nan)
+    
+    for period, short_name in PERIOD_MAPPING.items():
+        if short_name not in risk.index:
+            continue
         
-        sharpe = (avg_return - risk_free_rate) / stdev if stdev > 0 else np.nan
+        portfolio_return = pd.to_numeric(period_perf[period], errors='coerce')
+        spy_return = pd.to_numeric(benchmark_perf[period], errors='coerce')
+        outperformance = portfolio_return - spy_return
         
-        # Sortino ratio (downside deviation)
-        downside_returns = [r for r in monthly_returns if r < risk_free_rate/12]
-        if downside_returns:
-            downside_std = np.std(downside_returns) * np.sqrt(12)
-            sortino = (avg_return - risk_free_rate) / downside_std if downside_std > 0 else np.nan
+        # NAV at period start from the NAV history, else implied by the period return
+        if short_name in consolidated.index:
+            nav_start = consolidated.loc[short_name, 'navStart']
+            net_flows = consolidated.loc[short_name, 'netFlows']
+            money_weighted = consolidated.loc[short_name, 'xirr_pct']
         else:
-            sortino = np.nan
-        
-        # Max drawdown calculation (approximated)
-        cumulative = np.cumprod([1 + r for r in monthly_returns])
-        running_max = np.maximum.accumulate(cumulative)
-        drawdowns = (cumulative - running_max) / running_max
-        max_drawdown_pct = np.min(drawdowns) if len(drawdowns) > 0 else np.nan
+            nav_start = nav_end / (1 + portfolio_return/100)
+            net_flows = money_weighted = np.nan
         
-    else:
-        stdev = np.nan
-        sharpe = np.nan
-        sortino = np.nan
-        max_drawdown_pct = np.nan
+        period_risk = risk.loc[short_name]
+        records.append({
+            'period': short_name,
+            'navStart': nav_start,
+            'navEnd': nav_end,
+            'netFlows': net_flows,
+            'return_pct': portfolio_return,
+            'xirr_pct': money_weighted,
+            'alpha_vs_SPY': period_risk['alpha'],
+            'beta_vs_SPY': period_risk['beta'],
+            'sharpe': period_risk['sharpe'],
+            'sortino': period_risk['sortino'],
+            'stdev': period_risk['stdev'],
+            'max_drawdown_pct': period_risk['max_drawdown'],
+            'benchmark_SPY_return': spy_return,
+            'outperformance_pct': outperformance
+        })
     
-    # Build performance digest records
-    records = []
+    return pd.DataFrame(records)
+
+def create_rolling_risk_digest(monthly):
+    """Generate PF_IBKR_Rolling_Risk_Digest.csv
+
+    One row per month and rolling window length (ROLLING_WINDOWS) with the
+    compounded portfolio and SPY returns and the window's risk metrics.
+    """
+    
+    print("Creating Rolling Risk Digest...")
+    
+    frames = []
+    for window in ROLLING_WINDOWS:
+        starts, ends = rolling_windows(len(monthly), window)
+        if len(ends) == 0:
+            continue
+        metrics = window_metrics(monthly['portfolio'], monthly['benchmark'], starts, ends)
+        frames.append(pd.DataFrame({
+            'date': monthly['date'].to_numpy()[ends - 1],
+            'window_months': window,
+            'return_pct': metrics['portfolio_return'] * 100,
+            'benchmark_SPY_return': metrics['benchmark_return'] * 100,
+            'alpha_vs_SPY': metrics['alpha'],
+            'beta_vs_SPY': metrics['beta'],
+            'sharpe': metrics['sharpe'],
+            'sortino': metrics['sortino'],
+            'stdev': metrics['stdev'],
+            'max_drawdown_pct': rolling_max_drawdown(monthly['portfolio'], window),
+        }))
     
-    # Define periods and their mappings
-    period_mapping = {
-        'MTD': 'MTD',
-        'QTD': 'QTD', 
-        'YTD': 'YTD',
-        '1 Year': '1Y',
-        '3 Year': '3Y',
-        '5 Year': '5Y',
-        '10 Year': '10Y',
-        'Since Inception': 'ITD'
+    if not frames:
+        return pd.DataFrame(columns=['date', 'window_months', 'return_pct', 'benchmark_SPY_return', 'alpha_vs_SPY',
+                                     'beta_vs_SPY', 'sharpe', 'sortino', 'stdev', 'max_drawdown_pct'])
+    
+    return pd.concat(frames, ignore_index=True).sort_values(['window_months', 'date'], ignore_index=True)
+
+def fx_rate_table(sections, rate_file=None):
+    """Build the FX rate table from the export's position rates and an optional local rate file.
+
+    Open Position Summary gives every held currency's FXRateToBase on the
+    report date; ``rate_file`` (see fx_rates.read_rate_file) adds history.
+    Export rates win over the file's on the same date.
+    """
+    
+    intro = section_table(sections, 'Introduction')
+    base = BASE_CURRENCY
+    if 'BaseCurrency' in intro.columns and len(intro) and pd.notna(intro['BaseCurrency'].iloc[0]):
+        base = str(intro['BaseCurrency'].iloc[0]).strip()
+    
+    sources = []
+    positions = section_table(sections, 'Open Position Summary')
+    if {'Date', 'Currency', 'FXRateToBase'} <= set(positions.columns):
+        sources.append(rate_frame(
+            pd.to_datetime(positions['Date'], format='%m/%d/%Y', errors='coerce'),
+            positions['Currency'], positions['FXRateToBase'],
+        ))
+    if rate_file:
+        sources.append(read_rate_file(rate_file))
+    
+    return RateTable(*sources, base=base)
+
+def build_positions_frame(sections, fx=None, compact=False):
+    """Parse Open Position Summary once into a typed frame shared by the digests.
+
+    Subtotal rows are dropped, missing fields defaulted, and CAD values,
+    unrealized gain %, portfolio weights and contributions are computed as
+    column operations. Values are converted with the as-of rates of ``fx``
+    (built from the export when not given). With ``compact`` the label
+    columns are built as categoricals.
+    """
+    
+    positions = section_table(sections, 'Open Position Summary')
+    if len(positions) == 0:
+        return pd.DataFrame(columns=POSITION_COLUMNS)
+    
+    positions = positions[positions['Date'] != 'Total']
+    fx = fx or fx_rate_table(sections)
+    
+    symbol = fill_labels(positions['Symbol'], 'CASH')
+    currency = positions['Currency']
+    cost_basis = positions['Cost Basis'].fillna(0).astype(float)
+    unrealized_pnl = positions['UnrealizedP&L'].fillna(0).astype(float)
+    
+    # Convert to CAD
+    is_cad = currency == fx.base
+    values = fx.to_base(
+        pd.DataFrame({
+            'Date': pd.to_datetime(positions['Date'], format='%m/%d/%Y', errors='coerce'),
+            'currency': currency,
+            'marketValue_CAD': positions['Value'].fillna(0).astype(float),
+            'costBasis_CAD': cost_basis,
+        }),
+        ['marketValue_CAD', 'costBasis_CAD'],
+    )
+    
+    # Calculate unrealized gain %
+    safe_cost = cost_basis.where(cost_basis != 0)
+    unrealized_gain_pct = (unrealized_pnl / safe_cost * 100).fillna(0)
+    
+    labels = {
+        'ticker': symbol,
+        'securityName': fill_labels(positions['Description'], symbol.astype(object)),
+        'sector': fill_labels(positions['Sector'], 'Cash'),
+        'accountType': pd.Series('All', index=positions.index),  # Could extract from account mapping if needed
+        'currency': currency,
+        'country': pd.Series(np.where(is_cad, 'Canada', 'United States'), index=positions.index),  # Simplified
+        'assetClass': pd.Series(np.where(positions['FinancialInstrument'] == 'Cash', 'Cash', 'Equity'),
+                                index=positions.index),
     }
+    if compact:
+        labels = {col: as_category(values, col) for col, values in labels.items()}
     
-    for period, short_name in period_mapping.items():
-        if period in period_perf and period in benchmark_perf:
-            try:
-                portfolio_return = float(period_perf[period]) if period_perf[period] not in ['', '-'] else np.nan
-                spy_return = float(benchmark_perf[period]) if benchmark_perf[period] not in ['', '-'] else np.nan
-                
-                outperformance = portfolio_return - spy_return if not (np.isnan(portfolio_return) or np.isnan(spy_return)) else np.nan
-                
-                # Get NAV values (approximated)
-                nav_end = stats_dict.get('EndingNAV', np.nan)
-                nav_start = nav_end / (1 + portfolio_return/100) if not np.isnan(portfolio_return) and not np.isnan(nav_end) else np.nan
-                
-                # Only include calculated risk metrics for longer periods
-                period_sharpe = sharpe if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                period_sortino = sortino if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                period_stdev = stdev if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                period_alpha = alpha_vs_spy if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                period_beta = beta_vs_spy if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                period_drawdown = max_drawdown_pct if period in ['1 Year', '3 Year', '5 Year', '10 Year', 'Since Inception'] else np.nan
-                
-                records.append({
-                    'period': short_name,
-                    'navStart': nav_start,
-                    'navEnd': nav_end,
-                    'return_pct': portfolio_return,
-                    'alpha_vs_SPY': period_alpha,
-                    'beta_vs_SPY': period_beta,
-                    'sharpe': period_sharpe,
-                    'sortino': period_sortino,
-                    'stdev': period_stdev,
-                    'max_drawdown_pct': period_drawdown,
-                    'benchmark_SPY_return': spy_return,
-                    'outperformance_pct': outperformance
-                })
-                
-            except:
-                continue
+    df = pd.DataFrame({
+        **labels,
+        'quantity': positions['Quantity'].fillna(0).astype(float),
+        'marketValue_CAD': values['marketValue_CAD'],
+        'costBasis_CAD': values['costBasis_CAD'],
+        'unrealized_gain_pct': unrealized_gain_pct,
+    }).reset_index(drop=True)
     
-    return pd.DataFrame(records)
+    # Calculate weights and contribution to total return
+    total_value = df['marketValue_CAD'].sum()
+    df['weight_pct'] = (df['marketValue_CAD'] / total_value * 100) if total_value > 0 else 0
+    df['contribution_to_total_return_pct'] = df['weight_pct'] * df['unrealized_gain_pct'] / 100
+    
+    return df[POSITION_COLUMNS]
+
+def create_allocation_digest(positions, yields=None):
+    """Generate PF_IBKR_Allocation_Digest.csv
 
-def create_allocation_digest(sections):
-    """Generate PF_IBKR_Allocation_Digest.csv"""
+    ``yields`` are the trailing dividend yields from dividend_yields,
+    joined onto the positions by ticker.
+    """
     
     print("Creating Allocation Digest...")
     
-    # Extract Open Position Summary
-    positions = sections.get('Open Position Summary', [])
+    columns = ['ticker', 'securityName', 'sector', 'accountType', 'marketValue_CAD',
+               'weight_pct', 'unrealized_gain_pct', 'dividendYield', 'country', 'assetClass']
     
-    records = []
+    if len(positions) == 0:
+        return pd.DataFrame(columns=columns)
     
-    for row in positions:
-        if row[1] == 'Data' and len(row) >= 13 and row[2] != 'Total':
-            try:
-                # Parse position data
-                date = row[2]
-                instrument_type = row[3]
-                currency = row[4]
-                symbol = row[5] if row[5] else 'CASH'
-                description = row[6] if row[6] else symbol
-                sector = row[7] if row[7] else 'Cash'
-                quantity = float(row[8]) if row[8] and row[8] != '' else 0
-                close_price = float(row[9]) if row[9] and row[9] != '' else 0
-                market_value = float(row[10]) if row[10] and row[10] != '' else 0
-                cost_basis = float(row[11]) if row[11] and row[11] != '' else 0
-                unrealized_pnl = float(row[12]) if row[12] and row[12] != '' else 0
-                fx_rate = float(row[13]) if row[13] and row[13] != '' else 1
-                
-                # Convert to CAD
-                market_value_cad = market_value * fx_rate if currency != 'CAD' else market_value
-                cost_basis_cad = cost_basis * fx_rate if currency != 'CAD' else cost_basis
-                
-                # Calculate unrealized gain %
-                unrealized_gain_pct = (unrealized_pnl / cost_basis * 100) if cost_basis != 0 else 0
-                
-                # Determine asset class
-                asset_class = 'Cash' if instrument_type == 'Cash' else 'Equity'
-                
-                # Determine country (simplified)
-                country = 'Canada' if currency == 'CAD' else 'United States'
-                
-                records.append({
-                    'ticker': symbol,
-                    'securityName': description,
-                    'sector': sector,
-                    'accountType': 'All',  # Could extract from account mapping if needed
-                    'marketValue_CAD': market_value_cad,
-                    'weight_pct': 0,  # Will calculate after getting total
-                    'unrealized_gain_pct': unrealized_gain_pct,
-                    'dividendYield': '',  # Not available in this data
-                    'country': country,
-                    'assetClass': asset_class
-                })
-                
-            except Exception as e:
-                continue
+    if yields is None:
+        yields = pd.Series(dtype=float)
+    df = positions.join(yields.rename('dividendYield'), on='ticker')[columns]
     
-    df = pd.DataFrame(records)
+    # Sort by weight descending
+    df = df.sort_values('weight_pct', ascending=False)
     
-    if len(df) > 0:
-        # Calculate weights
-        total_value = df['marketValue_CAD'].sum()
-        df['weight_pct'] = (df['marketValue_CAD'] / total_value * 100) if total_value > 0 else 0
-        
-        # Sort by weight descending
-        df = df.sort_values('weight_pct', ascending=False)
-        
-        # Add aggregate rows by asset class
-        asset_classes = df['assetClass'].unique()
-        aggregate_rows = []
-        
-        for asset_class in asset_classes:
-            subset = df[df['assetClass'] == asset_class]
-            total_value = subset['marketValue_CAD'].sum()
-            total_weight = subset['weight_pct'].sum()
-            
-            aggregate_rows.append({
-                'ticker': f'TOTAL_{asset_class.upper()}',
-                'securityName': f'Total {asset_class}',
-                'sector': 'Aggregate',
-                'accountType': 'All',
-                'marketValue_CAD': total_value,
-                'weight_pct': total_weight,
-                'unrealized_gain_pct': '',
-                'dividendYield': '',
-                'country': 'Multiple',
-                'assetClass': f'Total_{asset_class}'
-            })
-        
-        # Append aggregates
-        aggregate_df = pd.DataFrame(aggregate_rows)
-        df = pd.concat([df, aggregate_df], ignore_index=True)
+    # Add aggregate rows by asset class
+    totals = df.groupby('assetClass', sort=False, observed=True)[['marketValue_CAD', 'weight_pct']].sum()
+    totals.index = totals.index.astype(str)
+    asset_classes = totals.index.to_series()
     
-    return df
+    aggregate_df = pd.DataFrame({
+        'ticker': 'TOTAL_' + asset_classes.str.upper(),
+        'securityName': 'Total ' + asset_classes,
+        'sector': 'Aggregate',
+        'accountType': 'All',
+        'marketValue_CAD': totals['marketValue_CAD'],
+        'weight_pct': totals['weight_pct'],
+        'unrealized_gain_pct': '',
+        'dividendYield': '',
+        'country': 'Multiple',
+        'assetClass': 'Total_' + asset_classes,
+    })
+    
+    # Append aggregates
+    return pd.concat([df, aggregate_df], ignore_index=True)
 
-def create_position_digest(sections):
+def create_position_digest(positions):
     """Generate PF_IBKR_Position_Digest.csv"""
     
     print("Creating Position Digest...")
     
-    # For this digest, we'll use current positions and estimate 12-month returns
+    columns = ['rank', 'ticker', 'securityName', 'accountType', 'marketValue_CAD',
+               'weight_pct', '12m_return_pct', 'unrealized_gain_pct', 'contribution_to_total_return_pct']
+    
+    if len(positions) == 0:
+        return pd.DataFrame(columns=columns)
+    
+    # For this digest, we estimate 12-month returns from unrealized gain
     # In a real implementation, you'd have historical performance by symbol data
+    df = positions.assign(**{'12m_return_pct': positions['unrealized_gain_pct']})
     
-    positions = sections.get('Open Position Summary', [])
+    # Sort by 12-month return descending and take top 25
+    top_performers = df.sort_values('12m_return_pct', ascending=False).head(25)
     
-    records = []
+    # Sort by 12-month return ascending and take bottom 10
+    bottom_performers = df.sort_values('12m_return_pct', ascending=True).head(10)
     
-    for row in positions:
-        if row[1] == 'Data' and len(row) >= 13 and row[2] != 'Total':
-            try:
-                symbol = row[5] if row[5] else 'CASH'
-                description = row[6] if row[6] else symbol
-                currency = row[4]
-                market_value = float(row[10]) if row[10] and row[10] != '' else 0
-                cost_basis = float(row[11]) if row[11] and row[11] != '' else 0
-                fx_rate = float(row[13]) if row[13] and row[13] != '' else 1
-                
-                # Convert to CAD
-                market_value_cad = market_value * fx_rate if currency != 'CAD' else market_value
-                
-                # Estimate 12-month return from unrealized gain (approximation)
-                unrealized_pnl = float(row[12]) if row[12] and row[12] != '' else 0
-                twelve_month_return = (unrealized_pnl / cost_basis * 100) if cost_basis != 0 else 0
-                
-                records.append({
-                    'ticker': symbol,
-                    'securityName': description,
-                    'accountType': 'All',
-                    'marketValue_CAD': market_value_cad,
-                    'weight_pct': 0,  # Will calculate after getting total
-                    '12m_return_pct': twelve_month_return,
-                    'unrealized_gain_pct': twelve_month_return,  # Same as above for this data
-                    'contribution_to_total_return_pct': 0  # Will calculate after weights
-                })
-                
-            except:
-                continue
+    # Combine and remove duplicates
+    combined = pd.concat([top_performers, bottom_performers]).drop_duplicates(subset=['ticker'])
     
-    df = pd.DataFrame(records)
+    # Re-rank
+    combined = combined.reset_index(drop=True)
+    combined['rank'] = range(1, len(combined) + 1)
     
-    if len(df) > 0:
-        # Calculate weights
-        total_value = df['marketValue_CAD'].sum()
-        df['weight_pct'] = (df['marketValue_CAD'] / total_value * 100) if total_value > 0 else 0
-        
-        # Calculate contribution to total return
-        df['contribution_to_total_return_pct'] = df['weight_pct'] * df['12m_return_pct'] / 100
-        
-        # Sort by 12-month return descending and take top 25
-        top_performers = df.sort_values('12m_return_pct', ascending=False).head(25)
-        
-        # Sort by 12-month return ascending and take bottom 10
-        bottom_performers = df.sort_values('12m_return_pct', ascending=True).head(10)
-        
-        # Combine and remove duplicates
-        combined = pd.concat([top_performers, bottom_performers]).drop_duplicates(subset=['ticker'])
+    # Reorder columns
+    return combined[columns]
+
+# Columns of PF_IBKR_Symbol_Digest.csv
+SYMBOL_COLUMNS = [
+    'level', 'ticker', 'securityName', 'financialInstrument', 'sector', 'open', 'avgWeight_pct', 'return_pct',
+    'contribution_pct', 'months_held', 'stdev', 'sharpe', 'beta_vs_SPY', 'alpha_vs_SPY', 'max_drawdown_pct',
+    'unrealizedPnL', 'realizedPnL',
+]
+
+# Instrument classes below this share of NAV at the start of a month get no return for it
+MIN_INSTRUMENT_WEIGHT = 0.01
+
+def monthly_rows(table):
+    """Index a Date-keyed monthly section by month start, dropping Total rows."""
+    
+    table = table[table['Date'].astype(str).str.fullmatch(r'\d{6}')]
+    index = pd.to_datetime(table['Date'].astype(str), format='%Y%m')
+    return table.drop(columns='Date').set_index(index).apply(pd.to_numeric, errors='coerce')
+
+def instrument_return_matrix(sections):
+    """Monthly returns of each financial instrument class as an (instruments x months) matrix.
+
+    Performance by Financial Instrument gives each class's monthly
+    contribution to portfolio return; dividing it by the class's share of
+    NAV at the start of the month (Allocation by Financial Instrument) gives
+    the class's own return. Returns (instrument names, month dates, matrix).
+    """
+    
+    contributions = section_table(sections, 'Performance by Financial Instrument')
+    allocation = section_table(sections, 'Allocation by Financial Instrument')
+    if len(contributions) == 0 or len(allocation) == 0 or 'NAV' not in allocation.columns:
+        return [], pd.DatetimeIndex([]), np.empty((0, 0))
+    
+    contributions = monthly_rows(contributions)
+    allocation = monthly_rows(allocation)
+    instruments = [col for col in contributions.columns if col in allocation.columns]
+    
+    # A month's starting weight is the previous month-end weight
+    weights = allocation[instruments].div(allocation['NAV'], axis=0).shift(1).reindex(contributions.index)
+    returns = (contributions[instruments] / 100) / weights.where(weights >= MIN_INSTRUMENT_WEIGHT)
+    
+    return instruments, returns.index, returns.to_numpy().T
+
+def create_symbol_digest(sections, monthly=None):
+    """Generate PF_IBKR_Symbol_Digest.csv
+
+    One row for the whole portfolio, one per financial instrument class and
+    one per symbol in Performance by Symbol. Period return, contribution,
+    average weight and P&L come from the export for every row. Risk metrics
+    (stdev, Sharpe, beta/alpha vs SPY, drawdown) are computed for all rows
+    of the instrument x month return matrix at once; the export has no
+    monthly series per symbol, so symbol rows carry period figures only.
+    """
+    
+    print("Creating Symbol Digest...")
+    
+    performance = section_table(sections, 'Performance by Symbol')
+    if len(performance) == 0:
+        return pd.DataFrame(columns=SYMBOL_COLUMNS)
+    if monthly is None:
+        monthly = monthly_return_series(sections)
+    
+    symbol = performance['Symbol'].astype(str)
+    is_total = symbol.str.startswith('Total')
+    level = np.select([symbol == 'Total', is_total], ['portfolio', 'instrument'], 'symbol')
+    ticker = symbol.where(~is_total, symbol.str.replace(r'^Total ?', '', regex=True)).replace('', 'Total')
+    
+    df = pd.DataFrame({
+        'level': level,
+        'ticker': ticker,
+        'securityName': performance['Description'],
+        'financialInstrument': performance['FinancialInstrument'].astype(object).where(level != 'instrument', ticker),
+        'sector': performance['Sector'],
+        'open': performance['Open'],
+        'avgWeight_pct': pd.to_numeric(performance['AvgWeight'], errors='coerce'),
+        'return_pct': pd.to_numeric(performance['Return'], errors='coerce'),
+        'contribution_pct': pd.to_numeric(performance['Contribution'], errors='coerce'),
+        'unrealizedPnL': pd.to_numeric(performance['Unrealized_P&L'], errors='coerce'),
+        'realizedPnL': pd.to_numeric(performance['Realized_P&L'], errors='coerce'),
+    })
+    
+    # Risk metrics for the portfolio and every instrument class in one matrix pass
+    instruments, months, matrix = instrument_return_matrix(sections)
+    benchmark = monthly.set_index('date')['benchmark']
+    portfolio = monthly.set_index('date')['portfolio']
+    if len(months) == 0:
+        months = portfolio.index
+        matrix = np.empty((0, len(months)))
+    rows = np.vstack([portfolio.reindex(months).to_numpy(), matrix])
+    metrics = matrix_metrics(rows, benchmark.reindex(months).to_numpy())
+    
+    risk = pd.DataFrame({
+        'months_held': metrics['months'],
+        'stdev': metrics['stdev'],
+        'sharpe': metrics['sharpe'],
+        'beta_vs_SPY': metrics['beta'],
+        'alpha_vs_SPY': metrics['alpha'],
+        'max_drawdown_pct': metrics['max_drawdown'],
+    }, index=pd.MultiIndex.from_tuples([('portfolio', 'Total')] + [('instrument', name) for name in instruments]))
+    df = df.join(risk, on=['level', 'ticker'])
+    df['months_held'] = df['months_held'].astype('Int64')
+    
+    # Portfolio first, then instrument classes, then symbols by contribution
+    order = df['level'].map({'portfolio': 0, 'instrument': 1, 'symbol': 2})
+    df = df.assign(_order=order).sort_values(['_order', 'contribution_pct'], ascending=[True, False])
+    return df[SYMBOL_COLUMNS].reset_index(drop=True)
+
+# Columns of PF_IBKR_Exposure_Digest.csv
+EXPOSURE_COLUMNS = [
+    'level', 'name', 'description', 'sector', 'rank', 'value_CAD', 'weight_pct', 'count', 'top5_pct', 'top10_pct',
+    'hhi', 'effective_count', 'overlap_pct', 'esg_score',
+]
+
+# Issuers listed individually in the Exposure Digest
+TOP_ISSUERS = 25
+
+# Concentration's name for the part of an issuer's exposure held directly
+DIRECT_HOLDING = 'Self'
+
+def subsection_table(sections, section_name, subsection):
+    """Return the rows of one SubSection (e.g. Concentration Holdings) from whichever block holds them."""
+    
+    for table in sections.get(section_name, []):
+        if 'SubSection' in table.columns:
+            rows = table[table['SubSection'] == subsection]
+            if len(rows):
+                return rows.drop(columns='SubSection').reset_index(drop=True)
+    
+    return pd.DataFrame()
+
+def look_through_exposures(sections):
+    """Flatten Concentration Holdings into one row per (issuer, holding) pair.
+
+    Each issuer row (the only rows with parsed weights) is followed by the
+    holdings its exposure comes through: 'Self' for the direct position and
+    a fund symbol for each ETF. Issuers without such rows are held directly.
+    """
+    
+    holdings = subsection_table(sections, 'Concentration', 'Holdings')
+    if len(holdings) == 0:
+        return pd.DataFrame(columns=['issuer', 'description', 'sector', 'holding', 'holdingName', 'value'])
+    
+    holdings = holdings[holdings['Symbol'].astype(str).str.strip() != 'Total']
+    is_issuer = holdings['LongParsedWeight'].notna().to_numpy()
+    issuer_row = np.flatnonzero(is_issuer)[np.cumsum(is_issuer) - 1]
+    issuers = holdings.iloc[issuer_row].reset_index(drop=True)
+    
+    # Issuer rows stand in for their own direct holding when nothing is listed under them
+    has_holdings = np.bincount(issuer_row, weights=~is_issuer, minlength=len(holdings)) > 0
+    keep = ~is_issuer | ~has_holdings[issuer_row]
+    holding = holdings['Symbol'].astype(str).str.strip().where(~is_issuer, DIRECT_HOLDING).to_numpy()
+    
+    return pd.DataFrame({
+        'issuer': issuers['Symbol'].astype(str).str.strip(),
+        'description': issuers['Description'],
+        'sector': issuers['Sector'],
+        'holding': holding,
+        'holdingName': np.where(holding == DIRECT_HOLDING, 'Direct holdings', holdings['Description']),
+        'value': holdings['NetValue'].fillna(0).to_numpy(),
+    })[keep].reset_index(drop=True)
+
+def esg_scores(sections):
+    """ESG score per symbol from ESG HoldingsAnalysis."""
+    
+    analysis = subsection_table(sections, 'ESG', 'HoldingsAnalysis')
+    # The score column shares the section's name, so pandas suffixes it on read
+    analysis = analysis.rename(columns={'ESG.1': 'ESG'})
+    if len(analysis) == 0 or 'ESG' not in analysis.columns:
+        return pd.Series(dtype=float)
+    
+    symbols = analysis['Symbol'].astype(str).str.strip()
+    return pd.to_numeric(analysis['ESG'], errors='coerce').groupby(symbols.to_numpy()).first()
+
+def create_exposure_digest(sections):
+    """Generate PF_IBKR_Exposure_Digest.csv
+
+    Look-through concentration from the Concentration and ESG sections.
+    'portfolio' rows give the concentration across issuers, holdings,
+    sectors and regions (count, top-5/top-10 share, HHI, effective count).
+    'holding' and 'sector' rows give the same measures across the issuers
+    within each group, 'region' rows the region weights, 'issuer' rows the
+    TOP_ISSUERS largest issuers and 'overlap' rows the issuer overlap
+    between each pair of holdings. ESG scores are weight-averaged over the
+    covered exposure.
+    """
+    
+    print("Creating Exposure Digest...")
+    
+    exposures = look_through_exposures(sections)
+    if len(exposures) == 0:
+        return pd.DataFrame(columns=EXPOSURE_COLUMNS)
+    
+    total_value = exposures['value'].sum()
+    exposures['weight'] = exposures['value'] / total_value * 100
+    exposures['esg'] = exposures['issuer'].map(esg_scores(sections))
+    index = ExposureIndex(exposures, ['issuer', 'holding', 'sector'])
+    
+    # ESG averaged over the exposure each group has scores for
+    scored = exposures['esg'].notna().to_numpy()
+    esg_weight = np.where(scored, index.weights, 0)
+    esg_sum = np.where(scored, index.weights * exposures['esg'].fillna(0).to_numpy(), 0)
+    
+    def group_esg(key):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return index.totals(key, esg_sum) / index.totals(key, esg_weight)
+    
+    def rows(level, stats, ranked=True, **columns):
+        if ranked:
+            stats = stats.sort_values('weight', ascending=False)
+        df = pd.DataFrame({
+            'level': level,
+            'name': stats.index,
+            'rank': np.arange(1, len(stats) + 1) if ranked else pd.NA,
+            'value_CAD': stats['weight'].to_numpy() * total_value / 100,
+            'weight_pct': stats['weight'].to_numpy(),
+        })
+        stats = stats.rename(columns={'members': 'count'})
+        for col in ['count', 'top5_pct', 'top10_pct', 'hhi', 'effective_count']:
+            if col in stats.columns:
+                df[col] = stats[col].to_numpy()
+        for col, values in columns.items():
+            df[col] = values.reindex(stats.index).to_numpy()
+        return df
+    
+    # Issuer concentration within each holding and sector
+    holdings = index.concentration('holding', 'issuer')
+    sectors = index.concentration('sector', 'issuer')
+    
+    regions = subsection_table(sections, 'Concentration', 'Region Allocation')
+    if len(regions):
+        region_weights = regions[regions['Region'] != 'Total'].set_index('Region')['LongParsedWeight'].astype(float)
+    else:
+        region_weights = pd.Series(dtype=float)
+    
+    # Concentration across the groups of each dimension
+    portfolio = pd.DataFrame.from_dict({
+        'issuer': index.concentration(None, 'issuer').iloc[0],
+        'holding': weight_concentration(holdings['weight']),
+        'sector': weight_concentration(sectors['weight']),
+        'region': weight_concentration(region_weights),
+    }, orient='index')
+    with np.errstate(divide='ignore', invalid='ignore'):
+        portfolio_esg = pd.Series({'issuer': esg_sum.sum() / esg_weight.sum()})
+    
+    # Largest issuers, with the number of holdings each comes through
+    issuer_info = exposures.drop_duplicates('issuer').set_index('issuer')
+    issuer_stats = pd.DataFrame({
+        'weight': index.totals('issuer'),
+        'members': index.concentration('issuer', 'holding')['members'],
+    }).nlargest(TOP_ISSUERS, 'weight')
+    
+    holding_names = exposures.drop_duplicates('holding').set_index('holding')['holdingName']
+    overlap = index.overlap('holding', 'issuer')
+    overlap_df = pd.DataFrame({
+        'level': 'overlap',
+        'name': overlap['left'] + ' & ' + overlap['right'],
+        'count': overlap['shared_members'],
+        'overlap_pct': overlap['overlap_pct'],
+    }).sort_values('overlap_pct', ascending=False)
+    
+    df = pd.concat([
+        rows('portfolio', portfolio, ranked=False, esg_score=portfolio_esg),
+        rows('holding', holdings, description=holding_names, esg_score=group_esg('holding')),
+        rows('sector', sectors, esg_score=group_esg('sector')),
+        rows('region', pd.DataFrame({'weight': region_weights})),
+        rows('issuer', issuer_stats, description=issuer_info['description'], sector=issuer_info['sector'],
+             esg_score=group_esg('issuer')),
+        overlap_df,
+    ], ignore_index=True)
+    
+    for col in ['rank', 'count']:
+        df[col] = df[col].astype('Int64')
+    return df.reindex(columns=EXPOSURE_COLUMNS)
+
+# Columns of PF_IBKR_Income_Digest.csv
+INCOME_COLUMNS = [
+    'level', 'period', 'account', 'ticker', 'dividends_CAD', 'interest_CAD', 'income_CAD', 'dividendYield_pct',
+    'frequency', 'projectedAnnual_CAD', 'projectedRemaining_CAD', 'projectedYield_pct',
+]
+
+# Period label of the trailing-12-month rows of the Income Digest
+TRAILING_YEAR = 'TTM'
+
+def income_history(sections):
+    """Dividend and interest payments (CAD) from the Dividends and Interest Details sections.
+
+    Returns one row per payment in date order: date, account, ticker (None
+    for interest), kind ('dividends' or 'interest'), amount and, for
+    dividends, perShare, the amount over the shares paid on (unrounded and
+    in CAD, unlike DividendPerShare).
+    """
+    
+    def pay_dates(values):
+        return pd.to_datetime(values.astype(str).str[:8], format='%Y%m%d', errors='coerce')
+    
+    frames = [pd.DataFrame({'date': pd.to_datetime([]), 'account': [], 'ticker': [], 'kind': [], 'amount': [],
+                            'perShare': []})]
+    
+    dividends = section_table(sections, 'Dividends')
+    if {'PayDate', 'Account', 'Symbol', 'Quantity', 'Amount'} <= set(dividends.columns):
+        amount = pd.to_numeric(dividends['Amount'], errors='coerce')
+        quantity = pd.to_numeric(dividends['Quantity'], errors='coerce')
+        frames.append(pd.DataFrame({
+            'date': pay_dates(dividends['PayDate']),
+            'account': dividends['Account'].astype(str),
+            'ticker': dividends['Symbol'].astype(str),
+            'kind': 'dividends',
+            'amount': amount,
+            'perShare': amount / quantity.where(quantity != 0),
+        }))
+    
+    interest = section_table(sections, 'Interest Details')
+    if {'Date', 'Account', 'Amount'} <= set(interest.columns):
+        frames.append(pd.DataFrame({
+            'date': pay_dates(interest['Date']),
+            'account': interest['Account'].astype(str),
+            'ticker': None,
+            'kind': 'interest',
+            'amount': pd.to_numeric(interest['Amount'], errors='coerce'),
+            'perShare': np.nan,
+        }))
+    
+    income = pd.concat(frames, ignore_index=True).dropna(subset=['date', 'amount'])
+    return income.sort_values('date', kind='stable', ignore_index=True)
+
+def trailing_year(income, end_date=None):
+    """Payments in the 12 months up to ``end_date`` (default: the latest payment)."""
+    
+    if pd.isna(end_date):
+        end_date = income['date'].max()
+    return income[(income['date'] > end_date - pd.DateOffset(years=1)) & (income['date'] <= end_date)]
+
+def dividend_yields(income, positions, end_date=None):
+    """Trailing-12-month dividend yield (%) of every held ticker that paid one, indexed by ticker.
+
+    The dividends per share paid in the 12 months to ``end_date`` (once
+    per pay date: every account is paid the same per share) over the
+    position's CAD price per share.
+    """
+    
+    dividends = trailing_year(income, end_date)
+    dividends = dividends[dividends['kind'] == 'dividends']
+    per_share = dividends.groupby(['ticker', 'date'])['perShare'].mean().groupby(level='ticker').sum()
+    
+    held = positions.groupby(positions['ticker'].astype(str))[['marketValue_CAD', 'quantity']].sum()
+    price = held['marketValue_CAD'] / held['quantity'].where(held['quantity'] > 0)
+    
+    yields = (per_share / price * 100).dropna()
+    yields.index.name = 'ticker'
+    return yields
+
+def projected_income(sections):
+    """Forward income per symbol from Projected Income, indexed by ticker (Total rows dropped)."""
+    
+    table = section_table(sections, 'Projected Income')
+    if not {'Financial Instrument', 'Symbol', 'Estimated Annual Income'} <= set(table.columns):
+        return pd.DataFrame(columns=['frequency', 'projectedAnnual_CAD', 'projectedRemaining_CAD',
+                                     'projectedYield_pct'])
+    
+    table = table[table['Financial Instrument'].notna() & table['Symbol'].notna()]
+    
+    # e.g. "Estimated 2025 Remaining Income"
+    remaining = next((col for col in table.columns if col.endswith('Remaining Income')), None)
+    projected = pd.DataFrame({
+        'frequency': pd.to_numeric(table['Frequency'], errors='coerce'),
+        'projectedAnnual_CAD': pd.to_numeric(table['Estimated Annual Income'], errors='coerce'),
+        'projectedRemaining_CAD': pd.to_numeric(table[remaining], errors='coerce') if remaining else np.nan,
+        'projectedYield_pct': pd.to_numeric(table['Current Yield %'], errors='coerce'),
+    })
+    return projected.set_index(table['Symbol'].astype(str).rename('ticker'))
+
+def create_income_digest(sections, positions=None, income=None, yields=None):
+    """Generate PF_IBKR_Income_Digest.csv
+
+    'total' and 'ticker' rows cover the trailing 12 months to the end of
+    the analysis period: dividends and interest received, the dividend
+    yield of the current holdings (per ticker, and value-weighted across
+    all positions) and IBKR's forward projection. 'month' rows give the
+    income received per month and account, with an ALL_ACCOUNTS row per
+    month.
+    """
+    
+    print("Creating Income Digest...")
+    
+    if income is None:
+        income = income_history(sections)
+    if positions is None:
+        positions = build_positions_frame(sections)
+    end_date = analysis_period(sections)[1]
+    if yields is None:
+        yields = dividend_yields(income, positions, end_date)
+    
+    kinds = ['dividends', 'interest']
+    
+    def income_columns(table):
+        table = table.reindex(columns=kinds, fill_value=0).fillna(0)
+        return table.rename(columns=lambda kind: f'{kind}_CAD').assign(income_CAD=table.sum(axis=1))
+    
+    # Income by month and account, then across accounts
+    by_account = income.pivot_table(index=[income['date'].dt.strftime('%Y-%m').rename('period'), 'account'],
+                                    columns='kind', values='amount', aggfunc='sum')
+    by_month = by_account.groupby(level='period').sum().assign(account=ALL_ACCOUNTS).set_index('account', append=True)
+    months = income_columns(pd.concat([by_account, by_month])).reset_index().sort_values('period', kind='stable')
+    
+    # Trailing-year income per ticker, joined with the yields and projections by ticker
+    ttm = trailing_year(income, end_date)
+    projected = projected_income(sections)
+    tickers = pd.DataFrame({
+        'dividends_CAD': ttm[ttm['kind'] == 'dividends'].groupby('ticker')['amount'].sum(),
+        'dividendYield_pct': yields,
+    }).join(projected, how='outer')
+    tickers['income_CAD'] = tickers['dividends_CAD']
+    tickers = tickers.rename_axis('ticker').reset_index().sort_values(
+        ['dividends_CAD', 'projectedAnnual_CAD'], ascending=False, na_position='last', kind='stable')
+    
+    # Portfolio yield: the per-ticker yields weighted by value across every position
+    values = positions.groupby(positions['ticker'].astype(str))['marketValue_CAD'].sum()
+    total_value = values.sum()
+    total = income_columns(ttm.groupby('kind')['amount'].sum().to_frame().T).assign(
+        dividendYield_pct=(yields.reindex(values.index).fillna(0) * values).sum() / total_value
+        if total_value > 0 else np.nan,
+        projectedAnnual_CAD=projected['projectedAnnual_CAD'].sum(),
+        projectedRemaining_CAD=projected['projectedRemaining_CAD'].sum(),
+    )
+    
+    df = pd.concat([
+        total.assign(level='total', period=TRAILING_YEAR, account=ALL_ACCOUNTS),
+        tickers.assign(level='ticker', period=TRAILING_YEAR, account=ALL_ACCOUNTS),
+        months.assign(level='month'),
+    ], ignore_index=True)
+    df['frequency'] = df['frequency'].astype('Int64')
+    return df.reindex(columns=INCOME_COLUMNS)
+
+# Cashflow categorization rules in precedence order: the first rule with a
+# keyword found in any of its columns (case-insensitive) wins
+CASHFLOW_RULES = [
+    ('deposits', {'Transaction Type': ['deposit'], 'Description': ['deposit']}),
+    ('withdrawals', {'Transaction Type': ['withdrawal'], 'Description': ['withdrawal']}),
+    ('dividends', {'Transaction Type': ['dividend'], 'Description': ['dividend']}),
+    ('interest', {'Transaction Type': ['interest'], 'Description': ['interest']}),
+    ('fees', {'Transaction Type': ['commission', 'fee'], 'Description': ['commission']}),
+]
+
+def lowered_labels(values):
+    """Distinct lowercase labels of a text column and each row's position among them."""
+    
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Missing values (code -1) take the trailing 'nan' label, as astype(str) gives them
+        labels = values.cat.categories.astype(str).append(pd.Index(['nan']))
+        return labels.str.lower(), values.cat.codes.to_numpy()
+    
+    codes, labels = pd.factorize(values.astype(str))
+    return pd.Index(labels).str.lower(), codes
+
+def categorize_transactions(df, rules=CASHFLOW_RULES, default='other', compact=False):
+    """Assign a cashflow category to every transaction with vectorized regex matches.
+
+    Each distinct label is matched once and the result spread over the
+    rows. With ``compact`` the categories are returned as a categorical.
+    """
+    
+    lowered = {}
+    conditions = []
+    
+    for category, column_keywords in rules:
+        matched = np.zeros(len(df), dtype=bool)
         
-        # Re-rank
-        combined = combined.reset_index(drop=True)
-        combined['rank'] = range(1, len(combined) + 1)
+        for column, keywords in column_keywords.items():
+            if column not in lowered:
+                lowered[column] = lowered_labels(df[column])
+            labels, codes = lowered[column]
+            pattern = '|'.join(re.escape(keyword.lower()) for keyword in keywords)
+            matched |= np.asarray(labels.str.contains(pattern, regex=True), dtype=bool)[codes]
         
-        # Reorder columns
-        combined = combined[['rank', 'ticker', 'securityName', 'accountType', 'marketValue_CAD', 
-                            'weight_pct', '12m_return_pct', 'unrealized_gain_pct', 'contribution_to_total_return_pct']]
+        conditions.append(matched)
     
-    return combined
+    categories = [category for category, _ in rules]
+    if compact:
+        codes = np.select(conditions, range(len(categories)), default=len(categories))
+        labels = pd.Categorical.from_codes(codes, categories + [default])
+        # Sorted like a plain text column, so groupings keep their order
+        return pd.Series(labels.reorder_categories(sorted(labels.categories)), index=df.index)
+    return pd.Series(np.select(conditions, categories, default=default), index=df.index)
+
+# Transaction columns the cashflow digests read, plus Currency when the export has one
+TRANSACTION_COLUMNS = ['Date', 'Account', 'Description', 'Transaction Type', 'Net Amount']
+
+# Account types by account name (simplified); other accounts are 'Other'
+ACCOUNT_TYPES = {'TFSA': 'TFSA', 'RRSP': 'RRSP', 'Margin': 'Margin'}
+
+# Rows per chunk when streaming the transaction history (--chunk-rows)
+TRANSACTION_CHUNK_ROWS = 100_000
 
-def create_cashflow_digest(transaction_file):
-    """Generate PF_Cashflow_Digest.csv"""
+def clean_transactions(df, compact=False):
+    """Parse dates and amounts and add the category and accountType columns, in place.
+
+    Exports with a Currency column report Net Amount in that currency; it
+    is kept as ``currency`` for convert_transactions. Labels derived from
+    categorical columns stay categorical, and with ``compact`` so does the
+    category.
+    """
+    
+    df['Date'] = pd.to_datetime(df['Date'])
     
-    print("Creating Cashflow Digest...")
+    # Categorize transaction types
+    df['category'] = categorize_transactions(df, compact=compact)
+    
+    # Convert Net Amount to numeric, handling CAD amounts
+    amounts = df['Net Amount']
+    if not pd.api.types.is_numeric_dtype(amounts):
+        amounts = amounts.astype(str).str.replace(',', '').str.replace('"', '')
+    df['Net Amount'] = pd.to_numeric(amounts, errors='coerce').fillna(0)
+    
+    # Get account type mapping (simplified)
+    if isinstance(df['Account'].dtype, pd.CategoricalDtype):
+        df['accountType'] = recode(df['Account'], ACCOUNT_TYPES, 'Other')
+    else:
+        df['accountType'] = df['Account'].map(ACCOUNT_TYPES).fillna('Other')
+    
+    if 'Currency' in df.columns:
+        currency = df['Currency']
+        if isinstance(currency.dtype, pd.CategoricalDtype):
+            df['currency'] = recode(currency, {code: str(code).strip().upper() for code in currency.cat.categories},
+                                    None)
+        else:
+            df['currency'] = currency.str.strip().str.upper()
+    
+    return df
+
+def load_transactions(transaction_file, compact=False):
+    """Read the transaction history and add the cleaned columns the cashflow digest needs.
+
+    With ``compact`` the text columns are read as categoricals and the
+    year and quarter stored in the narrowest integer types.
+    """
     
     # Read transaction history
-    df = pd.read_csv(transaction_file)
+    df = clean_transactions(pd.read_csv(transaction_file, dtype=CATEGORY_DTYPES if compact else None), compact)
     
-    # Parse date and add year/quarter
-    df['Date'] = pd.to_datetime(df['Date'])
+    # Add year/quarter
     df['year'] = df['Date'].dt.year
     df['quarter'] = df['Date'].dt.quarter
+    if compact:
+        df['year'] = narrow_integers(df['year'], 'int16')
+        df['quarter'] = narrow_integers(df['quarter'], 'int8')
     
-    # Categorize transaction types
-    def categorize_transaction(transaction_type, description):
-        transaction_type = str(transaction_type).lower()
-        description = str(description).lower()
-        
-        if 'deposit' in transaction_type or 'deposit' in description:
-            return 'deposits'
-        elif 'withdrawal' in transaction_type or 'withdrawal' in description:
-            return 'withdrawals'
-        elif 'dividend' in transaction_type or 'dividend' in description:
-            return 'dividends'
-        elif 'interest' in transaction_type or 'interest' in description:
-            return 'interest'
-        elif 'commission' in transaction_type or 'fee' in transaction_type or 'commission' in description:
-            return 'fees'
-        else:
-            return 'other'
+    return df
+
+def stream_transaction_sums(transaction_file, chunk_rows=TRANSACTION_CHUNK_ROWS):
+    """Fold the transaction history into per-(month, account, category) sums, one chunk at a time.
+
+    Only TRANSACTION_COLUMNS are read, with amounts parsed by the CSV
+    reader. Each chunk is cleaned like load_transactions and reduced to its
+    group sums, so memory is bounded by the chunk size and the number of
+    groups rather than by the file size. Returns one row per group: the
+    month's first day as Date, accountType, category, the summed Net Amount
+    and the transaction count. Exports with a Currency column are grouped
+    by day and currency instead, so convert_transactions applies the same
+    as-of rates as to the full history.
+    """
     
-    df['category'] = df.apply(lambda row: categorize_transaction(row['Transaction Type'], row['Description']), axis=1)
+    keys = ['Date', 'accountType', 'category']
+    totals = None
     
-    # Convert Net Amount to numeric, handling CAD amounts
-    df['Net Amount'] = df['Net Amount'].astype(str).str.replace(',', '').str.replace('"', '')
-    df['Net Amount'] = pd.to_numeric(df['Net Amount'], errors='coerce').fillna(0)
+    reader = pd.read_csv(
+        transaction_file, usecols=lambda column: column in TRANSACTION_COLUMNS or column == 'Currency',
+        chunksize=chunk_rows, thousands=',',
+        dtype={'Account': str, 'Description': str, 'Transaction Type': str, 'Currency': str},
+    )
+    with reader:
+        for chunk in reader:
+            chunk = clean_transactions(chunk)
+            if 'currency' in chunk.columns:
+                chunk['Date'] = chunk['Date'].dt.normalize()
+                keys = ['Date', 'accountType', 'category', 'currency']
+            else:
+                chunk['Date'] = chunk['Date'].dt.to_period('M').dt.to_timestamp()
+            sums = chunk.groupby(keys, observed=True, dropna=False)['Net Amount'].agg(['sum', 'size'])
+            totals = sums if totals is None else totals.add(sums, fill_value=0)
     
-    # Get account type mapping (simplified)
-    df['accountType'] = df['Account'].map({'TFSA': 'TFSA', 'RRSP': 'RRSP', 'Margin': 'Margin'}).fillna('Other')
+    if totals is None:
+        return pd.DataFrame(columns=keys + ['Net Amount', 'count'])
     
-    # Group by year, quarter, account, and category
-    grouped = df.groupby(['year', 'quarter', 'accountType', 'category'])['Net Amount'].sum().reset_index()
+    totals = totals.rename(columns={'sum': 'Net Amount', 'size': 'count'}).reset_index()
+    totals['count'] = totals['count'].astype(int)
+    return totals
+
+def convert_transactions(transactions, fx):
+    """Convert Net Amount to the base currency at each transaction's as-of rate.
+
+    Transactions without a currency column are already in the base
+    currency and are returned unchanged.
+    """
     
-    # Pivot to get categories as columns
-    pivot = grouped.pivot_table(
-        index=['year', 'quarter', 'accountType'], 
-        columns='category', 
-        values='Net Amount', 
-        fill_value=0
-    ).reset_index()
+    if 'currency' not in transactions.columns:
+        return transactions
     
-    # Ensure all required columns exist
-    required_columns = ['deposits', 'withdrawals', 'dividends', 'interest', 'fees']
-    for col in required_columns:
-        if col not in pivot.columns:
-            pivot[col] = 0
+    return fx.to_base(transactions, ['Net Amount'])
+
+# Cashflow categories reported as columns; netCashflow is their sum
+CASHFLOW_CATEGORIES = [category for category, _ in CASHFLOW_RULES]
+
+def create_cashflow_digest(transactions, level='quarter', rollups=None):
+    """Generate one cashflow digest: PF_Cashflow_Digest.csv is the quarterly level.
     
-    # Calculate net cashflow
-    pivot['netCashflow'] = pivot['deposits'] + pivot['withdrawals'] + pivot['dividends'] + pivot['interest'] + pivot['fees']
+    ``level`` is month, quarter, year or total for the per-account rows,
+    or ALL_ACCOUNTS for the cross-account rows of every level; ``rollups``
+    are the precomputed results of cashflow_rollups, shared by every level.
+    """
     
-    # Select and reorder columns
-    final_columns = ['year', 'quarter', 'accountType', 'deposits', 'withdrawals', 'dividends', 'interest', 'fees', 'netCashflow']
-    result = pivot[final_columns]
+    print(f"Creating Cashflow Digest ({level})...")
     
-    # Sort chronologically
-    result = result.sort_values(['year', 'quarter', 'accountType'])
+    if rollups is None:
+        rollups = cashflow_rollups(transactions, CASHFLOW_CATEGORIES)
     
-    return result
+    return rollups[level]
 
-def main():
-    """Main processing function."""
-    
-    portfolio_file = "docs/IKBR Portfolio - Inception to Date.csv"
-    transaction_file = "docs/IKBR Portfolio - Transaction History.csv"
+# Digest outputs in report order: (key, file name, title, decimals, row label)
+DIGEST_FILES = [
+    ('performance', 'PF_IBKR_Performance_Digest.csv', 'IBKR Performance Digest', 4, 'periods'),
+    ('returns', 'PF_IBKR_Returns_Digest.csv', 'IBKR Returns Digest', 4, 'account periods'),
+    ('allocation', 'PF_IBKR_Allocation_Digest.csv', 'IBKR Allocation Digest', 4, 'positions'),
+    ('position', 'PF_IBKR_Position_Digest.csv', 'IBKR Position Digest', 4, 'positions'),
+    ('cashflow_monthly', 'PF_Cashflow_Monthly_Digest.csv', 'IBKR Monthly Cashflow Digest', 2, 'monthly rows'),
+    ('cashflow', 'PF_Cashflow_Digest.csv', 'IBKR Cashflow Digest', 2, 'quarterly rows'),
+    ('cashflow_yearly', 'PF_Cashflow_Yearly_Digest.csv', 'IBKR Yearly Cashflow Digest', 2, 'yearly rows'),
+    ('cashflow_total', 'PF_Cashflow_Total_Digest.csv', 'IBKR All-Time Cashflow Digest', 2, 'accounts'),
+    ('cashflow_all_accounts', 'PF_Cashflow_All_Accounts_Digest.csv', 'IBKR All-Accounts Cashflow Digest', 2,
+     'cross-account rows'),
+    ('rolling', 'PF_IBKR_Rolling_Risk_Digest.csv', 'IBKR Rolling Risk Digest', 4, 'rolling windows'),
+    ('symbol', 'PF_IBKR_Symbol_Digest.csv', 'IBKR Symbol Digest', 4, 'symbols and instrument classes'),
+    ('exposure', 'PF_IBKR_Exposure_Digest.csv', 'IBKR Exposure Digest', 4, 'exposure rows'),
+    ('income', 'PF_IBKR_Income_Digest.csv', 'IBKR Income Digest', 4, 'income rows'),
+]
+
+# Digests built from the transaction history; the others come from the portfolio export
+TRANSACTION_DIGESTS = frozenset({'cashflow_monthly', 'cashflow', 'cashflow_yearly', 'cashflow_total',
+                                 'cashflow_all_accounts'})
+
+# File name stem of the per-run metrics sidecar and cProfile dump
+METRICS_BASENAME = 'PF_IBKR_Digests'
+
+def write_digest(df, output_file, title, timestamp, formats=()):
+    """Write a digest CSV preceded by its generated timestamp comment, plus any columnar ``formats``."""
     
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    write_digest_outputs(df, output_file, title, timestamp, formats)
+
+def submit(pool, func, *args, **kwargs):
+    """``pool.submit`` running ``func`` in a copy of the caller's context (e.g. a batch job's output capture)."""
     
-    if not os.path.exists(portfolio_file):
-        print(f"Error: Portfolio file '{portfolio_file}' not found")
-        return 1
+    return pool.submit(contextvars.copy_context().run, func, *args, **kwargs)
+
+def generate_digests(portfolio_file, transaction_file, output_dir='.', jobs=1, cache_dir=None,
+                     scipy_check=False, metrics=None, formats=(), history_db=None, portfolio='', compact=False,
+                     chunk_rows=None, fx_rate_file=None):
+    """Parse both exports and build, round and write every digest in DIGEST_FILES.
+
+    With ``jobs`` > 1 the two input files are parsed concurrently and the
+    digest builders run on a thread pool; each file is written as soon as its
+    digest is ready. Returns the digest frames keyed as in DIGEST_FILES, in
+    that order regardless of completion order. Every stage is recorded in
+    ``metrics``; ``formats`` adds Parquet/Feather copies of each digest.
+    With ``history_db`` the run is also stored in the digest history
+    database under ``portfolio``. With ``compact`` the parsed inputs and
+    positions are built in compact dtypes, sharing one symbol dictionary. With
+    ``chunk_rows`` the transaction history is streamed in chunks of that
+    many rows and only its monthly sums are kept. Amounts in other
+    currencies are converted to the base currency with the export's FX
+    rates, supplemented by ``fx_rate_file``.
+    """
     
-    if not os.path.exists(transaction_file):
-        print(f"Error: Transaction file '{transaction_file}' not found")
-        return 1
+    metrics = metrics or StageMetrics('ibkr')
+    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    # Compact parses are cached apart from plain ones
+    mode = '_compact' if compact else ''
     
-    try:
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
         print("Parsing IBKR portfolio data...")
-        sections = parse_ibkr_csv(portfolio_file)
+        sections_future = submit(
+            pool, metrics.measure, 'parse_sections', cached_load, cache_dir, portfolio_file, 'sections' + mode,
+            PARSER_VERSION, lambda: parse_ibkr_csv(portfolio_file, DIGEST_SECTIONS, compact), params=DIGEST_SECTIONS,
+        )
+        if chunk_rows:
+            transactions_future = submit(
+                pool, metrics.measure, 'stream_transactions', cached_load, cache_dir, transaction_file,
+                'transaction_sums', PARSER_VERSION, lambda: stream_transaction_sums(transaction_file, chunk_rows),
+            )
+        else:
+            transactions_future = submit(
+                pool, metrics.measure, 'load_transactions', cached_load, cache_dir, transaction_file,
+                'transactions' + mode, PARSER_VERSION, lambda: load_transactions(transaction_file, compact),
+            )
+        sections = sections_future.result()
+        transactions = transactions_future.result()
         print(f"Found {len(sections)} data sections")
+        if compact:
+            # Parses built here and ones from the cache alike move onto the shared symbol dictionary
+            sections = share_symbols(sections)
+            transactions = share_symbols(transactions)
+        record_frame_memory(metrics, 'parse_sections', sections)
+        record_frame_memory(metrics, 'stream_transactions' if chunk_rows else 'load_transactions', transactions)
         
-        # Generate each digest file
-        print("\n" + "="*50)
-        
-        # 1. Performance Digest
-        performance_df = create_performance_digest(sections)
-        performance_df = performance_df.round(4)
-        
-        with open("PF_IBKR_Performance_Digest.csv", 'w') as f:
-            f.write(f"# IBKR Performance Digest - Generated: {timestamp}\n")
-            performance_df.to_csv(f, index=False)
+        # One rate table converts the positions and the transactions
+        fx = metrics.measure('build_fx_rates', fx_rate_table, sections, fx_rate_file)
+        transactions = metrics.measure('convert_transactions', convert_transactions, transactions, fx,
+                                       rows_in=len(transactions))
         
-        print(f"✓ PF_IBKR_Performance_Digest.csv - {len(performance_df)} periods")
+        # Positions are parsed once and shared by the Allocation and Position digests
+        positions = metrics.measure('build_positions', build_positions_frame, sections, fx, compact)
+        record_frame_memory(metrics, 'build_positions', positions)
         
-        # 2. Allocation Digest
-        allocation_df = create_allocation_digest(sections)
-        allocation_df = allocation_df.round(4)
+        # Payments and trailing dividend yields are shared by the Allocation and Income digests
+        income = metrics.measure('build_income_history', income_history, sections)
+        yields = metrics.measure('build_dividend_yields', dividend_yields, income, positions,
+                                 analysis_period(sections)[1], rows_in=len(income))
         
-        with open("PF_IBKR_Allocation_Digest.csv", 'w') as f:
-            f.write(f"# IBKR Allocation Digest - Generated: {timestamp}\n")
-            allocation_df.to_csv(f, index=False)
+        # Monthly returns are shared by the Performance, Rolling Risk and Symbol digests
+        monthly = metrics.measure('build_monthly_returns', monthly_return_series, sections)
         
-        print(f"✓ PF_IBKR_Allocation_Digest.csv - {len(allocation_df)} positions")
+        # TWR/XIRR per period are shared by the Performance and Returns digests
+        returns = metrics.measure('build_period_returns', period_returns, sections,
+                                  rows_in=count_rows(sections.get('Deposits And Withdrawals', [])))
         
-        # 3. Position Digest
-        position_df = create_position_digest(sections)
-        position_df = position_df.round(4)
+        # Every cashflow granularity comes from one rollup of the transactions
+        rollups = metrics.measure('build_cashflow_rollups', cashflow_rollups, transactions, CASHFLOW_CATEGORIES,
+                                  count='count' if chunk_rows else None, rows_in=len(transactions))
         
-        with open("PF_IBKR_Position_Digest.csv", 'w') as f:
-            f.write(f"# IBKR Position Digest - Generated: {timestamp}\n")
-            position_df.to_csv(f, index=False)
+        # Builder and input row count per digest
+        builders = {
+            'performance': (lambda: create_performance_digest(sections, scipy_check, monthly, returns),
+                            count_rows(sections.get('Historical Performance Benchmark Comparison', []))),
+            'returns': (lambda: create_returns_digest(sections, returns), len(returns)),
+            'allocation': (lambda: create_allocation_digest(positions, yields), len(positions)),
+            'position': (lambda: create_position_digest(positions), len(positions)),
+            'cashflow_monthly': (lambda: create_cashflow_digest(transactions, 'month', rollups),
+                                 count_rows(rollups['month'])),
+            'cashflow': (lambda: create_cashflow_digest(transactions, 'quarter', rollups),
+                         count_rows(rollups['quarter'])),
+            'cashflow_yearly': (lambda: create_cashflow_digest(transactions, 'year', rollups),
+                                count_rows(rollups['year'])),
+            'cashflow_total': (lambda: create_cashflow_digest(transactions, 'total', rollups),
+                               count_rows(rollups['total'])),
+            'cashflow_all_accounts': (lambda: create_cashflow_digest(transactions, ALL_ACCOUNTS, rollups),
+                                      count_rows(rollups[ALL_ACCOUNTS])),
+            'rolling': (lambda: create_rolling_risk_digest(monthly), len(monthly)),
+            'symbol': (lambda: create_symbol_digest(sections, monthly),
+                       count_rows(sections.get('Performance by Symbol', []))),
+            'exposure': (lambda: create_exposure_digest(sections),
+                         count_rows(sections.get('Concentration', [])) + count_rows(sections.get('ESG', []))),
+            'income': (lambda: create_income_digest(sections, positions, income, yields), len(income)),
+        }
         
-        print(f"✓ PF_IBKR_Position_Digest.csv - {len(position_df)} positions")
-        
-        # 4. Cashflow Digest
-        cashflow_df = create_cashflow_digest(transaction_file)
-        cashflow_df = cashflow_df.round(2)
+        # Generate each digest file
+        print("\n" + "="*50)
         
-        with open("PF_Cashflow_Digest.csv", 'w') as f:
-            f.write(f"# IBKR Cashflow Digest - Generated: {timestamp}\n")
-            cashflow_df.to_csv(f, index=False)
+        futures = {}
+        for key, file_name, title, decimals, _ in DIGEST_FILES:
+            builder, rows_in = builders[key]
+            future = submit(pool, metrics.measure, f'{key}_digest', builder, rows_in=rows_in)
+            futures[future] = (key, file_name, title, decimals)
         
-        print(f"✓ PF_Cashflow_Digest.csv - {len(cashflow_df)} periods")
+        results = {}
+        for future in as_completed(futures):
+            key, file_name, title, decimals = futures[future]
+            df = future.result()
+            df = df.round({col: decimals for col in df.select_dtypes('number').columns})
+            metrics.measure(f'write_{key}', write_digest, df, os.path.join(output_dir, file_name), title, timestamp,
+                            formats, rows_in=len(df))
+            results[key] = df
+    
+    for key, file_name, _, _, row_label in DIGEST_FILES:
+        print(f"✓ {file_name} - {len(results[key])} {row_label}")
+    
+    digests = {key: results[key] for key, *_ in DIGEST_FILES}
+    if history_db:
+        sources = {key: transaction_file if key in TRANSACTION_DIGESTS else portfolio_file for key in digests}
+        metrics.measure('store_history', store_digests, history_db, digests, timestamp, sources, portfolio,
+                        rows_in=count_rows(digests))
+    
+    return digests
+
+def main(argv=None):
+    """Main processing function."""
+    
+    parser = argparse.ArgumentParser(description="Build the PF_IBKR_* and PF_Cashflow digests from IBKR exports.")
+    parser.add_argument('--jobs', type=int, default=1,
+                        help="parse inputs and build digests on this many threads (default: %(default)s)")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR,
+                        help="directory for cached parses of unchanged exports (default: %(default)s)")
+    parser.add_argument('--no-cache', action='store_true', help="always re-parse the input files")
+    parser.add_argument('--clear-cache', action='store_true', help="empty the parse cache before running")
+    parser.add_argument('--scipy-check', action='store_true',
+                        help="cross-check the alpha/beta regression against scipy.stats.linregress")
+    parser.add_argument('--profile', action='store_true',
+                        help="trace memory per stage and dump a cProfile stats file (main thread only; "
+                             "use --jobs 1 for full coverage)")
+    parser.add_argument('--formats', nargs='+', choices=list(COLUMNAR_FORMATS), default=[],
+                        help="also write each digest as Parquet and/or Feather (requires pyarrow)")
+    parser.add_argument('--history-db', nargs='?', const=DEFAULT_HISTORY_DB,
+                        help=f"also store this run in a SQLite history database (default path: {DEFAULT_HISTORY_DB})")
+    parser.add_argument('--compact', action='store_true',
+                        help="build intermediate frames in compact dtypes (--profile records their memory)")
+    parser.add_argument('--chunk-rows', type=int, nargs='?', const=TRANSACTION_CHUNK_ROWS,
+                        help="stream the transaction history in chunks of this many rows to bound memory "
+                             f"(default chunk: {TRANSACTION_CHUNK_ROWS})")
+    parser.add_argument('--fx-rates', metavar='FILE',
+                        help="CSV of Date, Currency, Rate (CAD per unit) adding FX rate history to the export's")
+    args = parser.parse_args(argv)
+    
+    cache_dir = None if args.no_cache else args.cache_dir
+    if args.clear_cache:
+        clear_cache(args.cache_dir)
+    
+    portfolio_file = PORTFOLIO_FILE
+    transaction_file = TRANSACTION_FILE
+    
+    if not os.path.exists(portfolio_file):
+        print(f"Error: Portfolio file '{portfolio_file}' not found")
+        return 1
+    
+    if not os.path.exists(transaction_file):
+        print(f"Error: Transaction file '{transaction_file}' not found")
+        return 1
+    
+    if args.fx_rates and not os.path.exists(args.fx_rates):
+        print(f"Error: FX rate file '{args.fx_rates}' not found")
+        return 1
+    
+    format_error = columnar_support_error(args.formats)
+    if format_error:
+        print(f"Error: {format_error}")
+        return 1
+    
+    metrics = StageMetrics('ibkr', trace_memory=args.profile)
+    profile_file = METRICS_BASENAME + '.prof' if args.profile else None
+    status = 'error'
+    
+    try:
+        with profiled(profile_file):
+            digests = generate_digests(
+                portfolio_file, transaction_file, jobs=args.jobs, cache_dir=cache_dir,
+                scipy_check=args.scipy_check, metrics=metrics, formats=args.formats,
+                history_db=args.history_db, compact=args.compact, chunk_rows=args.chunk_rows,
+                fx_rate_file=args.fx_rates,
+            )
         
         print("\n" + "="*50)
         print("All IBKR digest files generated successfully!")
         
         # Summary statistics
         print("\n=== SUMMARY ===")
-        print(f"Performance periods analyzed: {len(performance_df)}")
-        print(f"Total positions: {len(allocation_df)}")
-        print(f"Top/bottom performers: {len(position_df)}")
-        print(f"Cashflow periods: {len(cashflow_df)}")
+        print(f"Performance periods analyzed: {len(digests['performance'])}")
+        print(f"Accounts with returns: {(digests['returns']['account'] != CONSOLIDATED).sum()}")
+        print(f"Total positions: {len(digests['allocation'])}")
+        print(f"Top/bottom performers: {len(digests['position'])}")
+        cashflow_levels = digests['cashflow_all_accounts']['level']
+        print(f"Cashflow periods: {(cashflow_levels == 'month').sum()} months, "
+              f"{(cashflow_levels == 'quarter').sum()} quarters")
+        print(f"Rolling risk windows: {len(digests['rolling'])}")
+        print(f"Symbols analyzed: {(digests['symbol']['level'] == 'symbol').sum()}")
+        income_total = digests['income'].loc[digests['income']['level'] == 'total', 'income_CAD'].sum()
+        print(f"Trailing 12-month income: {income_total:,.2f} CAD")
+        exposure = digests['exposure']
+        issuers = exposure.loc[(exposure['level'] == 'portfolio') & (exposure['name'] == 'issuer'), 'count']
+        print(f"Look-through issuers: {issuers.iloc[0] if len(issuers) else 0}")
         
+        status = 'ok'
         return 0
         
     except Exception as e:
@@ -529,6 +1591,11 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
+    
+    finally:
+        metrics.write(METRICS_BASENAME + '.metrics.json', status=status, jobs=args.jobs,
+                      input_files=[portfolio_file, transaction_file], compact=args.compact,
+                      chunk_rows=args.chunk_rows, fx_rate_file=args.fx_rates)
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -6,140 +6,178 @@ Processes Personal Capital Net Worth CSV export into monthly digest format.
 Generated: {timestamp}
 """
 
-import pandas as pd
-import numpy as np
 from datetime import datetime
-import re
+import argparse
 import sys
 import os
 
-def load_and_process_csv(file_path):
-    """Load the CSV and process into the required format."""
+from compact_frames import as_category, record_frame_memory
+from digest_history import DEFAULT_HISTORY_DB, store_digest
+from digest_output import (
+    COLUMNAR_FORMATS, columnar_path, columnar_support_error, write_columnar_outputs, write_digest_outputs,
+)
+from fast_startup import lazy_import
+from net_worth_projection import PROJECTION_PATHS, PROJECTION_YEARS, SAMPLING_METHODS, project_net_worth
+from pipeline_metrics import StageMetrics, profiled, sidecar_path
+
+# pandas and numpy load on first use, so --help and error paths start fast
+lazy_import('pandas', 'pd', globals())
+lazy_import('numpy', 'np', globals())
+
+# Asset category mapping, checked in order against asset name and description
+ASSET_MAPPING = {
+    'Bank accounts': 'cashVal',
+    'Bank Accounts': 'cashVal',
+    'line of credit': 'cashVal',
+    'Savings account': 'cashVal',
+    
+    'Margin': 'equitiesVal',
+    'TFSA': 'equitiesVal', 
+    'RRSP': 'equitiesVal',
+    'IKBR': 'equitiesVal',
+    'Manulife RPP': 'fixedIncomeVal',
+    'Wealthsimple FHSA': 'equitiesVal',
+    
+    'Phantom Wallet': 'cryptoVal',
+    'Blue Wallet': 'cryptoVal',
+    'Cryptocurrency': 'cryptoVal',
+    
+    # Default for other assets
+    'other': 'otherVal'
+}
+
+# Summary rows that are not individual assets
+SKIP_ROWS = ['', 'Subtotal', 'Total', 'Net Worth', 'NW YTD %', 'NW YoY', 'Crypto % NW']
+
+# Net worth milestone step in CAD (or pass a ladder of levels)
+DEFAULT_MILESTONE = 100000
+
+# Default input export and output digest paths
+INPUT_FILE = "docs/Net Worth.csv"
+OUTPUT_FILE = "PF_NetWorth_Digest.csv"
+DIGEST_TITLE = "Net Worth Digest"
+
+# Monte Carlo projection digest, written next to the net worth digest
+PROJECTION_FILE = "PF_NetWorth_Projection_Digest.csv"
+PROJECTION_TITLE = "Net Worth Projection Digest"
+
+# Milestones above the current net worth whose odds the projection reports (step milestones)
+PROJECTED_MILESTONES = 10
+
+# Months of history needed to seed the 12-month rolling metrics
+ROLLING_WINDOW = 12
+
+# Digest column order as specified
+DIGEST_COLUMNS = [
+    'date', 'totalNW', 'cryptoVal', 'cryptoPct', 'equitiesVal', 
+    'fixedIncomeVal', 'cashVal', 'otherVal', 'MoM_pct', 'YoY_pct', 
+    'rolling_12m_return', 'rolling_12m_stdev', 'max_drawdown_to_date', 
+    'milestone_flag', 'milestone_tier'
+]
+
+MONEY_COLUMNS = ['totalNW', 'cryptoVal', 'equitiesVal', 'fixedIncomeVal', 'cashVal', 'otherVal']
+
+MONTH_MAP = {
+    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
+    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
+}
+
+def categorize_asset(asset_name, description, mapping=ASSET_MAPPING):
+    """Return the category of the first mapping key found in the name or description."""
     
-    # Read the CSV file
-    df = pd.read_csv(file_path, header=None)
+    asset_name = asset_name.lower()
+    description = description.lower()
+    
+    for key, category in mapping.items():
+        if key.lower() in asset_name or key.lower() in description:
+            return category
+    
+    return 'otherVal'
+
+def parse_amounts(values):
+    """Vectorized numeric cleaning: strip commas/quotes, '(x)' means negative."""
+    
+    clean = values.str.strip().str.replace(r'[",]', '', regex=True)
+    clean = clean.str.replace(r'^\((.*)\)$', r'-\1', regex=True)
+    return pd.to_numeric(clean, errors='coerce')
+
+def load_and_process_csv(file_path, since=None, compact=False):
+    """Load the CSV and process into the required format.
+
+    When ``since`` is given, only the label columns and the month columns
+    on or after that date are read from the sheet. With ``compact`` the
+    asset labels are categoricals before they are repeated for every month.
+    """
     
     # Find the date row (row 2, index 1)
-    date_row = df.iloc[1]
+    date_row = pd.read_csv(file_path, header=None, dtype=str, nrows=3).iloc[1]
     
     # Extract date columns - look for the pattern "MMM//YY"
-    date_columns = []
-    date_indices = []
+    date_columns = {}
     
-    for i, cell in enumerate(date_row):
-        if pd.notna(cell) and isinstance(cell, str) and '//' in cell:
+    for i, cell in date_row.items():
+        if pd.notna(cell) and '//' in cell:
             # Parse date like "Jul//18" to "2018-07-01"
             try:
-                month_year = cell.strip()
-                month_abbr, year = month_year.split('//')
+                month_abbr, year = cell.strip().split('//')
                 year = '20' + year if len(year) == 2 else year
+                month_num = MONTH_MAP.get(month_abbr, 1)
                 
-                # Convert month abbreviation to number
-                month_map = {
-                    'Jan': 1, 'Feb': 2, 'Mar': 3, 'Apr': 4, 'May': 5, 'Jun': 6,
-                    'Jul': 7, 'Aug': 8, 'Sep': 9, 'Oct': 10, 'Nov': 11, 'Dec': 12
-                }
-                month_num = month_map.get(month_abbr, 1)
-                
-                date_str = f"{year}-{month_num:02d}-01"
-                date_columns.append(pd.to_datetime(date_str))
-                date_indices.append(i)
-            except:
+                date_columns[i] = pd.Timestamp(int(year), month_num, 1)
+            except ValueError:
                 continue
     
-    print(f"Found {len(date_columns)} date columns from {date_columns[0]} to {date_columns[-1]}")
+    dates = list(date_columns.values())
+    print(f"Found {len(dates)} date columns from {dates[0]} to {dates[-1]}")
     
-    # Create asset category mapping
-    asset_mapping = {
-        'Bank accounts': 'cashVal',
-        'Bank Accounts': 'cashVal',
-        'line of credit': 'cashVal',
-        'Savings account': 'cashVal',
-        
-        'Margin': 'equitiesVal',
-        'TFSA': 'equitiesVal', 
-        'RRSP': 'equitiesVal',
-        'IKBR': 'equitiesVal',
-        'Manulife RPP': 'fixedIncomeVal',
-        'Wealthsimple FHSA': 'equitiesVal',
-        
-        'Phantom Wallet': 'cryptoVal',
-        'Blue Wallet': 'cryptoVal',
-        'Cryptocurrency': 'cryptoVal',
-        
-        # Default for other assets
-        'other': 'otherVal'
-    }
+    if since is not None:
+        date_columns = {i: date for i, date in date_columns.items() if date >= since}
     
-    # Process each asset row and unpivot
-    records = []
+    # Read only the label columns and the wanted months, as text; cells are cleaned in one vectorized pass below
+    df = pd.read_csv(file_path, header=None, dtype=str, usecols=sorted({0, 1, 2} | set(date_columns)))
     
-    for idx, row in df.iterrows():
-        if idx < 3:  # Skip header rows
-            continue
-            
-        # Get asset name/description
-        asset_name = ""
-        description = ""
-        
-        # Look for asset name in first few columns
-        for col_idx in range(min(3, len(row))):
-            cell_val = row.iloc[col_idx]
-            if pd.notna(cell_val) and str(cell_val).strip():
-                if not asset_name:
-                    asset_name = str(cell_val).strip()
-                elif not description:
-                    description = str(cell_val).strip()
-        
-        # Skip empty rows or summary rows
-        if not asset_name or asset_name in ['', 'Subtotal', 'Total', 'Net Worth', 'NW YTD %', 'NW YoY', 'Crypto % NW']:
-            continue
-            
-        # Determine category
-        category = 'otherVal'
-        for key, cat in asset_mapping.items():
-            if key.lower() in asset_name.lower() or key.lower() in description.lower():
-                category = cat
-                break
-        
-        # Extract values for each date
-        for i, date_idx in enumerate(date_indices):
-            if date_idx < len(row):
-                value_str = str(row.iloc[date_idx]).strip()
-                
-                # Skip empty, dash, or non-numeric values
-                if value_str in ['', '-', 'nan', 'NaN'] or pd.isna(row.iloc[date_idx]):
-                    continue
-                
-                # Clean and parse numeric value
-                try:
-                    # Remove commas, quotes, parentheses (negative values)
-                    clean_value = re.sub(r'[",]', '', value_str)
-                    
-                    # Handle parentheses as negative
-                    if clean_value.startswith('(') and clean_value.endswith(')'):
-                        clean_value = '-' + clean_value[1:-1]
-                    
-                    value = float(clean_value)
-                    
-                    records.append({
-                        'date': date_columns[i],
-                        'asset_name': asset_name,
-                        'description': description,
-                        'category': category,
-                        'value': value
-                    })
-                    
-                except (ValueError, TypeError):
-                    continue
-    
-    return pd.DataFrame(records)
+    # Asset rows start after the header rows
+    rows = df.iloc[3:]
+    
+    # Asset name is the first non-empty cell of the first three columns,
+    # description the second
+    labels = rows.iloc[:, :3].apply(lambda col: col.str.strip()).replace('', np.nan)
+    present = labels.notna().to_numpy()
+    first_pos = present.argmax(axis=1)
+    asset_name = labels.bfill(axis=1).iloc[:, 0].fillna('')
+    description = labels.mask(np.arange(labels.shape[1]) <= first_pos[:, None]).bfill(axis=1).iloc[:, 0].fillna('')
+    
+    # Skip empty rows or summary rows
+    keep = ~asset_name.isin(SKIP_ROWS)
+    
+    # Precompute the category once per distinct asset label
+    label_pairs = pd.DataFrame({'asset_name': asset_name[keep], 'description': description[keep]})
+    category_lookup = {
+        pair: categorize_asset(*pair)
+        for pair in label_pairs.drop_duplicates().itertuples(index=False, name=None)
+    }
+    label_pairs['category'] = [category_lookup[pair] for pair in label_pairs.itertuples(index=False, name=None)]
+    if compact:
+        label_pairs = label_pairs.apply(as_category)
+    
+    # Unpivot the date columns and clean every cell at once
+    values = rows.loc[keep, list(date_columns)].rename(columns=date_columns)
+    long_df = (
+        label_pairs.join(values)
+        .melt(id_vars=['asset_name', 'description', 'category'], var_name='date', value_name='value')
+        .dropna(subset=['value'])
+    )
+    long_df['value'] = parse_amounts(long_df['value'])
+    long_df = long_df.dropna(subset=['value'])
+    long_df['date'] = pd.to_datetime(long_df['date'])
+    
+    return long_df[['date', 'asset_name', 'description', 'category', 'value']].reset_index(drop=True)
 
 def aggregate_by_month_category(df):
     """Group by date and category, then pivot to get category totals per month."""
     
     # Group by date and category
-    monthly_category = df.groupby(['date', 'category'])['value'].sum().reset_index()
+    monthly_category = df.groupby(['date', 'category'], observed=True)['value'].sum().reset_index()
     
     # Pivot to get categories as columns
     pivot_df = monthly_category.pivot(index='date', columns='category', values='value').fillna(0)
@@ -158,7 +196,26 @@ def aggregate_by_month_category(df):
     
     return pivot_df.reset_index()
 
-def calculate_derived_metrics(df):
+def milestone_tiers(total_nw, milestones=DEFAULT_MILESTONE):
+    """Map net worth values to milestone tiers.
+
+    ``milestones`` is either a step size (e.g. 100000 flags every 100k) or a
+    ladder of levels (e.g. [100000, 250000, 1000000]). Returns the tier index
+    and the CAD level of the highest tier reached for each value.
+    """
+    
+    values = np.asarray(total_nw, dtype=float)
+    
+    if np.ndim(milestones) == 0:
+        tier_index = np.floor(values / milestones)
+        return tier_index, tier_index * milestones
+    
+    ladder = np.sort(np.asarray(milestones, dtype=float))
+    tier_index = np.searchsorted(ladder, values, side='right')
+    tier_level = np.where(tier_index > 0, ladder[np.maximum(tier_index - 1, 0)], 0.0)
+    return tier_index, tier_level
+
+def calculate_derived_metrics(df, milestones=DEFAULT_MILESTONE):
     """Calculate MoM, YoY, rolling returns, drawdown, and milestones."""
     
     df = df.sort_values('date').copy()
@@ -181,32 +238,110 @@ def calculate_derived_metrics(df):
     # Drop helper column
     df = df.drop(['cummax', 'drawdown'], axis=1)
     
-    # Milestone flag for 100k CAD boundaries
-    df['milestone_flag'] = False
-    
-    # Track 100k milestones
-    for i in range(1, len(df)):
-        prev_milestone = int(df.iloc[i-1]['totalNW'] // 100000)
-        curr_milestone = int(df.iloc[i]['totalNW'] // 100000)
-        
-        if curr_milestone > prev_milestone:
-            df.loc[df.index[i], 'milestone_flag'] = True
+    # Milestone flags: a month is flagged when net worth moves up a tier
+    tier_index, tier_level = milestone_tiers(df['totalNW'], milestones)
+    crossed = pd.Series(tier_index, index=df.index).diff() > 0
+    df['milestone_flag'] = crossed
+    df['milestone_tier'] = pd.Series(tier_level, index=df.index).where(crossed)
     
     return df
 
+def read_digest(digest_file):
+    """Read a previously written digest, skipping the generated comment line."""
+    
+    return pd.read_csv(digest_file, comment='#', parse_dates=['date'])
+
+def extend_derived_metrics(history, monthly_df, milestones=DEFAULT_MILESTONE):
+    """Calculate derived metrics for new months only.
+
+    Rolling state is seeded from the existing digest ``history`` (all months
+    before ``monthly_df``): the last 12 months for MoM/YoY and the rolling
+    stdev, the previous milestone tier, and the running peak and max
+    drawdown. Work is proportional to the number of new months.
+    """
+    
+    seed = history[['date', 'totalNW']].tail(ROLLING_WINDOW)
+    combined = calculate_derived_metrics(pd.concat([seed, monthly_df], ignore_index=True), milestones)
+    new_df = combined.iloc[len(seed):].copy()
+    
+    # Drawdown continues from the running peak and worst drawdown so far
+    if len(history) > 0:
+        running_max = np.maximum(history['totalNW'].max(), new_df['totalNW'].cummax())
+        drawdown = (new_df['totalNW'] - running_max) / running_max
+        new_df['max_drawdown_to_date'] = np.fmin(
+            history['max_drawdown_to_date'].iloc[-1], drawdown.cummin()
+        )
+    
+    return new_df
+
+def update_digest_incremental(input_file, output_file, milestones=DEFAULT_MILESTONE, recheck_months=1,
+                              formats=(), history_db=None, portfolio='', compact=False):
+    """Append new (or replace changed) months in an existing digest.
+
+    Only the trailing ``recheck_months`` digest months and any newer months
+    are loaded from the sheet (in compact dtypes with ``compact``). Columnar
+    ``formats`` are rewritten from the updated CSV when it changes (or when
+    they do not exist yet), and the updated digest is stored in
+    ``history_db`` when given. Returns the number of rows written, or None
+    when the digest cannot be extended and needs a full rebuild.
+    """
+    
+    history = read_digest(output_file)
+    if len(history) == 0 or list(history.columns) != DIGEST_COLUMNS:
+        return None
+    
+    since = history['date'].iloc[-min(recheck_months, len(history))]
+    raw_df = load_and_process_csv(input_file, since=since, compact=compact)
+    monthly_df = aggregate_by_month_category(raw_df)
+    
+    # A month is dirty when it is new or its values no longer match the digest
+    merged = monthly_df.merge(history[['date'] + MONEY_COLUMNS], on='date', how='left', suffixes=('', '_digest'))
+    dirty = merged['totalNW_digest'].isna()
+    for col in MONEY_COLUMNS:
+        dirty |= merged[col].round(2) != merged[f'{col}_digest']
+    
+    if not dirty.any():
+        refresh_columnar_outputs(output_file, [fmt for fmt in formats
+                                               if not os.path.exists(columnar_path(output_file, fmt))])
+        if history_db:
+            store_digest(history_db, 'net_worth', history, source_file=input_file, portfolio=portfolio)
+        return 0
+    
+    first_dirty = merged.loc[dirty, 'date'].min()
+    prefix = history[history['date'] < first_dirty]
+    new_df = extend_derived_metrics(prefix, monthly_df[monthly_df['date'] >= first_dirty], milestones)
+    output_df = format_output(new_df)
+    
+    if first_dirty > history['date'].iloc[-1]:
+        # Only new months: append without touching existing rows
+        with open(output_file, 'a') as f:
+            output_df.to_csv(f, index=False, header=False)
+        refresh_columnar_outputs(output_file, formats)
+    else:
+        write_digest(pd.concat([format_output(prefix), output_df], ignore_index=True), output_file, formats)
+    
+    if history_db:
+        store_digest(history_db, 'net_worth', read_digest(output_file), source_file=input_file, portfolio=portfolio)
+    
+    return len(output_df)
+
+def write_digest(output_df, output_file, formats=()):
+    """Write the digest with a generated timestamp comment at the top, plus any columnar ``formats``."""
+    
+    write_digest_outputs(output_df, output_file, DIGEST_TITLE, formats=formats)
+
+def refresh_columnar_outputs(output_file, formats):
+    """Rewrite columnar copies of the digest from the CSV on disk."""
+    
+    if formats:
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        write_columnar_outputs(read_digest(output_file), output_file, DIGEST_TITLE, timestamp, formats)
+
 def format_output(df):
     """Format the final output according to specification."""
     
-    # Reorder columns as specified
-    column_order = [
-        'date', 'totalNW', 'cryptoVal', 'cryptoPct', 'equitiesVal', 
-        'fixedIncomeVal', 'cashVal', 'otherVal', 'MoM_pct', 'YoY_pct', 
-        'rolling_12m_return', 'rolling_12m_stdev', 'max_drawdown_to_date', 
-        'milestone_flag'
-    ]
-    
     # Select and reorder columns
-    output_df = df[column_order].copy()
+    output_df = df[DIGEST_COLUMNS].copy()
     
     # Format percentages
     pct_columns = ['cryptoPct', 'MoM_pct', 'YoY_pct', 'rolling_12m_return', 'rolling_12m_stdev', 'max_drawdown_to_date']
@@ -214,44 +349,175 @@ def format_output(df):
         output_df[col] = output_df[col].round(4)
     
     # Format monetary values
-    money_columns = ['totalNW', 'cryptoVal', 'equitiesVal', 'fixedIncomeVal', 'cashVal', 'otherVal']
-    for col in money_columns:
+    for col in MONEY_COLUMNS:
         output_df[col] = output_df[col].round(2)
     
     return output_df
 
-def main():
+def build_digest(input_file, output_file, milestones=DEFAULT_MILESTONE, metrics=None, formats=(),
+                 history_db=None, portfolio='', compact=False):
+    """Run the full load, aggregate, derive and format pipeline and write the digest.
+
+    ``formats`` adds Parquet/Feather copies of the digest next to the CSV;
+    ``history_db`` also stores the run in the digest history database.
+    ``compact`` builds the loaded records in compact dtypes.
+    """
+    
+    metrics = metrics or StageMetrics('net_worth')
+    
+    print("Loading and processing CSV...")
+    raw_df = metrics.measure('load', load_and_process_csv, input_file, compact=compact)
+    record_frame_memory(metrics, 'load', raw_df)
+    print(f"Loaded {len(raw_df)} asset-month records")
+    
+    print("Aggregating by month and category...")
+    monthly_df = metrics.measure('aggregate', aggregate_by_month_category, raw_df, rows_in=len(raw_df))
+    print(f"Created {len(monthly_df)} monthly records")
+    
+    print("Calculating derived metrics...")
+    final_df = metrics.measure('derive_metrics', calculate_derived_metrics, monthly_df, milestones,
+                               rows_in=len(monthly_df))
+    
+    print("Formatting output...")
+    output_df = metrics.measure('format', format_output, final_df, rows_in=len(final_df))
+    
+    # Write output file
+    metrics.measure('write', write_digest, output_df, output_file, formats, rows_in=len(output_df))
+    
+    if history_db:
+        metrics.measure('store_history', store_digest, history_db, 'net_worth', output_df,
+                        source_file=input_file, portfolio=portfolio, rows_in=len(output_df))
+    
+    return output_df
+
+def projection_milestones(total_nw, milestones=DEFAULT_MILESTONE, count=PROJECTED_MILESTONES):
+    """Milestone levels above ``total_nw``: the next ``count`` steps, or the ladder levels not yet reached."""
+    
+    if np.ndim(milestones) == 0:
+        tier_index, _ = milestone_tiers(total_nw, milestones)
+        return (tier_index + np.arange(1, count + 1)) * milestones
+    
+    ladder = np.sort(np.asarray(milestones, dtype=float))
+    return ladder[ladder > total_nw]
+
+def format_projection(df):
+    """Round the projection: CAD amounts to cents, probabilities to 2 decimals."""
+    
+    money_columns = [col for col in df.columns if col.startswith('totalNW_')] + ['contributed', 'milestone']
+    return df.round({**{col: 2 for col in money_columns}, 'probability_pct': 2})
+
+def build_projection(history, output_file, paths=PROJECTION_PATHS, milestones=DEFAULT_MILESTONE, metrics=None,
+                     formats=(), **options):
+    """Project the digest ``history`` forward and write PROJECTION_FILE next to ``output_file``.
+
+    ``options`` go to project_net_worth (years, contribution,
+    contribution_growth, method, seed). Milestone odds are reported for
+    the projection_milestones above the latest net worth.
+    """
+    
+    metrics = metrics or StageMetrics('net_worth')
+    levels = projection_milestones(history['totalNW'].iloc[-1], milestones)
+    
+    print(f"Projecting net worth over {paths:,} paths...")
+    projection = metrics.measure('project', project_net_worth, history['date'], history['totalNW'], paths=paths,
+                                 milestones=levels, rows_in=len(history), **options)
+    projection = format_projection(projection)
+    
+    projection_file = os.path.join(os.path.dirname(output_file), PROJECTION_FILE)
+    metrics.measure('write_projection', write_digest_outputs, projection, projection_file, PROJECTION_TITLE,
+                    formats=formats, rows_in=len(projection))
+    
+    return projection
+
+def milestone_option(values):
+    """Milestones from the command line: one value is a step size, several a ladder of levels."""
+    
+    return values[0] if len(values) == 1 else sorted(values)
+
+def projection_options(args):
+    """project_net_worth options from the command line (the number of paths included)."""
+    
+    return {
+        'paths': args.project,
+        'years': args.project_years,
+        'method': args.project_method,
+        'contribution': args.contribution,
+        'contribution_growth': args.contribution_growth,
+        'seed': args.seed,
+    }
+
+def main(argv=None):
     """Main processing function."""
     
-    input_file = "docs/Net Worth.csv"
-    output_file = "PF_NetWorth_Digest.csv"
+    parser = argparse.ArgumentParser(description="Build PF_NetWorth_Digest.csv from the Net Worth export.")
+    parser.add_argument('--incremental', action='store_true',
+                        help="append only new or changed months to an existing digest")
+    parser.add_argument('--profile', action='store_true',
+                        help="trace memory per stage and dump a cProfile stats file next to the digest")
+    parser.add_argument('--formats', nargs='+', choices=list(COLUMNAR_FORMATS), default=[],
+                        help="also write the digest as Parquet and/or Feather (requires pyarrow)")
+    parser.add_argument('--history-db', nargs='?', const=DEFAULT_HISTORY_DB,
+                        help=f"also store this run in a SQLite history database (default path: {DEFAULT_HISTORY_DB})")
+    parser.add_argument('--compact', action='store_true',
+                        help="build intermediate frames in compact dtypes (--profile records their memory)")
+    parser.add_argument('--milestones', type=float, nargs='+', default=[DEFAULT_MILESTONE], metavar='CAD',
+                        help="one milestone step (e.g. 250000) or a ladder of levels (e.g. 100000 250000 1000000); "
+                             "rebuild without --incremental after changing it (default: %(default)s)")
+    parser.add_argument('--project', type=int, nargs='?', const=PROJECTION_PATHS, metavar='PATHS',
+                        help=f"also write {PROJECTION_FILE}, a Monte Carlo projection over this many paths "
+                             f"(default: {PROJECTION_PATHS:,})")
+    parser.add_argument('--project-years', type=int, default=PROJECTION_YEARS,
+                        help="projection horizon in years (default: %(default)s)")
+    parser.add_argument('--project-method', choices=SAMPLING_METHODS, default='bootstrap',
+                        help="resample historical months or draw normal log returns (default: %(default)s)")
+    parser.add_argument('--contribution', type=float,
+                        help="monthly contribution in CAD (default: the monthly savings estimated from the history)")
+    parser.add_argument('--contribution-growth', type=float, default=0.0,
+                        help="yearly growth of the contribution, e.g. 0.03 (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed of the projection (default: %(default)s)")
+    args = parser.parse_args(argv)
+    
+    input_file = INPUT_FILE
+    output_file = OUTPUT_FILE
+    milestones = milestone_option(args.milestones)
     
     if not os.path.exists(input_file):
         print(f"Error: Input file '{input_file}' not found")
         return 1
     
+    format_error = columnar_support_error(args.formats)
+    if format_error:
+        print(f"Error: {format_error}")
+        return 1
+    
+    metrics = StageMetrics('net_worth', trace_memory=args.profile)
+    profile_file = sidecar_path(output_file, '.prof') if args.profile else None
+    status = 'error'
+    
     try:
-        print("Loading and processing CSV...")
-        raw_df = load_and_process_csv(input_file)
-        print(f"Loaded {len(raw_df)} asset-month records")
-        
-        print("Aggregating by month and category...")
-        monthly_df = aggregate_by_month_category(raw_df)
-        print(f"Created {len(monthly_df)} monthly records")
-        
-        print("Calculating derived metrics...")
-        final_df = calculate_derived_metrics(monthly_df)
-        
-        print("Formatting output...")
-        output_df = format_output(final_df)
-        
-        # Add timestamp comment at the top
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        # Write output file
-        with open(output_file, 'w') as f:
-            f.write(f"# Net Worth Digest - Generated: {timestamp}\n")
-            output_df.to_csv(f, index=False)
+        with profiled(profile_file):
+            if args.incremental and os.path.exists(output_file):
+                print("Updating digest incrementally...")
+                with metrics.stage('incremental_update') as record:
+                    written = update_digest_incremental(input_file, output_file, milestones,
+                                                        formats=args.formats, history_db=args.history_db,
+                                                        compact=args.compact)
+                    record['rows_out'] = written
+                if written is not None:
+                    print(f"Updated {written} monthly records in '{output_file}'")
+                    if args.project:
+                        build_projection(read_digest(output_file), output_file, milestones=milestones,
+                                         metrics=metrics, formats=args.formats, **projection_options(args))
+                    status = 'ok'
+                    return 0
+                print("Existing digest has an unexpected layout; rebuilding")
+            
+            output_df = build_digest(input_file, output_file, milestones, metrics=metrics, formats=args.formats,
+                                     history_db=args.history_db, compact=args.compact)
+            projection = None
+            if args.project:
+                projection = build_projection(output_df, output_file, milestones=milestones, metrics=metrics,
+                                              formats=args.formats, **projection_options(args))
         
         print(f"Output written to '{output_file}'")
         
@@ -262,11 +528,17 @@ def main():
         print(f"Latest crypto %: {output_df['cryptoPct'].iloc[-1]:.1%}")
         print(f"Max drawdown: {output_df['max_drawdown_to_date'].min():.1%}")
         print(f"Milestones hit: {output_df['milestone_flag'].sum()}")
+        if projection is not None:
+            horizon = projection[projection['level'] == 'band'].iloc[-1]
+            print(f"Projected NW in {args.project_years} years: ${horizon['totalNW_p50']:,.0f} median "
+                  f"(5th-95th percentile ${horizon['totalNW_p5']:,.0f} to ${horizon['totalNW_p95']:,.0f}), "
+                  f"${horizon['contributed']:,.0f} contributed")
         
         # Show recent records
         print("\n=== RECENT RECORDS ===")
         print(output_df.tail(3).to_string())
         
+        status = 'ok'
         return 0
         
     except Exception as e:
@@ -274,6 +546,10 @@ def main():
         import traceback
         traceback.print_exc()
         return 1
+    
+    finally:
+        metrics.write(sidecar_path(output_file, '.metrics.json'), status=status, input_file=input_file,
+                      compact=args.compact, project_paths=args.project)
 
 if __name__ == "__main__":
     sys.exit(main())
\ No newline at end of file
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Return Engine
+Money-weighted (XIRR) and time-weighted returns for many cash-flow series
+at once, e.g. every account and every digest period of a portfolio.
+
+xirr lays the series out as a zero-padded (series x flows) matrix and
+solves all of them together: each step is one safeguarded Newton update
+for every row, falling back to bisection of the row's bracket when a
+Newton step leaves it. The solver works in log growth, ln(1 + rate), so
+short windows with very large annualized rates stay finite.
+
+Time-weighted returns chain Modified Dietz sub-period returns; log prefix
+sums make the compounded return of any window O(1).
+"""
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+
+DAYS_PER_YEAR = 365.0
+
+# Largest |ln(1 + rate)| x years searched by xirr; keeps exp() finite
+MAX_LOG_GROWTH = 50.0
+
+# Points of the log growth grid scanned for sign changes of the NPV
+BRACKET_POINTS = 65
+
+# Convergence tolerance on ln(1 + rate) and the iteration cap of xirr
+XIRR_TOLERANCE = 1e-10
+XIRR_MAX_ITERATIONS = 100
+
+def flow_matrix(series, amounts, years, n_series):
+    """Lay ragged cash flows out as zero-padded (series x flows) amount and time matrices.
+    
+    ``series`` holds the row index (0..n_series-1) of every flow. Flows
+    keep their input order within a row; padding has zero amount, so it
+    does not change any row's net present value.
+    """
+    
+    series = np.asarray(series, dtype=int)
+    order = np.argsort(series, kind='stable')
+    series = series[order]
+    counts = np.bincount(series, minlength=n_series)
+    position = np.arange(len(series)) - np.repeat(np.cumsum(counts) - counts, counts)
+    
+    width = max(int(counts.max()) if len(counts) else 0, 1)
+    amount_matrix = np.zeros((n_series, width))
+    year_matrix = np.zeros((n_series, width))
+    amount_matrix[series, position] = np.asarray(amounts, dtype=float)[order]
+    year_matrix[series, position] = np.asarray(years, dtype=float)[order]
+    return amount_matrix, year_matrix
+
+def net_present_value(growth, amounts, years):
+    """NPV of every row at log growth ``growth`` and its derivative with respect to ``growth``."""
+    
+    discounted = amounts * np.exp(-growth[:, None] * years)
+    return discounted.sum(axis=1), -(discounted * years).sum(axis=1)
+
+def sign_changes(amounts, years):
+    """Number of sign changes of every row's flows in time order, skipping zero flows."""
+    
+    order = np.argsort(years, axis=1, kind='stable')
+    signs = np.sign(np.take_along_axis(amounts, order, axis=1))
+    
+    # Sign of the latest nonzero flow before each position
+    positions = np.where(signs != 0, np.arange(signs.shape[1]), 0)
+    latest = np.take_along_axis(signs, np.maximum.accumulate(positions, axis=1), axis=1)
+    previous = np.concatenate([np.zeros((len(signs), 1)), latest[:, :-1]], axis=1)
+    return (signs * previous < 0).sum(axis=1)
+
+def xirr(amounts, years, tolerance=XIRR_TOLERANCE, max_iterations=XIRR_MAX_ITERATIONS):
+    """Annualized internal rate of return of every row of a cash-flow matrix.
+    
+    ``amounts`` and ``years`` are (series x flows) matrices, e.g. from
+    flow_matrix: cash flows from the investor's side (contributions
+    negative; withdrawals and the ending value positive) and their times in
+    years from any common origin per row. Returns rates as fractions. When
+    flows change sign more than once the NPV can have several roots; the
+    one nearest a zero rate is returned. Rows without a sign change in
+    their NPV over the searched range (e.g. all flows of one sign) get NaN.
+    """
+    
+    amounts = np.atleast_2d(np.asarray(amounts, dtype=float))
+    years = np.atleast_2d(np.asarray(years, dtype=float))
+    
+    # Scale rows so the tolerance does not depend on the size of the flows
+    scale = np.abs(amounts).max(axis=1, keepdims=True)
+    amounts = np.divide(amounts, scale, out=np.zeros_like(amounts), where=scale > 0)
+    
+    # Search ln(1 + rate) up to the limit where exp() stays finite for every flow of the row
+    limit = MAX_LOG_GROWTH / np.maximum(np.abs(years).max(axis=1), 1 / DAYS_PER_YEAR)
+    low, high = -limit, limit.copy()
+    f_low, _ = net_present_value(low, amounts, years)
+    f_high, _ = net_present_value(high, amounts, years)
+    solvable = np.sign(f_low) * np.sign(f_high) < 0
+    
+    # Flows changing sign once have a single root (Descartes' rule of signs). Other rows
+    # are scanned on a grid densest around zero growth for the sign change nearest zero.
+    multiple = np.flatnonzero(sign_changes(amounts, years) > 1)
+    if len(multiple):
+        grid = np.linspace(-1, 1, BRACKET_POINTS)[:, None] ** 3 * limit[multiple]
+        values = np.array([net_present_value(point, amounts[multiple], years[multiple])[0] for point in grid])
+        changes = np.sign(values[:-1]) * np.sign(values[1:]) <= 0
+        distance = np.where(changes, np.minimum(np.abs(grid[:-1]), np.abs(grid[1:])), np.inf)
+        interval = distance.argmin(axis=0)
+        columns = np.arange(len(multiple))
+        solvable[multiple] = np.isfinite(distance[interval, columns]) & (np.abs(values).max(axis=0) > 0)
+        low[multiple], high[multiple] = grid[interval, columns], grid[interval + 1, columns]
+        f_low[multiple] = values[interval, columns]
+    
+    growth = np.clip(np.full(len(amounts), np.log1p(0.1)), low, high)
+    active = solvable.copy()
+    for _ in range(max_iterations):
+        if not active.any():
+            break
+        
+        rows = np.flatnonzero(active)
+        f, slope = net_present_value(growth[rows], amounts[rows], years[rows])
+        
+        # Keep the root bracketed: replace the bound whose NPV has the same sign
+        same_as_low = np.sign(f) == np.sign(f_low[rows])
+        low[rows] = np.where(same_as_low, growth[rows], low[rows])
+        f_low[rows] = np.where(same_as_low, f, f_low[rows])
+        high[rows] = np.where(same_as_low, high[rows], growth[rows])
+        
+        # Newton step, or bisection when the step leaves the bracket
+        with np.errstate(divide='ignore', invalid='ignore'):
+            step = growth[rows] - f / slope
+        outside = ~np.isfinite(step) | (step < low[rows]) | (step > high[rows])
+        step = np.where(outside, (low[rows] + high[rows]) / 2, step)
+        step = np.where(f == 0, growth[rows], step)
+        
+        converged = np.abs(step - growth[rows]) < tolerance
+        growth[rows] = step
+        active[rows[converged]] = False
+    
+    with np.errstate(over='ignore'):
+        return np.where(solvable, np.expm1(growth), np.nan)
+
+def modified_dietz(nav_start, nav_end, flows, weighted_flows):
+    """Modified Dietz return of each sub-period (fractions).
+    
+    ``flows`` is the net external flow of the sub-period (deposits
+    positive) and ``weighted_flows`` the same flows weighted by the share
+    of the sub-period left after each one. Sub-periods without invested
+    capital return 0.
+    """
+    
+    capital = np.asarray(nav_start, dtype=float) + weighted_flows
+    with np.errstate(divide='ignore', invalid='ignore'):
+        returns = (np.asarray(nav_end, dtype=float) - nav_start - flows) / capital
+    return np.where(capital > 0, returns, 0.0)
+
+def chained_returns(returns, starts, ends):
+    """Compounded return of ``returns[..., starts[i]:ends[i]]`` for every window, along the last axis."""
+    
+    logs = np.log1p(np.asarray(returns, dtype=float))
+    sums = np.concatenate([np.zeros(logs.shape[:-1] + (1,)), np.cumsum(logs, axis=-1)], axis=-1)
+    return np.expm1(sums[..., ends] - sums[..., starts])
@@ -0,0 +1,209 @@
+#!/usr/bin/env python3
+"""
+Windowed Risk Engine
+Risk metrics (annualized stdev, Sharpe, Sortino, alpha/beta vs. a benchmark,
+max drawdown) for many windows of one monthly return series at once.
+
+Sums of returns, squares and cross products are turned into prefix sums in
+a single pass, so the mean, variance and regression of any window cost
+O(1) and every trailing period and rolling window is computed together.
+Drawdowns depend on the path within a window: the paths of all windows are
+stacked into one matrix and their running peaks taken along it.
+
+matrix_metrics applies the same metrics to a whole (series x months)
+matrix with array operations along the month axis, for books of many
+instruments.
+"""
+
+from fast_startup import lazy_import
+
+lazy_import('numpy', 'np', globals())
+
+MONTHS_PER_YEAR = 12
+
+# Annual risk-free rate used for Sharpe and Sortino
+RISK_FREE_RATE = 0.03
+
+# Windows shorter than this get no risk metrics
+MIN_WINDOW_MONTHS = 3
+
+# Downside deviations below this are treated as zero (no Sortino ratio)
+MIN_DOWNSIDE_STDEV = 1e-9
+
+# Rolling window lengths, in months, for the rolling risk series
+ROLLING_WINDOWS = [12, 36]
+
+def prefix_sums(values):
+    """Prefix sums with a leading zero, so sum(values[s:e]) == p[e] - p[s]."""
+    
+    return np.concatenate([[0.0], np.cumsum(values, dtype=float)])
+
+def window_metrics(portfolio, benchmark, starts, ends, risk_free_rate=RISK_FREE_RATE):
+    """Risk metrics for the windows ``[starts[i], ends[i])`` of two monthly return arrays.
+    
+    Returns are fractions (0.01 == 1%). Returns a dict of arrays, one value
+    per window: annualized stdev, Sharpe, Sortino, beta and annualized
+    alpha (least squares of portfolio on benchmark), and the compounded
+    window return of both series. Windows shorter than MIN_WINDOW_MONTHS
+    get NaN risk metrics.
+    """
+    
+    y = np.asarray(portfolio, dtype=float)
+    x = np.asarray(benchmark, dtype=float)
+    starts = np.asarray(starts, dtype=int)
+    ends = np.asarray(ends, dtype=int)
+    count = (ends - starts).astype(float)
+    
+    def window_sum(values):
+        sums = prefix_sums(values)
+        return sums[ends] - sums[starts]
+    
+    # Centre both series so the sums of squares do not cancel catastrophically
+    y_shift = y.mean() if len(y) else 0.0
+    x_shift = x.mean() if len(x) else 0.0
+    yc = y - y_shift
+    xc = x - x_shift
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_yc = window_sum(yc) / count
+        mean_xc = window_sum(xc) / count
+        var_y = np.maximum(window_sum(yc * yc) / count - mean_yc ** 2, 0)
+        var_x = np.maximum(window_sum(xc * xc) / count - mean_xc ** 2, 0)
+        cov_xy = window_sum(xc * yc) / count - mean_xc * mean_yc
+        mean_y = mean_yc + y_shift
+        mean_x = mean_xc + x_shift
+        
+        stdev = np.sqrt(var_y * MONTHS_PER_YEAR)
+        excess = mean_y * MONTHS_PER_YEAR - risk_free_rate
+        sharpe = np.where(stdev > 0, excess / stdev, np.nan)
+        
+        # Sortino: dispersion of the months below the monthly risk-free rate
+        downside = y < risk_free_rate / MONTHS_PER_YEAR
+        down_count = window_sum(downside)
+        down_mean = window_sum(np.where(downside, y, 0)) / down_count
+        down_var = np.maximum(window_sum(np.where(downside, y * y, 0)) / down_count - down_mean ** 2, 0)
+        downside_std = np.sqrt(down_var * MONTHS_PER_YEAR)
+        sortino = np.where((down_count >= 2) & (downside_std > MIN_DOWNSIDE_STDEV), excess / downside_std, np.nan)
+        
+        beta = np.where(var_x > 0, cov_xy / var_x, np.nan)
+        alpha = (mean_y - beta * mean_x) * MONTHS_PER_YEAR
+        
+        # Compounded returns over each window
+        portfolio_return = np.expm1(window_sum(np.log1p(y)))
+        benchmark_return = np.expm1(window_sum(np.log1p(x)))
+    
+    too_short = count < MIN_WINDOW_MONTHS
+    metrics = {
+        'stdev': stdev,
+        'sharpe': sharpe,
+        'sortino': sortino,
+        'beta': beta,
+        'alpha': alpha,
+    }
+    for key, values in metrics.items():
+        metrics[key] = np.where(too_short, np.nan, values)
+    
+    metrics['portfolio_return'] = portfolio_return
+    metrics['benchmark_return'] = benchmark_return
+    return metrics
+
+def window_max_drawdown(portfolio, starts, ends):
+    """Max drawdown (a negative fraction) within each window, measured from the window's starting value.
+    
+    Every window's wealth path is laid out as one row of a (windows x
+    longest window) matrix, shorter paths padded with their last value,
+    which moves neither the running peak nor the drawdown.
+    """
+    
+    wealth = np.concatenate([[1.0], np.cumprod(1 + np.asarray(portfolio, dtype=float))])
+    starts = np.asarray(starts, dtype=int)
+    ends = np.asarray(ends, dtype=int)
+    if len(starts) == 0:
+        return np.array([])
+    
+    offsets = np.arange(int((ends - starts).max()) + 1)
+    paths = wealth[np.minimum(starts[:, None] + offsets, ends[:, None])]
+    drawdowns = (paths / np.maximum.accumulate(paths, axis=1) - 1).min(axis=1)
+    return np.where(ends - starts < MIN_WINDOW_MONTHS, np.nan, drawdowns)
+
+def rolling_max_drawdown(portfolio, window):
+    """Max drawdown of every ``window``-month window, ordered by window end."""
+    
+    wealth = np.concatenate([[1.0], np.cumprod(1 + np.asarray(portfolio, dtype=float))])
+    if len(wealth) <= window:
+        return np.array([])
+    
+    paths = np.lib.stride_tricks.sliding_window_view(wealth, window + 1)
+    return (paths / np.maximum.accumulate(paths, axis=1) - 1).min(axis=1)
+
+def trailing_windows(n_months, lengths):
+    """Start/end indices of windows ending at the latest month; None or too-long lengths cover all history.
+    
+    Returns (starts, ends, complete) where ``complete`` is False for windows
+    longer than the available history.
+    """
+    
+    lengths = np.array([n_months if length is None else length for length in lengths])
+    complete = lengths <= n_months
+    starts = np.maximum(n_months - lengths, 0)
+    ends = np.full(len(lengths), n_months)
+    return starts, ends, complete
+
+def rolling_windows(n_months, window):
+    """Start/end indices of every full ``window``-month window, ordered by window end."""
+    
+    ends = np.arange(window, n_months + 1)
+    return ends - window, ends
+
+def matrix_metrics(returns, benchmark, risk_free_rate=RISK_FREE_RATE):
+    """Full-period risk metrics for every row of a (series x months) return matrix at once.
+    
+    ``returns`` holds monthly fractions with NaN for months a series was not
+    held; ``benchmark`` is the matching monthly benchmark row. Returns a dict
+    of per-row arrays: months held, compounded return, annualized stdev,
+    Sharpe, beta and annualized alpha over the held months, and max
+    drawdown. Rows held for fewer than MIN_WINDOW_MONTHS get NaN risk
+    metrics.
+    """
+    
+    y = np.atleast_2d(np.asarray(returns, dtype=float))
+    x = np.broadcast_to(np.asarray(benchmark, dtype=float), y.shape)
+    held = ~np.isnan(y) & ~np.isnan(x)
+    count = held.sum(axis=1).astype(float)
+    
+    y0 = np.where(held, y, 0)
+    x0 = np.where(held, x, 0)
+    
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean_y = y0.sum(axis=1) / count
+        mean_x = x0.sum(axis=1) / count
+        y_dev = np.where(held, y - mean_y[:, None], 0)
+        x_dev = np.where(held, x - mean_x[:, None], 0)
+        var_y = (y_dev ** 2).sum(axis=1) / count
+        var_x = (x_dev ** 2).sum(axis=1) / count
+        cov_xy = (x_dev * y_dev).sum(axis=1) / count
+        
+        stdev = np.sqrt(var_y * MONTHS_PER_YEAR)
+        sharpe = np.where(stdev > 0, (mean_y * MONTHS_PER_YEAR - risk_free_rate) / stdev, np.nan)
+        beta = np.where(var_x > 0, cov_xy / var_x, np.nan)
+        alpha = (mean_y - beta * mean_x) * MONTHS_PER_YEAR
+    
+    # Months not held leave the value unchanged
+    wealth = np.cumprod(1 + np.where(np.isnan(y), 0, y), axis=1)
+    wealth = np.concatenate([np.ones((len(wealth), 1)), wealth], axis=1)
+    max_drawdown = (wealth / np.maximum.accumulate(wealth, axis=1) - 1).min(axis=1)
+    
+    too_short = count < MIN_WINDOW_MONTHS
+    metrics = {
+        'stdev': stdev,
+        'sharpe': sharpe,
+        'beta': beta,
+        'alpha': alpha,
+        'max_drawdown': max_drawdown,
+    }
+    for key, values in metrics.items():
+        metrics[key] = np.where(too_short, np.nan, values)
+    
+    metrics['months'] = count.astype(int)
+    metrics['return'] = wealth[:, -1] - 1
+    return metrics
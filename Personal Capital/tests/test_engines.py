@@ -0,0 +1,173 @@
+"""
+Known-answer checks of the numeric engines behind the digests: XIRR and
+Modified Dietz returns, the prefix-sum window metrics, the FX rate table
+and the incremental Net Worth update.
+"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import bench_digests
+import process_net_worth
+from fx_rates import MAX_BACKFILL_DAYS, RateTable, rate_frame
+from return_engine import chained_returns, flow_matrix, modified_dietz, xirr
+from risk_windows import (MIN_WINDOW_MONTHS, MONTHS_PER_YEAR, RISK_FREE_RATE, rolling_max_drawdown,
+                          rolling_windows, trailing_windows, window_max_drawdown, window_metrics)
+
+def test_xirr_single_period():
+    """1000 invested for one year returning 1100 is a 10% rate."""
+    
+    assert xirr([[-1000, 1100]], [[0, 1]])[0] == pytest.approx(0.10, abs=1e-9)
+
+def test_xirr_zeroes_the_npv():
+    """The rate found discounts the flows to a zero net present value."""
+    
+    amounts = np.array([-1000.0, -500.0, 200.0, 1600.0])
+    years = np.array([0.0, 0.25, 0.6, 1.5])
+    rate = xirr([amounts], [years])[0]
+    assert np.sum(amounts / (1 + rate) ** years) == pytest.approx(0, abs=1e-6)
+
+def test_xirr_rows_of_a_flow_matrix():
+    """Ragged flows laid out by flow_matrix solve row by row; one-signed rows get NaN."""
+    
+    amounts, years = flow_matrix([0, 1, 0, 1, 2], [-100, -100, 121, 90, 50], [0, 0, 2, 1, 1], 3)
+    rates = xirr(amounts, years)
+    assert rates[0] == pytest.approx(0.10, abs=1e-9)
+    assert rates[1] == pytest.approx(-0.10, abs=1e-9)
+    assert np.isnan(rates[2])
+
+def test_modified_dietz():
+    """A mid-period deposit counts for half the capital."""
+    
+    returns = modified_dietz([1000.0, 0.0], [1150.0, 0.0], np.array([100.0, 0.0]), np.array([50.0, 0.0]))
+    assert returns[0] == pytest.approx(50 / 1050)
+    assert returns[1] == 0.0
+
+def test_chained_returns():
+    """Window returns compound the monthly returns inside each window."""
+    
+    returns = np.array([0.1, -0.05, 0.02, 0.03])
+    chained = chained_returns(returns, np.array([0, 1]), np.array([4, 3]))
+    assert chained[0] == pytest.approx(np.prod(1 + returns) - 1)
+    assert chained[1] == pytest.approx(0.95 * 1.02 - 1)
+
+def naive_window(portfolio, benchmark):
+    """Risk metrics of one window computed directly from its slice."""
+    
+    stdev = portfolio.std() * np.sqrt(MONTHS_PER_YEAR)
+    beta = np.cov(portfolio, benchmark, bias=True)[0, 1] / benchmark.var()
+    path = np.concatenate([[1.0], np.cumprod(1 + portfolio)])
+    return {
+        'stdev': stdev,
+        'sharpe': (portfolio.mean() * MONTHS_PER_YEAR - RISK_FREE_RATE) / stdev,
+        'beta': beta,
+        'alpha': (portfolio.mean() - beta * benchmark.mean()) * MONTHS_PER_YEAR,
+        'portfolio_return': np.prod(1 + portfolio) - 1,
+        'max_drawdown': (path / np.maximum.accumulate(path) - 1).min(),
+    }
+
+def test_window_metrics_match_per_window_computation():
+    """Prefix-sum metrics of every trailing and rolling window equal a direct computation on its slice."""
+    
+    rng = np.random.default_rng(0)
+    portfolio = rng.normal(0.008, 0.04, 60)
+    benchmark = 0.6 * portfolio + rng.normal(0.005, 0.02, 60)
+    
+    starts, ends, _ = trailing_windows(60, [1, 3, 12, 36, None, 120])
+    rolling_starts, rolling_ends = rolling_windows(60, 12)
+    starts = np.concatenate([starts, rolling_starts])
+    ends = np.concatenate([ends, rolling_ends])
+    
+    metrics = window_metrics(portfolio, benchmark, starts, ends)
+    metrics['max_drawdown'] = window_max_drawdown(portfolio, starts, ends)
+    
+    for i, (start, end) in enumerate(zip(starts, ends)):
+        if end - start < MIN_WINDOW_MONTHS:
+            assert np.isnan(metrics['stdev'][i]) and np.isnan(metrics['max_drawdown'][i])
+            continue
+        expected = naive_window(portfolio[start:end], benchmark[start:end])
+        for key, value in expected.items():
+            assert metrics[key][i] == pytest.approx(value, rel=1e-9, abs=1e-12), (key, start, end)
+
+def test_rolling_max_drawdown_matches_window_max_drawdown():
+    """Both drawdown paths agree on full rolling windows."""
+    
+    portfolio = np.random.default_rng(1).normal(0.005, 0.05, 48)
+    starts, ends = rolling_windows(48, 12)
+    np.testing.assert_allclose(rolling_max_drawdown(portfolio, 12), window_max_drawdown(portfolio, starts, ends))
+
+def usd_table():
+    """USD rates on the first of January and of March 2024."""
+    
+    return RateTable(rate_frame(['2024-01-01', '2024-03-01'], ['USD', 'USD'], [1.30, 1.40]))
+
+def test_rate_table_as_of_lookup():
+    """Each date takes the latest rate on or before it; the base currency is 1."""
+    
+    rates = usd_table().lookup(pd.to_datetime(['2024-01-01', '2024-02-15', '2024-03-01', '2024-06-30', '2024-02-15']),
+                               ['USD', 'USD', 'USD', 'USD', 'CAD'])
+    np.testing.assert_allclose(rates, [1.30, 1.30, 1.40, 1.40, 1.0])
+
+def test_rate_table_backfill(capsys):
+    """Dates before the first rate take it; only dates well before it warn, once per currency."""
+    
+    table = usd_table()
+    near = pd.Timestamp('2024-01-01') - pd.Timedelta(days=MAX_BACKFILL_DAYS)
+    assert table.lookup([near], ['USD'])[0] == pytest.approx(1.30)
+    assert capsys.readouterr().out == ''
+    
+    rates = table.lookup(pd.to_datetime(['2023-06-30', '2023-05-31']), ['USD', 'USD'])
+    np.testing.assert_allclose(rates, [1.30, 1.30])
+    assert capsys.readouterr().out.count('Warning: USD') == 1
+
+def test_rate_table_unknown_currency():
+    """Converting a currency without any rate raises ValueError naming it."""
+    
+    df = pd.DataFrame({'Date': pd.to_datetime(['2024-02-01']), 'currency': ['EUR'], 'value': [10.0]})
+    with pytest.raises(ValueError, match='EUR'):
+        usd_table().to_base(df, ['value'])
+
+@pytest.fixture
+def net_worth_sheet(tmp_path):
+    """A synthetic three-year Net Worth export."""
+    
+    path = tmp_path / 'Net Worth.csv'
+    bench_digests.generate_net_worth_csv(path, years=3, accounts=12, seed=3)
+    return path
+
+def digest_rows(path):
+    """Digest rows without the generated timestamp comment."""
+    
+    return path.read_text().splitlines()[1:]
+
+@pytest.mark.parametrize('compact', [False, True])
+def test_incremental_update_matches_full_rebuild(net_worth_sheet, tmp_path, capsys, compact):
+    """Appending the missing months to a truncated digest gives the full digest."""
+    
+    full = tmp_path / 'full.csv'
+    process_net_worth.build_digest(net_worth_sheet, full)
+    
+    partial = tmp_path / 'partial.csv'
+    lines = full.read_text().splitlines(True)
+    partial.write_text(''.join(lines[:-4]))
+    
+    written = process_net_worth.update_digest_incremental(net_worth_sheet, partial, compact=compact)
+    assert written == 4
+    assert digest_rows(partial) == digest_rows(full)
+    
+    # A second run finds nothing new
+    assert process_net_worth.update_digest_incremental(net_worth_sheet, partial, compact=compact) == 0
+
+def test_incremental_update_rewrites_changed_months(net_worth_sheet, tmp_path, capsys):
+    """A rechecked month whose values changed is rewritten along with every later month."""
+    
+    full = tmp_path / 'full.csv'
+    expected = process_net_worth.build_digest(net_worth_sheet, full)
+    
+    stale = expected.copy()
+    stale.loc[stale.index[-1], 'cashVal'] += 100
+    process_net_worth.write_digest(stale, tmp_path / 'stale.csv')
+    
+    assert process_net_worth.update_digest_incremental(net_worth_sheet, tmp_path / 'stale.csv') == 1
+    assert digest_rows(tmp_path / 'stale.csv') == digest_rows(full)